@@ -13,20 +13,142 @@ class Settings(BaseSettings):
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
+    # Воркеры serve.py: прогрев один раз в главном процессе, затем fork
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    WORKER_GRACEFUL_TIMEOUT: float = float(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
     
     # База данных
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./it_support.db")
+    # Отдельная база для чтения аналитики (реплика); по умолчанию DATABASE_URL
+    DATABASE_READ_URL: str = os.getenv("DATABASE_READ_URL", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
     
     # OpenAI API
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL") or None
+    
+    # Пул соединений и ограничение параллельности запросов к LLM
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "20"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "1"))
+    
+    # Несколько OpenAI-совместимых бэкендов: "имя|base_url|модель[|переменная с ключом],..."
+    # Если не задано - один бэкенд из OPENAI_API_KEY, OPENAI_BASE_URL и OPENAI_MODEL
+    LLM_BACKENDS: str = os.getenv("LLM_BACKENDS", "")
+    LLM_EWMA_ALPHA: float = float(os.getenv("LLM_EWMA_ALPHA", "0.2"))
+    LLM_BREAKER_FAILURES: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_RESET_SECONDS: float = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    # Повторный запрос к второму бэкенду, если первый не ответил за p95 своей задержки
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "False").lower() == "true"
+    LLM_HEDGE_MIN_DELAY_MS: int = int(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "500"))
+    
+    # Объединение одновременных одинаковых запросов к LLM (single flight)
+    LLM_COALESCE_ENABLED: bool = os.getenv("LLM_COALESCE_ENABLED", "True").lower() == "true"
+    LLM_COALESCE_WINDOW_MS: int = int(os.getenv("LLM_COALESCE_WINDOW_MS", "500"))
+    
+    # Ответ на типовые вопросы из базы знаний без LLM при уверенной классификации
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "True").lower() == "true"
+    FAST_PATH_CONFIDENCE: float = float(os.getenv("FAST_PATH_CONFIDENCE", "0.8"))
+    FAST_PATH_POLISH_FOLLOWUPS: bool = os.getenv("FAST_PATH_POLISH_FOLLOWUPS", "True").lower() == "true"
+    
+    # Полнотекстовый поиск по диалогам (SQLite FTS5, PostgreSQL GIN): индекс обновляет СУБД
+    SEARCH_ENABLED: bool = os.getenv("SEARCH_ENABLED", "True").lower() == "true"
+    # Сколько самых новых совпадений ранжируется при order=relevance
+    SEARCH_MAX_CANDIDATES: int = int(os.getenv("SEARCH_MAX_CANDIDATES", "20000"))
+    
+    # Кэш ответов на типовые вопросы
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+    RESPONSE_CACHE_SIMILARITY: float = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.8"))
+    RESPONSE_CACHE_PATH: str = os.getenv("RESPONSE_CACHE_PATH", "")
+    
+    # База знаний: каталог статей и поиск по фрагментам
+    KNOWLEDGE_BASE_DIR: str = os.getenv("KNOWLEDGE_BASE_DIR", "knowledge_base")
+    KNOWLEDGE_BASE_INDEX_PATH: str = os.getenv("KNOWLEDGE_BASE_INDEX_PATH", "")
+    KNOWLEDGE_BASE_TOP_K: int = int(os.getenv("KNOWLEDGE_BASE_TOP_K", "3"))
+    KNOWLEDGE_BASE_PASSAGE_CHARS: int = int(os.getenv("KNOWLEDGE_BASE_PASSAGE_CHARS", "600"))
+    KNOWLEDGE_BASE_RELOAD_INTERVAL: float = float(os.getenv("KNOWLEDGE_BASE_RELOAD_INTERVAL", "5"))
     
     # Безопасность
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     
+    # Фоновая пакетная запись диалогов
+    WRITE_BATCH_SIZE: int = int(os.getenv("WRITE_BATCH_SIZE", "200"))
+    WRITE_FLUSH_INTERVAL_MS: int = int(os.getenv("WRITE_FLUSH_INTERVAL_MS", "50"))
+    WRITE_QUEUE_SIZE: int = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+    WRITE_DURABILITY: str = os.getenv("WRITE_DURABILITY", "async")  # async или sync
+    # Повторы записи пачки при ошибке (например, "database is locked") с удвоением паузы
+    WRITE_MAX_RETRIES: int = int(os.getenv("WRITE_MAX_RETRIES", "3"))
+    WRITE_RETRY_BACKOFF_MS: int = int(os.getenv("WRITE_RETRY_BACKOFF_MS", "100"))
+    
+    # Метрики Prometheus (/metrics); при нескольких воркерах uvicorn - общий каталог снимков
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    METRICS_MULTIPROC_DIR: str = os.getenv("METRICS_MULTIPROC_DIR", "")
+    METRICS_FLUSH_INTERVAL: float = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+    
+    # Контроль приема запросов к чату: корзины токенов на пользователя (запросов
+    # в секунду и запас) и общая (0 - без общего лимита); при заполнении очереди
+    # записи на ADMISSION_SHED_QUEUE_RATIO запросы отклоняются с 429.
+    # ADMISSION_STORE_PATH - общий файл SQLite с корзинами для нескольких воркеров;
+    # дольше ADMISSION_STORE_TIMEOUT_MS его блокировка не ждется - запрос пропускается
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+    ADMISSION_USER_RATE: float = float(os.getenv("ADMISSION_USER_RATE", "1"))
+    ADMISSION_USER_BURST: int = int(os.getenv("ADMISSION_USER_BURST", "20"))
+    ADMISSION_GLOBAL_RATE: float = float(os.getenv("ADMISSION_GLOBAL_RATE", "0"))
+    ADMISSION_GLOBAL_BURST: int = int(os.getenv("ADMISSION_GLOBAL_BURST", "100"))
+    ADMISSION_SHED_QUEUE_RATIO: float = float(os.getenv("ADMISSION_SHED_QUEUE_RATIO", "0.9"))
+    ADMISSION_MAX_RETRY_AFTER: int = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "10"))
+    ADMISSION_MAX_USERS: int = int(os.getenv("ADMISSION_MAX_USERS", "100000"))
+    ADMISSION_STORE_PATH: str = os.getenv("ADMISSION_STORE_PATH", "")
+    ADMISSION_STORE_TIMEOUT_MS: int = int(os.getenv("ADMISSION_STORE_TIMEOUT_MS", "5"))
+    
+    # Пакетная загрузка обращений (/api/ingest): обработчики с запросом к LLM,
+    # размер пачки записи и аренда задания (после нее задание продолжит другой процесс)
+    INGEST_CONCURRENCY: int = int(os.getenv("INGEST_CONCURRENCY", "4"))
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+    INGEST_FLUSH_INTERVAL_MS: int = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "200"))
+    INGEST_MAX_ITEMS: int = int(os.getenv("INGEST_MAX_ITEMS", "100000"))
+    INGEST_LEASE_SECONDS: int = int(os.getenv("INGEST_LEASE_SECONDS", "30"))
+    
+    # Архив старых диалогов: дни в таблице conversations (0 - фоновый перенос выключен)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+    ARCHIVE_INTERVAL_SECONDS: int = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+    
+    # Кластеризация популярных вопросов: cluster_questions.py или фоновая задача раз в
+    # QUESTION_CLUSTERS_INTERVAL_SECONDS (0 - только скриптом). Состояние между запусками
+    # хранится в QUESTION_CLUSTERS_STATE_PATH, обрабатываются только новые диалоги
+    QUESTION_CLUSTERS_STATE_PATH: str = os.getenv("QUESTION_CLUSTERS_STATE_PATH", "question_clusters.npz")
+    QUESTION_CLUSTERS_INTERVAL_SECONDS: int = int(os.getenv("QUESTION_CLUSTERS_INTERVAL_SECONDS", "0"))
+    QUESTION_CLUSTERS_SIMILARITY: float = float(os.getenv("QUESTION_CLUSTERS_SIMILARITY", "0.5"))
+    QUESTION_CLUSTERS_MAX: int = int(os.getenv("QUESTION_CLUSTERS_MAX", "2000"))
+    QUESTION_CLUSTERS_CHUNK_SIZE: int = int(os.getenv("QUESTION_CLUSTERS_CHUNK_SIZE", "2000"))
+    QUESTION_CLUSTERS_TOP: int = int(os.getenv("QUESTION_CLUSTERS_TOP", "50"))
+    QUESTION_CLUSTERS_SUGGEST_MIN_SIZE: int = int(os.getenv("QUESTION_CLUSTERS_SUGGEST_MIN_SIZE", "20"))
+    
+    # Снимок статистики для /analytics и /api/stats: пересчет в фоне раз в
+    # STATS_REFRESH_SECONDS, снимок старше STATS_MAX_STALE_SECONDS не отдается
+    STATS_REFRESH_SECONDS: float = float(os.getenv("STATS_REFRESH_SECONDS", "10"))
+    STATS_MAX_STALE_SECONDS: float = float(os.getenv("STATS_MAX_STALE_SECONDS", "60"))
+    
+    # Пороги SLA по полному времени ответа, мс (через запятую)
+    SLA_TARGETS_MS: str = os.getenv("SLA_TARGETS_MS", "1000,3000,10000")
+    
     # Настройки чат-бота
-    MAX_CONVERSATION_HISTORY: int = 10
-    DEFAULT_RESPONSE_TIMEOUT: int = 30
+    MAX_CONVERSATION_HISTORY: int = int(os.getenv("MAX_CONVERSATION_HISTORY", "10"))
+    HISTORY_MAX_USERS: int = int(os.getenv("HISTORY_MAX_USERS", "10000"))
+    HISTORY_MEMORY_BUDGET_MB: int = int(os.getenv("HISTORY_MEMORY_BUDGET_MB", "64"))
+    HISTORY_MAX_TOKENS: int = int(os.getenv("HISTORY_MAX_TOKENS", "1500"))
+    HISTORY_MAX_AGE_SECONDS: int = int(os.getenv("HISTORY_MAX_AGE_SECONDS", "3600"))
+    DEFAULT_RESPONSE_TIMEOUT: int = int(os.getenv("DEFAULT_RESPONSE_TIMEOUT", "30"))
     
     class Config:
         env_file = ".env"
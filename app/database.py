@@ -1,37 +1,224 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime, Text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from contextlib import contextmanager
 from datetime import datetime
 import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
 
 from app.config import settings
+from app.services.metrics import db_session_checkout_seconds
+
+# Асинхронные драйверы для синхронных URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    """URL базы с асинхронным драйвером (aiosqlite, asyncpg)"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False) if driver else url
+
+def is_sqlite_memory(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+def engine_options(url: str, asynchronous: bool = False) -> dict:
+    """Параметры движка: check_same_thread для SQLite и настройки пула"""
+    options = {}
+    sqlite = make_url(url).get_backend_name() == "sqlite"
+    if sqlite:
+        options["connect_args"] = {"check_same_thread": False}
+    if not is_sqlite_memory(url):
+        if sqlite and asynchronous:
+            # aiosqlite по умолчанию открывает соединение на каждый запрос (NullPool)
+            options["poolclass"] = AsyncAdaptedQueuePool
+        # У SQLite в памяти своя база на каждое соединение - пул не настраиваем
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_pre_ping=True
+        )
+    return options
+
+def configure_connections(sync_engine: Engine, read_only: bool = False):
+    """Настройки каждого нового соединения
+    
+    SQLite: журнал WAL (читатели не ждут писателя), synchronous из
+    SQLITE_SYNCHRONOUS и busy_timeout вместо немедленной ошибки
+    "database is locked". Для read_only соединений запись запрещается
+    (query_only в SQLite, READ ONLY транзакции в PostgreSQL).
+    """
+    backend = sync_engine.dialect.name
+    memory = is_sqlite_memory(str(sync_engine.url))
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if backend == "sqlite":
+                if not memory:
+                    cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+                cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT_MS)}")
+                if read_only:
+                    cursor.execute("PRAGMA query_only=ON")
+            elif backend == "postgresql" and read_only:
+                cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        finally:
+            cursor.close()
+
+def create_engines(url: str, read_url: str = ""):
+    """Движки приложения: синхронный (фоновая запись, скрипты), асинхронный
+    и асинхронный только для чтения (аналитика) со своим пулом"""
+    sync_engine = create_engine(url, **engine_options(url))
+    configure_connections(sync_engine)
 
-# Создаем движок базы данных
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+    async_engine = create_async_engine(to_async_url(url), **engine_options(url, asynchronous=True))
+    configure_connections(async_engine.sync_engine)
 
-# Создаем фабрику сессий
+    read_url = read_url or url
+    read_engine = create_async_engine(to_async_url(read_url), **engine_options(read_url, asynchronous=True))
+    configure_connections(read_engine.sync_engine, read_only=True)
+    return sync_engine, async_engine, read_engine
+
+# Создаем движки базы данных
+engine, async_engine, read_engine = create_engines(settings.DATABASE_URL, settings.DATABASE_READ_URL)
+
+# Создаем фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
 
 # Базовый класс для моделей
 Base = declarative_base()
 
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 def get_db() -> Generator:
     """Получение сессии базы данных"""
     db = SessionLocal()
     try:
+        checkout_session(db)
         yield db
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Получение асинхронной сессии базы данных"""
+    async with AsyncSessionLocal() as db:
+        await checkout_async_session(db)
+        yield db
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Получение асинхронной сессии только для чтения (аналитика)
+    
+    Синхронный код сервисов выполняется через await db.run_sync(...):
+    запросы уходят через асинхронный драйвер и не блокируют event loop.
+    """
+    async with ReadSessionLocal() as db:
+        await checkout_async_session(db)
+        yield db
+
+def checkout_session(db: Session):
+    """Получение соединения из пула для сессии с учетом времени ожидания"""
+    started = time.perf_counter()
+    db.connection()
+    db_session_checkout_seconds.observe(time.perf_counter() - started)
+
+async def checkout_async_session(db: AsyncSession):
+    """Получение соединения из пула для асинхронной сессии с учетом времени ожидания"""
+    started = time.perf_counter()
+    await db.connection()
+    db_session_checkout_seconds.observe(time.perf_counter() - started)
+
 def init_db():
     """Инициализация базы данных"""
     # Импортируем все модели, чтобы они были зарегистрированы в Base
-    from app.models import conversation
+    from app.models import conversation, ingest, statistics
     
-    # Создаем все таблицы
-    Base.metadata.create_all(bind=engine)
+    with schema_lock(engine):
+        # Создаем все таблицы
+        Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine)
+        add_missing_indexes(engine)
+        
+        if settings.SEARCH_ENABLED:
+            from app.services.search import install_search_index
+            # В существующей базе индекс создается и заполняется один раз
+            with engine.begin() as connection:
+                install_search_index(connection)
+
+# Ключ advisory lock PostgreSQL для создания схемы
+SCHEMA_LOCK_KEY = 0x17535550
+
+@contextmanager
+def schema_lock(bind: Engine):
+    """Блокировка на время создания и обновления схемы
+    
+    Воркеры uvicorn --workers вызывают init_db одновременно: без нее второй
+    процесс создает уже созданную таблицу или повторно заполняет индекс
+    поиска. SQLite - flock на файле рядом с базой, PostgreSQL - advisory lock.
+    """
+    backend = bind.dialect.name
+    if backend == "postgresql":
+        with bind.connect() as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+    elif backend == "sqlite" and not is_sqlite_memory(str(bind.url)) and fcntl is not None:
+        with open(f"{bind.url.database}.init.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+def add_missing_columns(bind):
+    """Добавление новых nullable-колонок и колонок со значением по умолчанию
+    в уже существующие таблицы (create_all их не добавляет)"""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or column.primary_key:
+                    continue
+                column_type = column.type.compile(dialect=bind.dialect)
+                default = ""
+                if column.default is not None and column.default.is_scalar:
+                    default = f" NOT NULL DEFAULT {column.default.arg!r}"
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}'
+                ))
+
+def add_missing_indexes(bind):
+    """Создание новых индексов в уже существующих таблицах"""
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
@@ -1,14 +1,33 @@
-from fastapi import FastAPI, Request, Form, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Form, Depends, Query, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 import uvicorn
+import asyncio
+import json
+import re
+import time
 from datetime import datetime
+from typing import Literal, Optional
 
-from app.database import get_db, init_db
+from app.database import async_engine, engine, get_read_db, init_db, read_engine, ReadSessionLocal, SessionLocal
 from app.services.chatbot_service import ChatbotService
 from app.services.analytics_service import AnalyticsService
+from app.services.archive import ConversationArchive, ConversationArchiver
+from app.services.statistics_store import StatisticsStore
+from app.services.conversation_writer import ConversationWriter
+from app.services.conversation_history import ConversationHistoryStore
+from app.services.latency import LatencyRecorder, StageTimer
+from app.services.admission import DEGRADE, AdmissionController, MemoryBucketStore, SQLiteBucketStore
+from app.services.ingest import IngestService, iter_ndjson
+from app.services.search import ConversationSearch, search_backend_for
+from app.services.stats_snapshot import StatsSnapshot, StatsSnapshotCache, etag_matches
+from app.services.workers import ScoreboardMiddleware, Warmup, WorkerScoreboard
+from app.services.metrics import (
+    MetricsMiddleware, http_request_duration_seconds, http_requests_total, metrics
+)
 from app.models.conversation import Conversation
 from app.config import settings
 
@@ -19,6 +38,13 @@ app = FastAPI(
     version="1.0.0"
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(
+        MetricsMiddleware,
+        requests_total=http_requests_total,
+        request_duration=http_request_duration_seconds
+    )
+
 # Подключение статических файлов и шаблонов
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -26,11 +52,285 @@ templates = Jinja2Templates(directory="templates")
 # Инициализация сервисов
 chatbot_service = ChatbotService()
 analytics_service = AnalyticsService()
+statistics_store = StatisticsStore()
+latency_recorder = LatencyRecorder()
+conversation_writer = ConversationWriter(
+    SessionLocal,
+    statistics_store,
+    batch_size=settings.WRITE_BATCH_SIZE,
+    flush_interval=settings.WRITE_FLUSH_INTERVAL_MS / 1000,
+    max_queue_size=settings.WRITE_QUEUE_SIZE,
+    durability=settings.WRITE_DURABILITY,
+    latency_recorder=latency_recorder,
+    max_retries=settings.WRITE_MAX_RETRIES,
+    retry_backoff=settings.WRITE_RETRY_BACKOFF_MS / 1000
+)
+conversation_history = ConversationHistoryStore(
+    SessionLocal,
+    max_turns=settings.MAX_CONVERSATION_HISTORY,
+    max_users=settings.HISTORY_MAX_USERS,
+    max_bytes=settings.HISTORY_MEMORY_BUDGET_MB * 2 ** 20,
+    max_tokens=settings.HISTORY_MAX_TOKENS,
+    max_age_seconds=settings.HISTORY_MAX_AGE_SECONDS
+)
+
+ingest_service = IngestService(
+    SessionLocal,
+    chatbot_service,
+    statistics_store,
+    concurrency=settings.INGEST_CONCURRENCY,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_MS / 1000,
+    max_items=settings.INGEST_MAX_ITEMS,
+    lease_seconds=settings.INGEST_LEASE_SECONDS
+)
+admission_controller = AdmissionController(
+    SQLiteBucketStore(settings.ADMISSION_STORE_PATH, busy_timeout=settings.ADMISSION_STORE_TIMEOUT_MS / 1000)
+    if settings.ADMISSION_STORE_PATH
+    else MemoryBucketStore(settings.ADMISSION_MAX_USERS),
+    user_rate=settings.ADMISSION_USER_RATE,
+    user_burst=settings.ADMISSION_USER_BURST,
+    global_rate=settings.ADMISSION_GLOBAL_RATE,
+    global_burst=settings.ADMISSION_GLOBAL_BURST,
+    llm_load=lambda: chatbot_service.llm_in_flight / settings.LLM_MAX_CONCURRENCY,
+    write_load=lambda: conversation_writer.get_stats()["queue_depth"] / settings.WRITE_QUEUE_SIZE,
+    shed_ratio=settings.ADMISSION_SHED_QUEUE_RATIO,
+    max_retry_after=settings.ADMISSION_MAX_RETRY_AFTER
+) if settings.ADMISSION_ENABLED else None
+conversation_archive = ConversationArchive(settings.ARCHIVE_DIR)
+search_backend = search_backend_for(read_engine.dialect.name) if settings.SEARCH_ENABLED else None
+conversation_search = ConversationSearch(
+    search_backend, max_candidates=settings.SEARCH_MAX_CANDIDATES
+) if search_backend is not None else None
+conversation_archiver = ConversationArchiver(
+    SessionLocal,
+    conversation_archive,
+    retention_days=settings.ARCHIVE_AFTER_DAYS
+)
+
+# Кластеризация вопросов (NumPy/SciPy) загружается, только если включена в фоне;
+# иначе ее запускают скриптом cluster_questions.py, а приложение читает готовую таблицу
+question_cluster_job = None
+if settings.QUESTION_CLUSTERS_INTERVAL_SECONDS > 0:
+    from app.services.question_clusters import QuestionClusterJob
+    question_cluster_job = QuestionClusterJob(
+        SessionLocal,
+        settings.QUESTION_CLUSTERS_STATE_PATH,
+        knowledge_base=chatbot_service.knowledge_base,
+        similarity=settings.QUESTION_CLUSTERS_SIMILARITY,
+        max_clusters=settings.QUESTION_CLUSTERS_MAX,
+        chunk_size=settings.QUESTION_CLUSTERS_CHUNK_SIZE,
+        top=settings.QUESTION_CLUSTERS_TOP,
+        suggest_min_size=settings.QUESTION_CLUSTERS_SUGGEST_MIN_SIZE
+    )
+
+# Глубина очередей и заполненность пулов вычисляются в момент сбора метрик
+metrics.gauge(
+    "chat_write_queue_depth", "Диалоги в очереди фоновой записи",
+    function=lambda: conversation_writer.get_stats()["queue_depth"]
+)
+metrics.counter(
+    "chat_write_failed_total", "Диалоги, не записанные после всех повторов",
+    function=lambda: conversation_writer.get_stats()["failed"]
+)
+metrics.counter(
+    "chat_write_dropped_total", "Диалоги, потерянные без уведомления клиента (WRITE_DURABILITY=async)",
+    function=lambda: conversation_writer.get_stats()["dropped"]
+)
+metrics.gauge(
+    "llm_requests_in_flight", "Запросы к LLM, занявшие слот LLM_MAX_CONCURRENCY",
+    function=lambda: chatbot_service.llm_in_flight
+)
+if chatbot_service.single_flight is not None:
+    metrics.counter(
+        "llm_coalesced_requests_total", "Запросы к LLM, объединенные с уже выполняющимся",
+        function=lambda: chatbot_service.single_flight.get_stats()["shared"]
+    )
+metrics.gauge(
+    "db_pool_checked_out", "Соединения, выданные из пула SQLAlchemy",
+    function=lambda: getattr(engine.pool, "checkedout", lambda: 0)()
+)
+metrics.gauge(
+    "latency_pending_deltas", "Дельты гистограмм времени, ожидающие записи",
+    function=lambda: len(latency_recorder)
+)
+metrics.gauge(
+    "history_users", "Пользователи в памяти истории диалогов",
+    function=lambda: conversation_history.get_stats()["users"]
+)
+
+# Прогрев процесса (/ready) и табло воркеров serve.py (None при обычном запуске)
+warmup = Warmup()
+scoreboard: Optional[WorkerScoreboard] = None
+
+# Шаблоны компилируются при прогреве, а не на первом запросе
+TEMPLATES = ("index.html", "analytics.html", "analytics_fragment.html")
+
+def warm_up():
+    """Схема БД, индекс базы знаний, классификатор и шаблоны до первого запроса"""
+    with warmup.stage("database"):
+        init_db()
+    # Индекс базы знаний строится при создании сервиса - берем время построения
+    warmup.record("knowledge_base", chatbot_service.knowledge_base.get_stats()["build_ms"])
+    with warmup.stage("classifier"):
+        # Напрямую, без счетчика категорий в метриках
+        message = "Не могу войти в почту, забыл пароль"
+        chatbot_service.find_passages(message, chatbot_service.classifier.classify(message).category)
+    with warmup.stage("templates"):
+        for name in TEMPLATES:
+            templates.get_template(name)
+
+def preload(board: Optional[WorkerScoreboard] = None):
+    """Прогрев в главном процессе serve.py до запуска воркеров
+    
+    Кроме warm_up считается первый снимок статистики. Соединения с БД
+    закрываются: после fork каждый воркер открывает свои.
+    """
+    global scoreboard
+    if board is not None:
+        scoreboard = board
+        app.add_middleware(ScoreboardMiddleware, scoreboard=board)
+    warm_up()
+
+    async def first_snapshot():
+        with warmup.stage("stats_snapshot"):
+            await stats_snapshot.refresh()
+        await async_engine.dispose()
+        await read_engine.dispose()
+
+    asyncio.run(first_snapshot())
+    engine.dispose()
+    warmup.preloaded = True
+
+def worker_load() -> dict:
+    """Нагрузка воркера для табло"""
+    return {
+        "llm_in_flight": chatbot_service.llm_in_flight,
+        "write_queue_depth": conversation_writer.get_stats()["queue_depth"]
+    }
 
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске приложения"""
-    init_db()
+    if not warmup.preloaded:
+        warm_up()
+    conversation_writer.start()
+    if settings.ARCHIVE_AFTER_DAYS > 0:
+        conversation_archiver.start(settings.ARCHIVE_INTERVAL_SECONDS)
+    if question_cluster_job is not None:
+        question_cluster_job.start(settings.QUESTION_CLUSTERS_INTERVAL_SECONDS)
+    metrics.start(settings.METRICS_FLUSH_INTERVAL)
+    stats_snapshot.start()
+    ingest_service.start()
+    warmup.ready = True
+    if scoreboard is not None:
+        scoreboard.set("ready", 1)
+        scoreboard.start(worker_load)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Освобождение ресурсов при остановке приложения"""
+    warmup.ready = False
+    if scoreboard is not None:
+        await scoreboard.stop()
+    # Сначала дописываем очередь диалогов, затем закрываем соединения
+    await stats_snapshot.stop()
+    await ingest_service.stop()
+    await conversation_archiver.stop()
+    if question_cluster_job is not None:
+        await question_cluster_job.stop()
+    await conversation_writer.stop()
+    await chatbot_service.aclose()
+    await async_engine.dispose()
+    await read_engine.dispose()
+    await metrics.stop()
+
+async def run_until_disconnected(request: Request, coro, poll_interval: float = 0.5):
+    """Выполнение корутины с отменой при отключении клиента
+    
+    Возвращает None, если клиент отключился до получения результата.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+def elapsed_ms(started: float) -> int:
+    """Время в миллисекундах с момента started (time.perf_counter)"""
+    return int((time.perf_counter() - started) * 1000)
+
+async def save_conversation(
+    user_id: str,
+    message: str,
+    response: str,
+    category: str,
+    response_time_ms: Optional[int] = None,
+    timer: Optional[StageTimer] = None
+):
+    """Постановка диалога в очередь фоновой пакетной записи и в историю пользователя
+    
+    Замеры этапов из timer учитываются в гистограммах времени; этап
+    db_write замеряет фоновая запись.
+    """
+    timestamp = datetime.utcnow()
+    conversation_history.append(user_id, message, response, timestamp)
+    if timer is not None:
+        latency_recorder.observe(category, timer.timings, timestamp)
+    await conversation_writer.submit(Conversation(
+        user_id=user_id,
+        user_message=message,
+        bot_response=response,
+        timestamp=timestamp,
+        category=category,
+        response_time_ms=response_time_ms
+    ))
+
+# Названия этапов обработки на странице аналитики
+STAGE_NAMES = {
+    "classification": "Классификация",
+    "kb": "Ответ из базы знаний",
+    "cache": "Кэш ответов",
+    "llm": "Запрос к LLM",
+    "db_write": "Запись в БД",
+    "total": "Полное время ответа"
+}
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Форматирование события server-sent events"""
+    payload = json.dumps(data, ensure_ascii=False)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {payload}\n\n"
+
+def admission_key(request: Request, user_id: str) -> str:
+    """Ключ лимита: анонимные пользователи различаются по адресу клиента"""
+    if user_id == "anonymous" and request.client is not None:
+        return f"anonymous@{request.client.host}"
+    return user_id
+
+async def admit_chat(request: Request, user_id: str):
+    """Решение контроля приема и ответ 429, если запрос отклонен"""
+    if admission_controller is None:
+        return None, None
+    decision = await admission_controller.aadmit(admission_key(request, user_id))
+    if not decision.rejected:
+        return decision, None
+    return decision, JSONResponse(
+        status_code=429,
+        content={
+            "error": "Слишком много запросов. Пожалуйста, повторите позже.",
+            "reason": decision.action,
+            "retry_after": decision.retry_after
+        },
+        headers={"Retry-After": str(decision.retry_after)}
+    )
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -39,60 +339,393 @@ async def home(request: Request):
 
 @app.post("/chat")
 async def chat(
+    request: Request,
     message: str = Form(...),
-    user_id: str = Form(default="anonymous"),
-    db: Session = Depends(get_db)
+    user_id: str = Form(default="anonymous")
 ):
     """Обработка сообщений чата"""
+    decision, rejected = await admit_chat(request, user_id)
+    if rejected is not None:
+        return rejected
+    degraded = decision is not None and decision.action == DEGRADE
+    started = time.perf_counter()
+    timer = StageTimer()
     try:
         # Получение ответа от ИИ
-        response = await chatbot_service.get_response(message, user_id)
+        # Классификация выполняется один раз и передается дальше по цепочке
+        with timer.stage("classification"):
+            classification = chatbot_service.classify(message)
+        if degraded:
+            # Перегрузка: отвечаем из базы знаний, не занимая слот LLM
+            with timer.stage("kb"):
+                response = chatbot_service.degraded_response(message, classification.category)
+        else:
+            history = await conversation_history.get_messages(user_id)
+            response = await run_until_disconnected(
+                request, chatbot_service.get_response(message, user_id, classification, history, timer)
+            )
+        if response is None:
+            # Клиент ушел - не тратим запись в БД на ответ, который никто не получит
+            return Response(status_code=499)
         
         # Сохранение в базу данных
-        conversation = Conversation(
-            user_id=user_id,
-            user_message=message,
-            bot_response=response,
-            timestamp=datetime.now(),
-            category=chatbot_service.classify_message(message)
-        )
-        db.add(conversation)
-        db.commit()
+        category = classification.category
+        total_ms = elapsed_ms(started)
+        timer.record("total", total_ms)
+        await save_conversation(user_id, message, response, category, total_ms, timer)
         
-        return {
+        result = {
             "response": response,
-            "timestamp": datetime.now().isoformat(),
-            "category": conversation.category
+            "timestamp": datetime.utcnow().isoformat(),
+            "category": category
         }
+        if degraded:
+            result["degraded"] = True
+        return result
     except Exception as e:
         return {
             "response": "Извините, произошла ошибка. Пожалуйста, попробуйте позже или обратитесь к специалисту ИТ-поддержки.",
             "error": str(e)
         }
 
+@app.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    message: str = Form(...),
+    user_id: str = Form(default="anonymous")
+):
+    """Потоковая обработка сообщений чата (server-sent events)
+    
+    События: meta (категория), неименованные события с частями ответа
+    {"delta": ...} и done после передачи диалога на запись. Временем ответа
+    считается время до первой части ответа. При перегрузке ответ из базы
+    знаний приходит одной частью, а в meta передается "degraded": true.
+    """
+    decision, rejected = await admit_chat(request, user_id)
+    if rejected is not None:
+        return rejected
+    degraded = decision is not None and decision.action == DEGRADE
+    started = time.perf_counter()
+    timer = StageTimer()
+    with timer.stage("classification"):
+        classification = chatbot_service.classify(message)
+    
+    async def degraded_parts():
+        with timer.stage("kb"):
+            response = chatbot_service.degraded_response(message, classification.category)
+        yield response
+    
+    async def events():
+        parts = []
+        first_part_ms = None
+        meta = {"category": classification.category}
+        if degraded:
+            meta["degraded"] = True
+        yield sse_event(meta, event="meta")
+        
+        if degraded:
+            deltas = degraded_parts()
+        else:
+            history = await conversation_history.get_messages(user_id)
+            deltas = chatbot_service.stream_response(message, user_id, classification, history, timer)
+        async for delta in deltas:
+            if first_part_ms is None:
+                first_part_ms = elapsed_ms(started)
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+        
+        response = "".join(parts).strip()
+        try:
+            if first_part_ms is not None:
+                timer.record("total", first_part_ms)
+            await save_conversation(user_id, message, response, classification.category, first_part_ms, timer)
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+        
+        yield sse_event({
+            "category": classification.category,
+            "timestamp": datetime.utcnow().isoformat(),
+            "ttfb_ms": first_part_ms,
+            "total_ms": elapsed_ms(started)
+        }, event="done")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def collect_stats() -> dict:
+    """Статистика из rollup-таблиц и состояние сервисов для снимка"""
+    async with ReadSessionLocal() as db:
+        stats = await db.run_sync(analytics_service.get_statistics)
+    if chatbot_service.response_cache is not None:
+        stats["response_cache"] = chatbot_service.response_cache.get_stats()
+    stats["persistence"] = conversation_writer.get_stats()
+    stats["knowledge_base"] = chatbot_service.knowledge_base.get_stats()
+    stats["history"] = conversation_history.get_stats()
+    if chatbot_service.llm_router is not None:
+        stats["llm_backends"] = chatbot_service.llm_router.get_stats()
+    if chatbot_service.intent_router is not None:
+        stats["fast_path"] = chatbot_service.intent_router.get_stats()
+    if chatbot_service.single_flight is not None:
+        stats["llm_coalescing"] = chatbot_service.single_flight.get_stats()
+    stats["archive"] = await asyncio.to_thread(conversation_archiver.get_stats)
+    stats["ingest"] = ingest_service.get_stats()
+    if admission_controller is not None:
+        stats["admission"] = admission_controller.get_stats()
+    if question_cluster_job is not None:
+        stats["question_clustering"] = question_cluster_job.get_stats()
+    if scoreboard is not None:
+        stats["workers"] = scoreboard.get_stats()
+    return stats
+
+def render_stats(stats: dict) -> dict:
+    """Страница аналитики и фрагмент со счетчиками для автообновления"""
+    fragment = templates.get_template("analytics_fragment.html").render(stats=stats, stage_names=STAGE_NAMES)
+    page = templates.get_template("analytics.html").render(stats=stats, fragment=fragment)
+    return {"page": page, "fragment": fragment}
+
+stats_snapshot = StatsSnapshotCache(
+    collect_stats,
+    render_stats,
+    refresh_interval=settings.STATS_REFRESH_SECONDS,
+    max_stale=settings.STATS_MAX_STALE_SECONDS
+)
+
+def snapshot_response(request: Request, snapshot: StatsSnapshot, name: str, media_type: str) -> Response:
+    """Готовое представление снимка или 304, если у клиента та же версия"""
+    headers = {
+        "ETag": snapshot.etags[name],
+        # Клиент может хранить ответ, но перед использованием проверяет ETag
+        "Cache-Control": "no-cache",
+        "Age": str(int(snapshot.age(stats_snapshot.clock())))
+    }
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etags[name]):
+        stats_snapshot.count_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.bodies[name], media_type=media_type, headers=headers)
+
 @app.get("/analytics")
-async def analytics(request: Request, db: Session = Depends(get_db)):
+async def analytics(request: Request):
     """Страница аналитики"""
-    stats = analytics_service.get_statistics(db)
-    return templates.TemplateResponse("analytics.html", {
-        "request": request,
-        "stats": stats
-    })
+    return snapshot_response(request, await stats_snapshot.get(), "page", "text/html; charset=utf-8")
+
+@app.get("/analytics/fragment")
+async def analytics_fragment(request: Request):
+    """Счетчики страницы аналитики (HTML-фрагмент для автообновления)"""
+    return snapshot_response(request, await stats_snapshot.get(), "fragment", "text/html; charset=utf-8")
 
 @app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    """API для получения статистики"""
-    return analytics_service.get_statistics(db)
+async def get_stats(request: Request):
+    """API для получения статистики (снимок, обновляемый в фоне)"""
+    return snapshot_response(request, await stats_snapshot.get(), "json", "application/json")
+
+@app.post("/api/stats/refresh")
+async def refresh_stats():
+    """Немедленный пересчет снимка статистики"""
+    snapshot = await stats_snapshot.refresh()
+    return {"etag": snapshot.etags["json"], "generated_at": snapshot.generated_at, **stats_snapshot.get_stats()}
+
+def ndjson_line(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+async def json_array_items(request: Request):
+    """Обращения из тела-массива JSON"""
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный JSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив обращений")
+    for item in items:
+        yield item
+
+@app.post("/api/ingest")
+async def ingest(
+    request: Request,
+    source: Optional[str] = Query(default=None, max_length=50),
+    stream: bool = True
+):
+    """Пакетная загрузка обращений: NDJSON (по строке на обращение) или массив JSON
+    
+    Обращения сохраняются в задание, которое обрабатывается в фоне. При
+    stream=true ответ - NDJSON: строка с job_id, результаты по мере
+    готовности и итог задания. Если соединение оборвалось, результаты
+    дочитываются через /api/ingest/{job_id}/results?after=<n>.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        items = json_array_items(request)
+    else:
+        items = iter_ndjson(request.stream())
+    try:
+        job = await ingest_service.create_job(items, source=source)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not stream:
+        return JSONResponse(job, status_code=202)
+    return StreamingResponse(
+        ingest_events(job["job_id"], 0, job),
+        media_type="application/x-ndjson",
+        headers={"X-Ingest-Job": job["job_id"]}
+    )
+
+async def ingest_events(job_id: str, after: int, header: Optional[dict] = None):
+    if header is not None:
+        yield ndjson_line(header)
+    async for result in ingest_service.results(job_id, after):
+        yield ndjson_line(result)
+    yield ndjson_line(await ingest_service.get_job(job_id))
+
+@app.get("/api/ingest/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Состояние задания загрузки"""
+    job = await ingest_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return job
+
+@app.get("/api/ingest/{job_id}/results")
+async def get_ingest_results(job_id: str, after: int = Query(default=0, ge=0)):
+    """Результаты задания после номера after (поле n) в порядке готовности, NDJSON"""
+    if await ingest_service.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return StreamingResponse(ingest_events(job_id, after), media_type="application/x-ndjson")
+
+@app.get("/api/trends")
+async def get_trends(
+    days: int = Query(default=30, ge=1, le=366),
+    granularity: Literal["hour", "day", "week"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """API для получения трендов по категориям"""
+    try:
+        trends = await db.run_sync(
+            analytics_service.get_category_trends, days=days, granularity=granularity, start=start, end=end
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"granularity": granularity, "trends": trends}
+
+@app.get("/api/questions/popular")
+async def get_popular_questions(
+    limit: int = Query(default=20, ge=1, le=200),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Популярные вопросы (кластеры похожих формулировок) и предложения для базы знаний"""
+    return await db.run_sync(analytics_service.get_popular_questions, limit=limit)
+
+@app.get("/api/search")
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    order: Literal["relevance", "recent"] = "relevance",
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Полнотекстовый поиск диалогов с фильтрами и пагинацией по курсору next_cursor"""
+    if conversation_search is None:
+        raise HTTPException(status_code=503, detail="Полнотекстовый поиск недоступен для этой базы данных")
+    try:
+        return await db.run_sync(
+            conversation_search.search, q, category=category, user_id=user_id,
+            start=start, end=end, order=order, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/users/{user_id}/activity")
+async def get_user_activity(
+    user_id: str,
+    limit: int = Query(default=10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """API активности пользователя: счетчики и первая страница обращений"""
+    activity = await db.run_sync(analytics_service.get_user_activity, user_id, limit=limit)
+    if "error" in activity:
+        return JSONResponse(activity, status_code=404)
+    return activity
+
+@app.get("/api/users/{user_id}/conversations")
+async def get_user_conversations(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """API обращений пользователя с пагинацией по курсору next_cursor"""
+    try:
+        return await db.run_sync(analytics_service.get_user_conversations, user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/users/{user_id}/export")
+async def export_user_conversations(user_id: str):
+    """Выгрузка всей истории пользователя в NDJSON (потоково, одна строка - одно обращение)
+    
+    Сначала выгружается архивная часть истории, затем строки таблицы.
+    Для архива читаются файлы всех дней, поэтому при большом архиве
+    выгрузка заметно дольше.
+    """
+    async def lines():
+        async for batch in iterate_in_threadpool(conversation_archive.iter_batches(user_id=user_id)):
+            yield "".join(
+                json.dumps({
+                    'id': row['id'],
+                    'timestamp': row['timestamp'],
+                    'category': row['category'] or 'general',
+                    'user_message': row['user_message'],
+                    'bot_response': row['bot_response'],
+                    'response_time_ms': row['response_time_ms']
+                }, ensure_ascii=False) + "\n"
+                for row in batch
+            )
+        async for batch in analytics_service.aiter_user_conversation_batches(ReadSessionLocal, user_id):
+            yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch)
+    
+    filename = re.sub(r"[^\w.-]", "_", user_id, flags=re.ASCII) or "user"
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.ndjson"'}
+    )
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Метрики отключены")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/health")
 async def health_check():
     """Проверка состояния приложения"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность принимать трафик: процесс прогрет и снимок статистики посчитан
+    (/health - только то, что процесс жив)"""
+    state = warmup.get_stats()
+    state["stats_snapshot"] = stats_snapshot.get_stats()["age"] is not None
+    if scoreboard is not None:
+        state["workers"] = {key: value for key, value in scoreboard.get_stats().items() if key != "per_worker"}
+    ready = state["ready"] and state["stats_snapshot"]
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming_up", **state}
+    )
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
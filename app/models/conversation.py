@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
 from datetime import datetime
 
 from app.database import Base
@@ -7,6 +7,12 @@ class Conversation(Base):
     """Модель для хранения диалогов с пользователями"""
     
     __tablename__ = "conversations"
+    __table_args__ = (
+        # История и активность пользователя: фильтр по user_id, порядок по времени
+        Index("ix_conversations_user_id_timestamp", "user_id", "timestamp"),
+        # Перенос в архив и выборки за последние дни: диапазон по времени
+        Index("ix_conversations_timestamp", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, index=True)
@@ -14,6 +20,7 @@ class Conversation(Base):
     bot_response = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
     category = Column(String, nullable=True)  # Категория запроса (пароль, доступ, документы и т.д.)
+    response_time_ms = Column(Integer, nullable=True)  # Время до первого байта ответа пользователю
     
     def __repr__(self):
         return f"<Conversation(id={self.id}, user_id='{self.user_id}', category='{self.category}')>"
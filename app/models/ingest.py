@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from datetime import datetime
+
+from app.database import Base
+
+class IngestJob(Base):
+    """Задание пакетной загрузки обращений (почта, мессенджеры)
+
+    Задание обрабатывает тот процесс, который держит аренду (lease_owner
+    до lease_until): после перезапуска или падения процесса аренда
+    истекает, и задание продолжает любой работающий процесс.
+    """
+
+    __tablename__ = "ingest_jobs"
+
+    id = Column(String, primary_key=True)
+    source = Column(String, nullable=True)  # Откуда пришли обращения: mail, telegram и т.д.
+    status = Column(String, nullable=False, default="running")  # running, done
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)  # Обработано, включая ошибки
+    failed = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<IngestJob(id='{self.id}', status='{self.status}', processed={self.processed}/{self.total})>"
+
+class IngestItem(Base):
+    """Обращение в задании загрузки и результат его обработки"""
+
+    __tablename__ = "ingest_items"
+    __table_args__ = (
+        # Результаты задания в порядке готовности (продолжение потока по курсору)
+        Index("ix_ingest_items_job_result", "job_id", "result_no"),
+    )
+
+    job_id = Column(String, primary_key=True)
+    seq = Column(Integer, primary_key=True)  # Номер во входных данных
+    external_id = Column(String, nullable=True)  # id обращения во внешней системе
+    user_id = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, done, failed
+    category = Column(String, nullable=True)
+    response = Column(Text, nullable=True)
+    error = Column(String, nullable=True)
+    result_no = Column(Integer, nullable=True)  # Порядковый номер готового результата в задании
+
+    def __repr__(self):
+        return f"<IngestItem(job_id='{self.job_id}', seq={self.seq}, status='{self.status}')>"
@@ -0,0 +1,81 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
+
+from app.database import Base
+
+class HourlyStat(Base):
+    """Почасовые счетчики обращений по категориям"""
+    
+    __tablename__ = "stats_hourly"
+    
+    bucket = Column(DateTime, primary_key=True)  # Начало часа
+    category = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    response_time_sum = Column(Integer, nullable=False, default=0)  # Сумма response_time_ms
+    response_time_count = Column(Integer, nullable=False, default=0)  # Обращений с замером времени
+    
+    def __repr__(self):
+        return f"<HourlyStat(bucket='{self.bucket}', category='{self.category}', count={self.count})>"
+
+class CategoryStat(Base):
+    """Общее количество обращений по категориям"""
+    
+    __tablename__ = "stats_categories"
+    
+    category = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<CategoryStat(category='{self.category}', count={self.count})>"
+
+class UserStat(Base):
+    """Количество обращений и даты первого/последнего контакта по пользователям"""
+    
+    __tablename__ = "stats_users"
+    
+    user_id = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0, index=True)
+    first_contact = Column(DateTime, nullable=True)
+    last_contact = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<UserStat(user_id='{self.user_id}', count={self.count})>"
+
+class LatencyStat(Base):
+    """Гистограммы времени этапов обработки по дням и категориям
+    
+    Одна строка - число замеров этапа, попавших в логарифмическую корзину
+    (см. app.services.latency).
+    """
+    
+    __tablename__ = "stats_latency"
+    
+    day = Column(DateTime, primary_key=True)  # Начало дня
+    category = Column(String, primary_key=True)
+    stage = Column(String, primary_key=True)  # classification, cache, llm, db_write, total
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<LatencyStat(day='{self.day}', category='{self.category}', stage='{self.stage}', bucket={self.bucket})>"
+
+class QuestionClusterStat(Base):
+    """Популярный вопрос - кластер похожих формулировок (см. app.services.question_clusters)
+    
+    Таблица целиком перезаписывается заданием кластеризации: в ней только
+    самые крупные кластеры для страницы аналитики.
+    """
+    
+    __tablename__ = "stats_question_clusters"
+    
+    cluster_id = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False, default=0, index=True)  # Обращений в кластере
+    category = Column(String, nullable=True)  # Самая частая категория классификатора
+    label = Column(Text, nullable=False)  # Самая типичная формулировка
+    keywords = Column(Text, nullable=False, default="[]")  # JSON: основы самых весомых слов
+    examples = Column(Text, nullable=False, default="[]")  # JSON: другие формулировки
+    kb_title = Column(String, nullable=True)  # Ближайшая статья базы знаний
+    suggested = Column(Boolean, nullable=False, default=False)  # Статьи нет - стоит написать
+    updated_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<QuestionClusterStat(cluster_id={self.cluster_id}, size={self.size}, label='{self.label[:30]}')>"
@@ -0,0 +1,230 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List
+
+from app.services.metrics import chat_admission_total
+
+# Решения по запросу
+ADMIT = "admit"  # Обычная обработка
+DEGRADE = "degrade"  # Ответ из базы знаний без LLM
+THROTTLE = "throttle"  # 429: пользователь превысил свой лимит
+SHED = "shed"  # 429: очередь записи почти заполнена
+DECISIONS = (ADMIT, DEGRADE, THROTTLE, SHED)
+
+GLOBAL_KEY = "*"
+
+class Decision:
+    """Решение о приеме запроса; retry_after - секунды для заголовка Retry-After"""
+
+    __slots__ = ("action", "retry_after")
+
+    def __init__(self, action: str, retry_after: int = 0):
+        self.action = action
+        self.retry_after = retry_after
+
+    @property
+    def rejected(self) -> bool:
+        return self.action in (THROTTLE, SHED)
+
+class MemoryBucketStore:
+    """Корзины токенов в памяти процесса
+
+    Корзина - пара [токены, время обновления]: пополнение считается при
+    обращении, отдельного таймера нет. Число корзин ограничено max_keys,
+    дольше всех не обращавшиеся вытесняются (вытесненная корзина
+    возвращается полной).
+    """
+
+    clock = staticmethod(time.monotonic)
+    # Списание - операция в памяти, ее можно выполнять прямо в event loop
+    blocking = False
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, now: float, cost: float = 1.0) -> float:
+        """Списание cost токенов: 0, если списаны, иначе секунды до пополнения"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / rate if rate > 0 else math.inf
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class SQLiteBucketStore:
+    """Корзины токенов в общем файле SQLite для нескольких воркеров
+
+    Чтение и обновление корзины - одна транзакция BEGIN IMMEDIATE, поэтому
+    процессы не списывают одни и те же токены дважды. Время - time.time(),
+    общее для процессов. Корзины не критичны: запись без fsync, а блокировка
+    ждется не дольше busy_timeout секунд - дальше sqlite3.OperationalError,
+    и контроллер пропускает запрос. Число корзин для статистики считается
+    в памяти: корзины, созданные другими процессами, учитываются при
+    очередной очистке.
+    """
+
+    clock = staticmethod(time.time)
+    # Файловый ввод-вывод: контроллер выполняет списание в отдельном потоке
+    blocking = True
+
+    def __init__(self, path: str, cleanup_every: int = 10000, busy_timeout: float = 0.005):
+        self.path = path
+        self.cleanup_every = cleanup_every
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS token_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()
+        self._takes = 0
+        self._tracked = self._count()
+
+    def take(self, key: str, rate: float, burst: float, now: float, cost: float = 1.0) -> float:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / rate if rate > 0 else math.inf
+                self._db.execute(
+                    "INSERT INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now)
+                )
+                tracked = self._tracked + (row is None)
+                self._takes += 1
+                if self._takes % self.cleanup_every == 0:
+                    # Корзины, не использовавшиеся час, давно полные - их можно не хранить
+                    self._db.execute("DELETE FROM token_buckets WHERE updated < ?", (now - 3600,))
+                    tracked = self._count()
+                self._db.execute("COMMIT")
+                self._tracked = tracked
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return wait
+
+    def __len__(self) -> int:
+        """Число корзин без обращения к файлу (вызывается из event loop)"""
+        with self._lock:
+            return self._tracked
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT count(*) FROM token_buckets").fetchone()[0]
+
+class AdmissionController:
+    """Прием запросов к чату: лимиты пользователей и сброс нагрузки
+
+    Порядок проверок:
+    1. очередь записи диалогов заполнена на shed_ratio и больше - 429
+       (запрос не обрабатывается совсем);
+    2. у пользователя кончились токены (user_rate в секунду, запас
+       user_burst) - 429;
+    3. кончились общие токены (global_rate, 0 - без общего лимита) или
+       заняты все слоты запросов к LLM - ответ из базы знаний без LLM;
+    4. иначе - обычная обработка.
+    Retry-After учитывает и ожидание токена, и загрузку очередей: чем
+    они полнее, тем позже предлагается повторить запрос.
+    """
+
+    def __init__(
+        self,
+        store,
+        user_rate: float = 1.0,
+        user_burst: float = 20,
+        global_rate: float = 0.0,
+        global_burst: float = 100,
+        llm_load: Callable[[], float] = lambda: 0.0,
+        write_load: Callable[[], float] = lambda: 0.0,
+        shed_ratio: float = 0.9,
+        max_retry_after: int = 10
+    ):
+        self.store = store
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.llm_load = llm_load
+        self.write_load = write_load
+        self.shed_ratio = shed_ratio
+        self.max_retry_after = max_retry_after
+        self._stats = Counter()
+
+    def admit(self, key: str) -> Decision:
+        """Решение по запросу пользователя key"""
+        decision = self._decide(key)
+        self._stats[decision.action] += 1
+        chat_admission_total.labels(decision.action).inc()
+        return decision
+
+    async def aadmit(self, key: str) -> Decision:
+        """Решение из обработчика запроса: с общим файлом корзин - в отдельном
+        потоке, чтобы ожидание блокировки SQLite не останавливало event loop"""
+        if getattr(self.store, "blocking", False):
+            return await asyncio.to_thread(self.admit, key)
+        return self.admit(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "store": "sqlite" if isinstance(self.store, SQLiteBucketStore) else "memory",
+            "user_rate": self.user_rate,
+            "user_burst": self.user_burst,
+            "global_rate": self.global_rate,
+            "tracked": len(self.store),
+            "admitted": self._stats[ADMIT],
+            "degraded": self._stats[DEGRADE],
+            "throttled": self._stats[THROTTLE],
+            "shed": self._stats[SHED],
+            "errors": self._stats["errors"]
+        }
+
+    def _decide(self, key: str) -> Decision:
+        write_load = self.write_load()
+        if write_load >= self.shed_ratio:
+            return Decision(SHED, self._retry_after(0.0, write_load))
+        now = self.store.clock()
+        try:
+            wait = self.store.take(f"user:{key}", self.user_rate, self.user_burst, now)
+            if wait > 0:
+                return Decision(THROTTLE, self._retry_after(wait, write_load))
+            llm_load = self.llm_load()
+            if llm_load >= 1.0:
+                return Decision(DEGRADE)
+            if self.global_rate > 0 and self.store.take(GLOBAL_KEY, self.global_rate, self.global_burst, now) > 0:
+                return Decision(DEGRADE)
+        except sqlite3.Error:
+            # Общее хранилище недоступно (например, заблокировано) - не отказываем
+            self._stats["errors"] += 1
+        return Decision(ADMIT)
+
+    def _retry_after(self, wait: float, load: float) -> int:
+        seconds = min(self.max_retry_after, wait + max(load, self.llm_load()) * self.max_retry_after)
+        return max(1, math.ceil(seconds))
@@ -1,55 +1,104 @@
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func, extract, tuple_
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Any, Optional, Tuple
+import base64
+import json
 from collections import Counter
 
 from app.models.conversation import Conversation
+from app.models.statistics import HourlyStat, CategoryStat, UserStat, LatencyStat, QuestionClusterStat
+from app.services.latency import STAGES, LatencyHistogram
+from app.services.statistics_store import hour_bucket, to_naive_utc
+from app.config import settings
+
+# Шаг периода для трендов по категориям
+TREND_STEPS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1)
+}
+
+# Ограничения окна трендов: не длиннее TREND_MAX_DAYS (как у параметра days)
+# и не больше периодов гранулярности, чем TREND_MAX_PERIODS
+TREND_MAX_DAYS = 366
+TREND_MAX_PERIODS = {
+    'hour': 24 * 31,
+    'day': TREND_MAX_DAYS + 1,
+    'week': TREND_MAX_DAYS // 7 + 2
+}
+
+# Длина превью сообщения в списке обращений пользователя
+PREVIEW_LENGTH = 100
+
+def encode_cursor(timestamp: datetime, conversation_id: int) -> str:
+    """Курсор страницы: ключ (timestamp, id) последней строки"""
+    raw = f"{timestamp.isoformat()}|{conversation_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбор курсора страницы (ValueError, если курсор поврежден)"""
+    try:
+        timestamp, conversation_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), int(conversation_id)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+def sla_targets() -> List[int]:
+    """Пороги SLA из настроек, мс"""
+    return [int(value) for value in settings.SLA_TARGETS_MS.split(",") if value.strip()]
 
 class AnalyticsService:
     """Сервис для аналитики и статистики"""
     
     def get_statistics(self, db: Session) -> Dict[str, Any]:
-        """Получение общей статистики"""
-        
-        # Общее количество обращений
-        total_conversations = db.query(Conversation).count()
+        """Получение общей статистики
         
-        # Обращения за последние 24 часа
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        recent_conversations = db.query(Conversation).filter(
-            Conversation.timestamp >= yesterday
-        ).count()
+        Читает только rollup-таблицы (stats_*), поэтому стоимость не зависит
+        от размера истории: O(часов за неделю x категорий + категорий + 10).
+        """
+        now = datetime.utcnow()
         
-        # Обращения за последнюю неделю
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        week_conversations = db.query(Conversation).filter(
-            Conversation.timestamp >= week_ago
-        ).count()
+        # Популярные категории и общее количество обращений
+        category_stats = db.query(CategoryStat.category, CategoryStat.count).all()
+        categories = {stat.category: stat.count for stat in category_stats}
+        total_conversations = sum(categories.values())
         
-        # Популярные категории
-        category_stats = db.query(
-            Conversation.category,
-            func.count(Conversation.category).label('count')
-        ).group_by(Conversation.category).all()
+        # Почасовые счетчики за неделю: из них считаются обращения за 24 часа,
+        # за неделю и статистика по дням (окна выровнены по началу часа)
+        week_ago = hour_bucket(now - timedelta(days=7))
+        yesterday = hour_bucket(now - timedelta(days=1))
+        hourly_stats = db.query(
+            HourlyStat.bucket,
+            HourlyStat.count,
+            HourlyStat.response_time_sum,
+            HourlyStat.response_time_count
+        ).filter(HourlyStat.bucket >= week_ago).all()
         
-        categories = {stat.category or 'general': stat.count for stat in category_stats}
+        recent_conversations = sum(stat.count for stat in hourly_stats if stat.bucket >= yesterday)
+        week_conversations = sum(stat.count for stat in hourly_stats)
         
         # Статистика по дням (последние 7 дней)
-        daily_stats = self._get_daily_statistics(db, 7)
+        daily_stats = self._get_daily_statistics(hourly_stats, now, 7)
         
         # Самые активные пользователи
-        user_stats = db.query(
-            Conversation.user_id,
-            func.count(Conversation.user_id).label('count')
-        ).group_by(Conversation.user_id).order_by(
-            func.count(Conversation.user_id).desc()
+        user_stats = db.query(UserStat.user_id, UserStat.count).order_by(
+            UserStat.count.desc()
         ).limit(10).all()
         
         top_users = [{'user_id': stat.user_id, 'count': stat.count} for stat in user_stats]
         
-        # Среднее время ответа (в секундах) - пока заглушка
-        avg_response_time = 2.5
+        # Среднее время до первого байта ответа за неделю (в секундах)
+        timed_count = sum(stat.response_time_count for stat in hourly_stats)
+        timed_sum = sum(stat.response_time_sum for stat in hourly_stats)
+        avg_response_time = timed_sum / timed_count / 1000 if timed_count else 0.0
+        
+        # Перцентили времени этапов и SLA по гистограммам за то же окно
+        latency = self.get_latency_stats(db, days=7, now=now)
+        
+        # Популярные вопросы из последнего запуска кластеризации
+        popular_questions = self.get_popular_questions(db, limit=10)
         
         return {
             'total_conversations': total_conversations,
@@ -59,112 +108,346 @@ class AnalyticsService:
             'daily_stats': daily_stats,
             'top_users': top_users,
             'avg_response_time': avg_response_time,
-            'sla_metrics': self._calculate_sla_metrics(db)
+            'latency': latency,
+            'sla_metrics': latency['sla'],
+            'popular_questions': popular_questions
         }
     
-    def _get_daily_statistics(self, db: Session, days: int) -> List[Dict[str, Any]]:
-        """Получение статистики по дням"""
-        result = []
+    def get_popular_questions(self, db: Session, limit: int = 10) -> Dict[str, Any]:
+        """Самые крупные кластеры вопросов и кластеры без статьи в базе знаний
+        
+        Кластеры пересчитываются заданием cluster_questions.py; здесь
+        читается только его таблица stats_question_clusters.
+        """
+        rows = db.query(QuestionClusterStat).order_by(
+            QuestionClusterStat.size.desc(), QuestionClusterStat.cluster_id
+        ).limit(limit).all()
+        suggestions = db.query(QuestionClusterStat).filter(
+            QuestionClusterStat.suggested.is_(True)
+        ).order_by(QuestionClusterStat.size.desc(), QuestionClusterStat.cluster_id).limit(limit).all()
+        
+        def as_dict(row: QuestionClusterStat) -> Dict[str, Any]:
+            return {
+                'cluster_id': row.cluster_id,
+                'size': row.size,
+                'category': row.category,
+                'label': row.label,
+                'keywords': json.loads(row.keywords),
+                'examples': json.loads(row.examples),
+                'kb_title': row.kb_title,
+                'suggested': row.suggested
+            }
         
+        updated_at = rows[0].updated_at if rows else None
+        return {
+            'updated_at': updated_at.isoformat() if updated_at else None,
+            'questions': [as_dict(row) for row in rows],
+            'suggestions': [as_dict(row) for row in suggestions]
+        }
+    
+    def _get_daily_statistics(self, hourly_stats: List[Any], now: datetime, days: int) -> List[Dict[str, Any]]:
+        """Свертка почасовых счетчиков в статистику по дням"""
+        by_day = Counter()
+        for stat in hourly_stats:
+            by_day[stat.bucket.date()] += stat.count
+        
+        result = []
         for i in range(days):
-            date = datetime.utcnow() - timedelta(days=i)
-            start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
-            
-            count = db.query(Conversation).filter(
-                Conversation.timestamp >= start_of_day,
-                Conversation.timestamp < end_of_day
-            ).count()
-            
+            day = (now - timedelta(days=i)).date()
             result.append({
-                'date': start_of_day.strftime('%Y-%m-%d'),
-                'count': count
+                'date': day.strftime('%Y-%m-%d'),
+                'count': by_day.get(day, 0)
             })
         
         return list(reversed(result))  # От старых к новым
     
-    def _calculate_sla_metrics(self, db: Session) -> Dict[str, Any]:
-        """Расчет метрик SLA"""
+    def get_latency_stats(self, db: Session, days: int = 7, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Перцентили времени обработки по этапам, категориям и дням
         
-        # Процент решенных в течение 1 часа (заглушка)
-        sla_1h = 85.5
+        Гистограммы stats_latency за окно из days дней складываются
+        покорзинно: O(дней x категорий x этапов x корзин) строк.
+        """
+        now = now or datetime.utcnow()
+        first_day = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = db.query(
+            LatencyStat.day, LatencyStat.category, LatencyStat.stage, LatencyStat.bucket, LatencyStat.count
+        ).filter(LatencyStat.day >= first_day).all()
         
-        # Процент решенных в течение 4 часов (заглушка)
-        sla_4h = 95.2
+        stages: Dict[str, LatencyHistogram] = {}
+        categories: Dict[str, LatencyHistogram] = {}
+        daily: Dict[Any, LatencyHistogram] = {}
+        for row in rows:
+            stages.setdefault(row.stage, LatencyHistogram()).add_bucket(row.bucket, row.count)
+            if row.stage == 'total':
+                categories.setdefault(row.category, LatencyHistogram()).add_bucket(row.bucket, row.count)
+                daily.setdefault(row.day.date(), LatencyHistogram()).add_bucket(row.bucket, row.count)
         
-        # Процент решенных в течение 24 часов (заглушка)
-        sla_24h = 99.1
+        total = stages.get('total', LatencyHistogram())
+        days_list = [(first_day + timedelta(days=i)).date() for i in range(days)]
+        return {
+            'window_days': days,
+            'stages': {stage: stages[stage].summary() for stage in STAGES if stage in stages},
+            'categories': {category: histogram.summary() for category, histogram in sorted(categories.items())},
+            'daily': [
+                {'date': day.strftime('%Y-%m-%d'), **daily.get(day, LatencyHistogram()).summary()}
+                for day in days_list
+            ],
+            'sla': self._calculate_sla_metrics(total)
+        }
+    
+    def _calculate_sla_metrics(self, histogram: LatencyHistogram) -> Dict[str, Any]:
+        """Расчет метрик SLA по гистограмме полного времени ответа
         
-        # Средняя оценка удовлетворенности (заглушка)
-        satisfaction_score = 4.3
+        Для каждого порога из SLA_TARGETS_MS - процент ответов не дольше
+        порога. Оценок пользователей пока нет, поэтому satisfaction_score
+        не заполняется.
+        """
+        targets = []
+        for threshold_ms in sla_targets():
+            share = histogram.share_within(threshold_ms)
+            targets.append({
+                'threshold_ms': threshold_ms,
+                'percentage': round(share * 100, 1) if share is not None else None
+            })
+        summary = histogram.summary()
         
         return {
-            'sla_1h': sla_1h,
-            'sla_4h': sla_4h,
-            'sla_24h': sla_24h,
-            'satisfaction_score': satisfaction_score
+            'measured': summary['count'],
+            'targets': targets,
+            'p50_ms': summary['p50'],
+            'p95_ms': summary['p95'],
+            'p99_ms': summary['p99'],
+            'satisfaction_score': None
         }
     
-    def get_category_trends(self, db: Session, days: int = 30) -> Dict[str, List[Dict[str, Any]]]:
-        """Получение трендов по категориям"""
-        trends = {}
-        
-        # Получаем все категории
-        categories = db.query(Conversation.category).distinct().all()
-        
-        for category_row in categories:
-            category = category_row.category or 'general'
-            daily_data = []
-            
-            for i in range(days):
-                date = datetime.utcnow() - timedelta(days=i)
-                start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-                end_of_day = start_of_day + timedelta(days=1)
-                
-                count = db.query(Conversation).filter(
-                    Conversation.category == (category if category != 'general' else None),
-                    Conversation.timestamp >= start_of_day,
-                    Conversation.timestamp < end_of_day
-                ).count()
-                
-                daily_data.append({
-                    'date': start_of_day.strftime('%Y-%m-%d'),
-                    'count': count
-                })
-            
-            trends[category] = list(reversed(daily_data))
-        
-        return trends
+    def get_category_trends(
+        self,
+        db: Session,
+        days: int = 30,
+        granularity: str = 'day',
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Получение трендов по категориям
+        
+        Вся матрица категория x период читается одним запросом из почасовых
+        счетчиков и сворачивается до нужной гранулярности (hour/day/week).
+        Пропущенные периоды заполняются нулями. Если start не задан, берутся
+        последние days суток до end (по умолчанию - текущий момент).
+        Моменты с часовым поясом приводятся к UTC. Окно с start позже end,
+        длиннее TREND_MAX_DAYS или с числом периодов больше TREND_MAX_PERIODS
+        отклоняется с ValueError.
+        """
+        if granularity not in TREND_STEPS:
+            raise ValueError(f"Неизвестная гранулярность: {granularity}")
+        step = TREND_STEPS[granularity]
+        
+        end = to_naive_utc(end) if end is not None else datetime.utcnow()
+        last_period = self._floor_period(end, granularity)
+        if start is None:
+            periods_count = max(1, -(-timedelta(days=days) // step))  # Округление вверх
+            first_period = last_period - step * (periods_count - 1)
+        else:
+            start = to_naive_utc(start)
+            if start > end:
+                raise ValueError("Начало периода позже конца")
+            if end - start > timedelta(days=TREND_MAX_DAYS):
+                raise ValueError(f"Окно трендов длиннее {TREND_MAX_DAYS} дней")
+            first_period = self._floor_period(start, granularity)
+            periods_count = (last_period - first_period) // step + 1
+        if periods_count > TREND_MAX_PERIODS[granularity]:
+            raise ValueError(
+                f"Слишком много периодов '{granularity}': {periods_count} (не больше {TREND_MAX_PERIODS[granularity]})"
+            )
+        
+        periods = []
+        period = first_period
+        while period <= last_period:
+            periods.append(period)
+            period += step
+        
+        hourly_stats = db.query(HourlyStat.bucket, HourlyStat.category, HourlyStat.count).filter(
+            HourlyStat.bucket >= first_period,
+            HourlyStat.bucket < last_period + step
+        ).all()
+        
+        matrix = Counter()
+        for stat in hourly_stats:
+            matrix[(stat.category, self._floor_period(stat.bucket, granularity))] += stat.count
+        
+        # Все известные категории, даже без обращений в окне
+        categories = {row.category for row in db.query(CategoryStat.category).all()}
+        categories.update(category for category, _ in matrix)
+        
+        label_format = '%Y-%m-%d %H:00' if granularity == 'hour' else '%Y-%m-%d'
+        return {
+            category: [
+                {'date': period.strftime(label_format), 'count': matrix.get((category, period), 0)}
+                for period in periods
+            ]
+            for category in sorted(categories)
+        }
+    
+    def _floor_period(self, timestamp: datetime, granularity: str) -> datetime:
+        """Начало периода (часа, дня или недели с понедельника)"""
+        if granularity == 'hour':
+            return hour_bucket(timestamp)
+        day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        if granularity == 'week':
+            return day - timedelta(days=day.weekday())
+        return day
     
-    def get_user_activity(self, db: Session, user_id: str) -> Dict[str, Any]:
-        """Получение активности конкретного пользователя"""
+    def get_user_activity(self, db: Session, user_id: str, limit: int = 10) -> Dict[str, Any]:
+        """Получение активности конкретного пользователя
         
-        conversations = db.query(Conversation).filter(
-            Conversation.user_id == user_id
-        ).order_by(Conversation.timestamp.desc()).all()
+        Счетчики считаются одним GROUP BY по индексу (user_id, timestamp),
+        последние обращения - первой страницей get_user_conversations.
+        """
+        category = func.coalesce(Conversation.category, 'general')
+        rows = db.query(
+            category.label('category'),
+            func.count(Conversation.id).label('count'),
+            func.min(Conversation.timestamp).label('first_contact'),
+            func.max(Conversation.timestamp).label('last_contact')
+        ).filter(Conversation.user_id == user_id).group_by(category).all()
         
-        if not conversations:
+        if not rows:
             return {'error': 'User not found'}
         
-        # Статистика по категориям для пользователя
-        user_categories = Counter([conv.category or 'general' for conv in conversations])
-        
-        # Последние обращения
-        recent_conversations = [
-            {
-                'id': conv.id,
-                'message': conv.user_message[:100] + '...' if len(conv.user_message) > 100 else conv.user_message,
-                'category': conv.category or 'general',
-                'timestamp': conv.timestamp.isoformat()
-            }
-            for conv in conversations[:10]
-        ]
+        first_contacts = [row.first_contact for row in rows if row.first_contact is not None]
+        last_contacts = [row.last_contact for row in rows if row.last_contact is not None]
+        page = self.get_user_conversations(db, user_id, limit=limit)
         
         return {
             'user_id': user_id,
-            'total_conversations': len(conversations),
-            'categories': dict(user_categories),
-            'recent_conversations': recent_conversations,
-            'first_contact': conversations[-1].timestamp.isoformat() if conversations else None,
-            'last_contact': conversations[0].timestamp.isoformat() if conversations else None
+            'total_conversations': sum(row.count for row in rows),
+            'categories': {row.category: row.count for row in rows},
+            'recent_conversations': page['conversations'],
+            'next_cursor': page['next_cursor'],
+            'first_contact': min(first_contacts).isoformat() if first_contacts else None,
+            'last_contact': max(last_contacts).isoformat() if last_contacts else None
+        }
+    
+    def get_user_conversations(
+        self,
+        db: Session,
+        user_id: str,
+        limit: int = 10,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Страница обращений пользователя, от новых к старым
+        
+        Пагинация по ключу (timestamp, id): следующая страница начинается
+        сразу после последней строки предыдущей, без OFFSET. Из текста
+        сообщения читается только превью.
+        """
+        query = db.query(
+            Conversation.id,
+            func.substr(Conversation.user_message, 1, PREVIEW_LENGTH + 1).label('message'),
+            Conversation.category,
+            Conversation.timestamp
+        ).filter(
+            Conversation.user_id == user_id,
+            Conversation.timestamp.isnot(None)
+        )
+        if cursor:
+            timestamp, conversation_id = decode_cursor(cursor)
+            query = query.filter(
+                tuple_(Conversation.timestamp, Conversation.id) < tuple_(timestamp, conversation_id)
+            )
+        rows = query.order_by(
+            Conversation.timestamp.desc(), Conversation.id.desc()
+        ).limit(limit + 1).all()
+        
+        page = rows[:limit]
+        return {
+            'conversations': [
+                {
+                    'id': row.id,
+                    'message': row.message[:PREVIEW_LENGTH] + '...' if len(row.message) > PREVIEW_LENGTH else row.message,
+                    'category': row.category or 'general',
+                    'timestamp': row.timestamp.isoformat()
+                }
+                for row in page
+            ],
+            'next_cursor': encode_cursor(page[-1].timestamp, page[-1].id) if len(rows) > limit else None
         }
+    
+    def iter_user_conversation_batches(
+        self,
+        session_factory: Callable[[], Session],
+        user_id: str,
+        batch_size: int = 1000
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Полная история пользователя пачками, от старых к новым
+        
+        Каждая пачка - отдельный запрос по ключу (timestamp, id), поэтому
+        память не зависит от объема истории, а между пачками БД не держит
+        открытый курсор.
+        """
+        db = session_factory()
+        try:
+            after = None
+            while True:
+                batch, after = self._conversation_batch(db, user_id, after, batch_size)
+                if batch:
+                    yield batch
+                if after is None:
+                    return
+        finally:
+            db.close()
+    
+    async def aiter_user_conversation_batches(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        user_id: str,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """То же, что iter_user_conversation_batches, через асинхронную сессию"""
+        async with session_factory() as db:
+            after = None
+            while True:
+                batch, after = await db.run_sync(self._conversation_batch, user_id, after, batch_size)
+                if batch:
+                    yield batch
+                if after is None:
+                    return
+    
+    def _conversation_batch(
+        self,
+        db: Session,
+        user_id: str,
+        after: Optional[Tuple[datetime, int]],
+        batch_size: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, int]]]:
+        """Пачка обращений после ключа after и ключ следующей пачки (None в конце)"""
+        query = db.query(
+            Conversation.id,
+            Conversation.timestamp,
+            Conversation.category,
+            Conversation.user_message,
+            Conversation.bot_response,
+            Conversation.response_time_ms
+        ).filter(
+            Conversation.user_id == user_id,
+            Conversation.timestamp.isnot(None)
+        )
+        if after is not None:
+            query = query.filter(tuple_(Conversation.timestamp, Conversation.id) > tuple_(*after))
+        rows = query.order_by(
+            Conversation.timestamp, Conversation.id
+        ).limit(batch_size).all()
+        
+        batch = [
+            {
+                'id': row.id,
+                'timestamp': row.timestamp.isoformat(),
+                'category': row.category or 'general',
+                'user_message': row.user_message,
+                'bot_response': row.bot_response,
+                'response_time_ms': row.response_time_ms
+            }
+            for row in rows
+        ]
+        next_after = (rows[-1].timestamp, rows[-1].id) if len(rows) == batch_size else None
+        return batch, next_after
@@ -0,0 +1,341 @@
+import asyncio
+import gzip
+import itertools
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, tuple_
+from sqlalchemy.orm import Session
+
+from app.models.conversation import Conversation
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+# Колонки диалога в строке архива
+ARCHIVE_COLUMNS = [column.name for column in Conversation.__table__.columns]
+
+def _day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+def conversation_from_row(row: Dict[str, Any]) -> Conversation:
+    """Несохраняемый объект Conversation из строки архива (для пересчета счетчиков)"""
+    fields = dict(row)
+    fields['timestamp'] = datetime.fromisoformat(fields['timestamp'])
+    return Conversation(**fields)
+
+class ConversationArchive:
+    """Архив диалогов: по файлу gzip NDJSON на день
+
+    Файлы лежат в directory/ГГГГ/ММ/conversations-ГГГГ-ММ-ДД.ndjson.gz,
+    одна строка - один диалог со всеми колонками таблицы conversations.
+    Запись дня идет во временный файл с последующим переименованием,
+    поэтому читатели не видят недописанных файлов.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, day: date) -> str:
+        return os.path.join(
+            self.directory, f"{day:%Y}", f"{day:%m}", f"conversations-{day:%Y-%m-%d}.ndjson.gz"
+        )
+
+    def days(self) -> List[date]:
+        """Дни, за которые есть архив, по возрастанию"""
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith("conversations-") and name.endswith(".ndjson.gz"):
+                    try:
+                        result.append(date.fromisoformat(name[len("conversations-"):-len(".ndjson.gz")]))
+                    except ValueError:
+                        continue
+        return sorted(result)
+
+    def read_day(self, day: date) -> Iterator[Dict[str, Any]]:
+        path = self.path_for(day)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_rows(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        user_id: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Диалоги из архива за [start, end), по возрастанию дней
+
+        Читаются только файлы дней, пересекающих период.
+        """
+        for day in self.days():
+            if start is not None and _day_start(day) + timedelta(days=1) <= start:
+                continue
+            if end is not None and _day_start(day) >= end:
+                break
+            for row in self.read_day(day):
+                if user_id is not None and row['user_id'] != user_id:
+                    continue
+                if start is not None or end is not None:
+                    timestamp = datetime.fromisoformat(row['timestamp'])
+                    if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                        continue
+                yield row
+
+    def iter_batches(self, user_id: Optional[str] = None, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Диалоги из архива пачками (для передачи между потоками)"""
+        rows = self.iter_rows(user_id=user_id)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def write_day(self, day: date, rows: Iterator[Dict[str, Any]]) -> int:
+        """Запись строк дня с объединением с уже существующим файлом (без повторов по id)
+
+        Возвращает число строк в файле дня.
+        """
+        path = self.path_for(day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # Повторная запись дня (после сбоя) - редкий случай, объединяем в памяти
+            rows = sorted(
+                itertools.chain(self.read_day(day), rows),
+                key=lambda row: (row['timestamp'], row['id'])
+            )
+        tmp_path = f"{path}.tmp"
+        seen = set()
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+            for row in rows:
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return len(seen)
+
+    def iter_conversations(
+        self,
+        session_factory: Callable[[], Session],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        user_id: Optional[str] = None,
+        batch_size: int = 1000
+    ) -> Iterator[Dict[str, Any]]:
+        """Диалоги за [start, end) из архива и таблицы conversations
+
+        Сначала отдается архив (более старые дни), затем строки таблицы
+        пачками по ключу (timestamp, id); формат строк одинаковый.
+        """
+        yield from self.iter_rows(start, end, user_id)
+
+        db = session_factory()
+        try:
+            after = None
+            while True:
+                query = db.query(*[getattr(Conversation, name) for name in ARCHIVE_COLUMNS]).filter(
+                    Conversation.timestamp.isnot(None)
+                )
+                if start is not None:
+                    query = query.filter(Conversation.timestamp >= start)
+                if end is not None:
+                    query = query.filter(Conversation.timestamp < end)
+                if user_id is not None:
+                    query = query.filter(Conversation.user_id == user_id)
+                if after is not None:
+                    query = query.filter(tuple_(Conversation.timestamp, Conversation.id) > tuple_(*after))
+                rows = query.order_by(Conversation.timestamp, Conversation.id).limit(batch_size).all()
+                for row in rows:
+                    item = dict(row._mapping)
+                    item['timestamp'] = item['timestamp'].isoformat()
+                    yield item
+                if len(rows) < batch_size:
+                    return
+                after = (rows[-1].timestamp, rows[-1].id)
+        finally:
+            db.close()
+
+class ConversationArchiver:
+    """Перенос старых диалогов из таблицы conversations в архив
+
+    Переносятся целые дни старше retention_days. День сначала
+    записывается в архив, затем его строки удаляются из таблицы одной
+    транзакцией; если процесс прервется между этими шагами, следующий
+    запуск перезапишет файл дня без повторов. Счетчики статистики
+    (stats_*) не уменьшаются, поэтому аналитика за весь период остается
+    верной, а таблица хранит только последние retention_days дней.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        archive: ConversationArchive,
+        retention_days: int,
+        batch_size: int = 1000
+    ):
+        self.session_factory = session_factory
+        self.archive = archive
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"runs": 0, "archived": 0, "days": 0, "last_run": None}
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        """Граница переноса: начало дня retention_days дней назад"""
+        today = (now or datetime.utcnow()).date()
+        return _day_start(today - timedelta(days=self.retention_days))
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Перенос всех дней до границы; возвращает число дней и строк
+
+        При нескольких процессах одновременно переносит только один:
+        остальные пропускают запуск.
+        """
+        with self._lock() as acquired:
+            if not acquired:
+                return {"days": 0, "archived": 0}
+            cutoff = self.cutoff(now)
+            days = archived = 0
+            for day in self._days_before(cutoff):
+                archived += self._archive_day(day)
+                days += 1
+
+        self._stats["runs"] += 1
+        self._stats["archived"] += archived
+        self._stats["days"] += days
+        self._stats["last_run"] = datetime.utcnow().isoformat()
+        return {"days": days, "archived": archived}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"retention_days": self.retention_days, "archive_days": len(self.archive.days()), **self._stats}
+
+    def start(self, interval: float):
+        """Периодический перенос в фоне (внутри работающего event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_periodically(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_periodically(self, interval: float):
+        while True:
+            try:
+                result = await asyncio.to_thread(self.run)
+                if result["archived"]:
+                    print(f"Перенесено в архив диалогов: {result['archived']} (дней: {result['days']})")
+            except Exception as e:
+                print(f"Ошибка переноса диалогов в архив: {e}")
+            await asyncio.sleep(interval)
+
+    def _days_before(self, cutoff: datetime) -> List[date]:
+        """Дни со строками старше границы"""
+        db = self.session_factory()
+        try:
+            days = set()
+            # Дни перебираются от самой старой строки: запрос min по индексу timestamp
+            oldest = db.query(Conversation.timestamp).filter(
+                Conversation.timestamp < cutoff
+            ).order_by(Conversation.timestamp).limit(1).scalar()
+            day = oldest.date() if oldest is not None else None
+            while day is not None and _day_start(day) < cutoff:
+                days.add(day)
+                following = db.query(Conversation.timestamp).filter(
+                    Conversation.timestamp >= _day_start(day) + timedelta(days=1),
+                    Conversation.timestamp < cutoff
+                ).order_by(Conversation.timestamp).limit(1).scalar()
+                day = following.date() if following is not None else None
+            return sorted(days)
+        finally:
+            db.close()
+
+    def _archive_day(self, day: date) -> int:
+        start = _day_start(day)
+        end = start + timedelta(days=1)
+        db = self.session_factory()
+        try:
+            moved = {"count": 0, "last": None}
+
+            def rows():
+                while True:
+                    query = db.query(Conversation).filter(
+                        Conversation.timestamp >= start,
+                        Conversation.timestamp < end
+                    )
+                    if moved["last"] is not None:
+                        query = query.filter(tuple_(Conversation.timestamp, Conversation.id) > tuple_(*moved["last"]))
+                    batch = query.order_by(Conversation.timestamp, Conversation.id).limit(self.batch_size).all()
+                    if not batch:
+                        return
+                    for conversation in batch:
+                        row = {name: getattr(conversation, name) for name in ARCHIVE_COLUMNS}
+                        row['timestamp'] = row['timestamp'].isoformat()
+                        yield row
+                    moved["count"] += len(batch)
+                    moved["last"] = (batch[-1].timestamp, batch[-1].id)
+                    db.expunge_all()
+
+            self.archive.write_day(day, rows())
+            if moved["last"] is None:
+                return 0
+            # Удаляются только записанные в архив строки (до последнего ключа пачек)
+            db.execute(delete(Conversation).where(
+                Conversation.timestamp >= start,
+                Conversation.timestamp < end,
+                tuple_(Conversation.timestamp, Conversation.id) <= tuple_(*moved["last"])
+            ))
+            db.commit()
+            return moved["count"]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _lock(self):
+        return _DirectoryLock(os.path.join(self.archive.directory, ".lock"))
+
+class _DirectoryLock:
+    """Неблокирующая межпроцессная блокировка на файле (flock)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self) -> bool:
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "w")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
@@ -1,107 +1,315 @@
-from openai import OpenAI
 import asyncio
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional
 import re
+import time
 from datetime import datetime
 
 from app.config import settings
+from app.services.classifier import Classification, MessageClassifier
+from app.services.intent_router import ROUTE_KB, ROUTE_KB_POLISH, ROUTE_LLM, IntentRouter
+from app.services.knowledge_base import KnowledgeBase, Passage
+from app.services.llm_router import (
+    CircuitBreaker, LLMBackend, LLMRouter, NoBackendAvailable, api_key_for, create_backend, parse_backends
+)
+from app.services.latency import StageTimer
+from app.services.metrics import (
+    chat_routes_total, classifier_categories_total, observe_llm_call, record_llm_usage
+)
+from app.services.response_cache import ResponseCache, normalize_message
+from app.services.single_flight import SingleFlight
 
 class ChatbotService:
     """Сервис для работы с ИИ чат-ботом"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-        self.knowledge_base = self._load_knowledge_base()
-    
-    def _load_knowledge_base(self) -> Dict[str, str]:
-        """Загрузка базы знаний для стандартных ответов"""
-        return {
-            "password": """
-Для сброса пароля:
-1. Перейдите на страницу https://password-reset.company.com
-2. Введите ваш рабочий email
-3. Проверьте почту и следуйте инструкциям
-4. Если письмо не пришло, проверьте папку "Спам"
-5. При проблемах обратитесь к системному администратору
-
-Требования к паролю:
-- Минимум 8 символов
-- Должен содержать заглавные и строчные буквы
-- Должен содержать цифры
-- Должен содержать специальные символы
-            """,
-            
-            "access": """
-Для получения доступа к папке:
-1. Определите полный путь к нужной папке
-2. Обратитесь к вашему руководителю для подтверждения необходимости доступа
-3. Отправьте заявку через ServiceDesk с указанием:
-   - Полного пути к папке
-   - Типа доступа (чтение/запись)
-   - Бизнес-обоснования
-4. Ожидайте обработки заявки (обычно 1-2 рабочих дня)
-            """,
+        self.llm_router = self._create_llm_router()
+        # Ограничение числа одновременных запросов к LLM
+        self._llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._llm_in_flight = 0
+        self.knowledge_base = KnowledgeBase(
+            settings.KNOWLEDGE_BASE_DIR,
+            index_path=settings.KNOWLEDGE_BASE_INDEX_PATH or None,
+            passage_chars=settings.KNOWLEDGE_BASE_PASSAGE_CHARS,
+            reload_interval=settings.KNOWLEDGE_BASE_RELOAD_INTERVAL
+        )
+        self.classifier = MessageClassifier()
+        self.intent_router = IntentRouter(
+            self.knowledge_base,
+            threshold=settings.FAST_PATH_CONFIDENCE,
+            polish_followups=settings.FAST_PATH_POLISH_FOLLOWUPS,
+            top_k=settings.KNOWLEDGE_BASE_TOP_K
+        ) if settings.FAST_PATH_ENABLED else None
+        self.response_cache = ResponseCache(
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.RESPONSE_CACHE_TTL,
+            similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY,
+            persist_path=settings.RESPONSE_CACHE_PATH or None
+        ) if settings.RESPONSE_CACHE_ENABLED else None
+        self.single_flight = SingleFlight(
+            window=settings.LLM_COALESCE_WINDOW_MS / 1000
+        ) if settings.LLM_COALESCE_ENABLED else None
+    
+    @property
+    def client(self):
+        """Клиент первого бэкенда LLM (None, если LLM не настроена)"""
+        return self.llm_router.backends[0].client if self.llm_router is not None else None
+    
+    @client.setter
+    def client(self, client):
+        """Замена всех бэкендов одним клиентом с моделью OPENAI_MODEL (например, в тестах)"""
+        self.llm_router = LLMRouter(
+            [LLMBackend("default", client, settings.OPENAI_MODEL)]
+        ) if client is not None else None
+    
+    @property
+    def llm_in_flight(self) -> int:
+        """Число запросов к LLM, занявших слот LLM_MAX_CONCURRENCY"""
+        return self._llm_in_flight
+    
+    async def aclose(self):
+        """Закрытие пулов HTTP-соединений"""
+        if self.llm_router is not None:
+            await self.llm_router.aclose()
+    
+    def _create_llm_router(self) -> Optional[LLMRouter]:
+        """Бэкенды LLM из LLM_BACKENDS или один бэкенд из настроек OPENAI_*"""
+        if settings.LLM_BACKENDS:
+            specs = parse_backends(settings.LLM_BACKENDS)
+        elif settings.OPENAI_API_KEY:
+            specs = [{"name": "default", "base_url": settings.OPENAI_BASE_URL or "",
+                      "model": settings.OPENAI_MODEL, "api_key_env": ""}]
+        else:
+            return None
+        backends = [
+            create_backend(
+                spec["name"],
+                spec["base_url"],
+                spec["model"],
+                api_key=api_key_for(spec, settings.OPENAI_API_KEY),
+                timeout=settings.DEFAULT_RESPONSE_TIMEOUT,
+                max_retries=settings.LLM_MAX_RETRIES,
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS),
+                alpha=settings.LLM_EWMA_ALPHA
+            )
+            for spec in specs
+        ]
+        return LLMRouter(
+            backends,
+            timeout=settings.DEFAULT_RESPONSE_TIMEOUT,
+            hedge=settings.LLM_HEDGE_ENABLED,
+            hedge_delay=settings.LLM_HEDGE_MIN_DELAY_MS / 1000
+        )
+    
+    async def get_response(
+        self,
+        message: str,
+        user_id: str = "anonymous",
+        classification: Optional[Classification] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        timer: Optional[StageTimer] = None,
+        route: Optional[str] = None
+    ) -> str:
+        """Получение ответа от ИИ
+        
+        classification можно передать, если сообщение уже классифицировано
+        вызывающей стороной, чтобы не повторять классификацию; так же и
+        route - способ ответа, уже выбранный вызывающей стороной.
+        history - предыдущие сообщения диалога в формате chat completions.
+        В timer записывается время этапов kb, cache и llm.
+        """
+        timer = timer or StageTimer()
+        # Классифицируем сообщение
+        if classification is None:
+            classification = self.classify(message)
+        category = classification.category
+        if route is None:
+            route = self.route(classification, history)
+        if route == ROUTE_KB:
+            with timer.stage("kb"):
+                return self.intent_router.render(message, category)
+        kb_version = self.knowledge_base_version(category)
+        # Ответ на уточняющий вопрос зависит от контекста - такие ответы не кэшируются
+        use_cache = self.response_cache is not None and not history
+        
+        if use_cache:
+            with timer.stage("cache"):
+                cached = await self.response_cache.aget(message, category, kb_version)
+            if cached is not None:
+                return cached
+        
+        # Для доработки LLM ответ из базы знаний готов заранее и служит резервным
+        answer = None
+        try:
+            if route == ROUTE_KB_POLISH:
+                with timer.stage("kb"):
+                    answer = self.intent_router.render(message, category)
+                system_prompt = self._build_polish_prompt(answer)
+            else:
+                system_prompt = self._build_system_prompt(category, message)
             
-            "documents": """
-Для отправки документов:
-1. Используйте корпоративную систему документооборота
-2. Убедитесь, что документ в поддерживаемом формате (PDF, DOC, DOCX)
-3. Проверьте размер файла (максимум 10 МБ)
-4. Укажите получателей и тему
-5. При необходимости установите уровень конфиденциальности
-
-Если документ не отправляется:
-- Проверьте интернет-соединение
-- Убедитесь, что файл не поврежден
-- Попробуйте уменьшить размер файла
-            """,
+            if self.llm_router is None:
+                return answer or self._get_fallback_response(message, category)
+                
+            with timer.stage("llm"):
+                if self.single_flight is not None and not history:
+                    # Одинаковые вопросы без контекста (например, при массовом сбое)
+                    # получают ответ одного общего запроса, в том числе его ошибку
+                    key = (normalize_message(message), category, kb_version)
+                    response = await self.single_flight.do(
+                        key, lambda: self._timed_completion(system_prompt, message)
+                    )
+                else:
+                    response = await self._timed_completion(system_prompt, message, history)
             
-            "connection": """
-Проблемы с подключением:
-1. Проверьте кабель Ethernet или Wi-Fi соединение
-2. Перезагрузите сетевое оборудование
-3. Проверьте настройки прокси-сервера
-4. Убедитесь, что антивирус не блокирует соединение
-5. Попробуйте подключиться к другой сети
-
-Для VPN подключения:
-- Используйте корпоративный VPN клиент
-- Введите ваши учетные данные
-- При проблемах обратитесь к сетевому администратору
-            """,
+            # Кэшируются только ответы модели, резервные ответы - нет
+            if use_cache:
+                await self.response_cache.aset(message, category, response, kb_version)
+            return response
             
-            "software": """
-Установка программного обеспечения:
-1. Проверьте список разрешенного ПО в корпоративном каталоге
-2. Подайте заявку через ServiceDesk
-3. Укажите бизнес-обоснование для установки
-4. Дождитесь одобрения от ИТ-службы
-5. ПО будет установлено удаленно или вам будут предоставлены инструкции
-
-Обновление ПО происходит автоматически через корпоративную систему управления.
-            """
-        }
+        except asyncio.TimeoutError:
+            print(f"Превышено время ожидания ответа OpenAI ({settings.DEFAULT_RESPONSE_TIMEOUT} с)")
+            return answer or self._get_fallback_response(message, category)
+        except NoBackendAvailable:
+            # Все бэкенды отключены автоматом - резервный ответ без ожидания
+            return answer or self._get_fallback_response(message, category)
+        except Exception as e:
+            print(f"Ошибка при обращении к OpenAI: {e}")
+            return answer or self._get_fallback_response(message, category)
     
-    async def get_response(self, message: str, user_id: str = "anonymous") -> str:
-        """Получение ответа от ИИ"""
+    async def stream_response(
+        self,
+        message: str,
+        user_id: str = "anonymous",
+        classification: Optional[Classification] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        timer: Optional[StageTimer] = None
+    ) -> AsyncIterator[str]:
+        """Потоковое получение ответа от ИИ по частям
+        
+        Части отдаются по мере генерации моделью. Если ошибка или таймаут
+        случились до первой части, отдается резервный ответ целиком, как
+        и ответ из базы знаний без LLM. Этапом llm в timer считается время до первой части ответа модели.
+        """
+        timer = timer or StageTimer()
+        if classification is None:
+            classification = self.classify(message)
+        category = classification.category
+        route = self.route(classification, history)
+        if route == ROUTE_KB:
+            with timer.stage("kb"):
+                answer = self.intent_router.render(message, category)
+            yield answer
+            return
+        kb_version = self.knowledge_base_version(category)
+        # Ответ на уточняющий вопрос зависит от контекста - такие ответы не кэшируются
+        use_cache = self.response_cache is not None and not history
+        
+        if use_cache:
+            with timer.stage("cache"):
+                cached = await self.response_cache.aget(message, category, kb_version)
+            if cached is not None:
+                yield cached
+                return
+        
+        answer = None
+        if route == ROUTE_KB_POLISH:
+            with timer.stage("kb"):
+                answer = self.intent_router.render(message, category)
+            system_prompt = self._build_polish_prompt(answer)
+        else:
+            system_prompt = self._build_system_prompt(category, message)
+        
+        if self.llm_router is None:
+            yield answer or self._get_fallback_response(message, category)
+            return
+        
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + settings.DEFAULT_RESPONSE_TIMEOUT
+        parts = []
+        outcome = "cancelled"
         try:
-            # Классифицируем сообщение
-            category = self.classify_message(message)
-            
-            # Если есть готовый ответ в базе знаний, используем его
-            if category in self.knowledge_base:
-                base_answer = self.knowledge_base[category]
-                # Используем ИИ для персонализации ответа
-                system_prompt = f"""
-Ты - помощник ИТ-поддержки. У тебя есть стандартный ответ на вопрос пользователя, 
-но ты должен адаптировать его под конкретный вопрос, сделать более персональным и дружелюбным.
+            # Таймаут общий на ожидание слота, первый токен и всю генерацию
+            await asyncio.wait_for(self._llm_semaphore.acquire(), timeout=deadline - loop.time())
+            self._llm_in_flight += 1
+            chunks = self.llm_router.stream(
+                messages=self._build_messages(system_prompt, message, history),
+                max_tokens=500,
+                temperature=0.7
+            )
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        if not parts:
+                            timer.record("llm", (loop.time() - started) * 1000)
+                        parts.append(delta)
+                        yield delta
+                outcome = "ok"
+            finally:
+                await chunks.aclose()
+                self._llm_in_flight -= 1
+                self._llm_semaphore.release()
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            print(f"Превышено время ожидания ответа OpenAI ({settings.DEFAULT_RESPONSE_TIMEOUT} с)")
+            if not parts:
+                timer.record("llm", (loop.time() - started) * 1000)
+                yield answer or self._get_fallback_response(message, category)
+            return
+        except NoBackendAvailable:
+            outcome = "unavailable"
+            yield answer or self._get_fallback_response(message, category)
+            return
+        except Exception as e:
+            outcome = "error"
+            print(f"Ошибка при обращении к OpenAI: {e}")
+            if not parts:
+                yield answer or self._get_fallback_response(message, category)
+            return
+        finally:
+            # Длительность всей генерации; usage в потоковом режиме API не возвращает
+            observe_llm_call(outcome, loop.time() - started)
+        
+        if use_cache and parts:
+            await self.response_cache.aset(message, category, "".join(parts).strip(), kb_version)
+    
+    def _build_messages(
+        self,
+        system_prompt: str,
+        message: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """Сообщения для запроса к модели"""
+        return [
+            {"role": "system", "content": system_prompt},
+            *(history or []),
+            {"role": "user", "content": message}
+        ]
+    
+    def _build_system_prompt(self, category: str, message: str) -> str:
+        """Системный промпт с релевантными фрагментами базы знаний"""
+        passages = self.find_passages(message, category)
+        if passages:
+            context = "\n\n".join(f"[{passage.title}]\n{passage.text}" for passage in passages)
+            # Используем ИИ для персонализации ответа
+            return f"""
+Ты - помощник ИТ-поддержки. Ниже фрагменты базы знаний, относящиеся к вопросу пользователя.
+Опирайся на них, адаптируй ответ под конкретный вопрос, сделай его персональным и дружелюбным.
 
-Стандартный ответ: {base_answer}
+Фрагменты базы знаний:
+{context}
 
 Ответь на русском языке, будь вежливым и профессиональным.
 """
-            else:
-                system_prompt = """
+        else:
+            return """
 Ты - опытный специалист ИТ-поддержки в российской компании. 
 Твоя задача - помочь пользователям решить их технические проблемы.
 
@@ -113,55 +321,122 @@ class ChatbotService:
 
 Если не можешь решить проблему, предложи обратиться к специалисту ИТ-поддержки.
 """
-            
-            if not self.client:
-                return self._get_fallback_response(message)
-                
-            response = self.client.chat.completions.create(
-                model=settings.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            print(f"Ошибка при обращении к OpenAI: {e}")
-            return self._get_fallback_response(message)
     
-    def classify_message(self, message: str) -> str:
-        """Классификация сообщения по категориям"""
-        message_lower = message.lower()
+    def _build_polish_prompt(self, answer: str) -> str:
+        """Системный промпт для доработки готового ответа из базы знаний"""
+        return f"""
+Ты - помощник ИТ-поддержки. Пользователь задает уточняющий вопрос. Ниже готовый ответ из базы знаний по его теме.
+Доработай этот ответ с учетом вопроса и предыдущих сообщений: оставь то, что относится к вопросу,
+и не добавляй сведений, которых в нем нет.
+
+Ответ из базы знаний:
+{answer}
+
+Ответь на русском языке, будь вежливым и профессиональным.
+"""
+    
+    def find_passages(self, message: str, category: str) -> List[Passage]:
+        """Самые релевантные вопросу фрагменты базы знаний
         
-        password_keywords = ["пароль", "password", "забыл", "сброс", "reset", "войти", "логин"]
-        access_keywords = ["доступ", "папка", "файл", "права", "разрешение", "access", "folder"]
-        document_keywords = ["документ", "отправить", "файл", "прикрепить", "загрузить", "document"]
-        connection_keywords = ["подключение", "интернет", "сеть", "vpn", "wi-fi", "wifi", "connection"]
-        software_keywords = ["программа", "установить", "обновить", "софт", "приложение", "software"]
+        Если у категории есть статьи, поиск ведется по ним, иначе по всей базе.
+        """
+        return self.knowledge_base.search(
+            message,
+            k=settings.KNOWLEDGE_BASE_TOP_K,
+            category=category if category in self.knowledge_base else None
+        )
+    
+    def knowledge_base_version(self, category: str) -> str:
+        """Версия статей базы знаний (хэш текста) для инвалидации кэша ответов"""
+        return self.knowledge_base.version(category)
+    
+    async def _timed_completion(
+        self,
+        system_prompt: str,
+        message: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """Запрос к LLM с общим таймаутом и учетом в метриках
+        
+        Общий таймаут включает ожидание свободного слота в пуле.
+        """
+        llm_started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await asyncio.wait_for(
+                self._create_completion(system_prompt, message, history),
+                timeout=settings.DEFAULT_RESPONSE_TIMEOUT
+            )
+            outcome = "ok"
+            return response
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        except NoBackendAvailable:
+            outcome = "unavailable"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            observe_llm_call(outcome, time.perf_counter() - llm_started)
+    
+    async def _create_completion(
+        self,
+        system_prompt: str,
+        message: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """Запрос к LLM через маршрутизатор бэкендов с ограничением параллельности"""
+        async with self._llm_semaphore:
+            self._llm_in_flight += 1
+            try:
+                response = await self.llm_router.complete(
+                    messages=self._build_messages(system_prompt, message, history),
+                    max_tokens=500,
+                    temperature=0.7
+                )
+            finally:
+                self._llm_in_flight -= 1
         
-        if any(keyword in message_lower for keyword in password_keywords):
-            return "password"
-        elif any(keyword in message_lower for keyword in access_keywords):
-            return "access"
-        elif any(keyword in message_lower for keyword in document_keywords):
-            return "documents"
-        elif any(keyword in message_lower for keyword in connection_keywords):
-            return "connection"
-        elif any(keyword in message_lower for keyword in software_keywords):
-            return "software"
+        record_llm_usage(getattr(response, "usage", None))
+        return response.choices[0].message.content.strip()
+    
+    def classify(self, message: str) -> Classification:
+        """Классификация сообщения с оценкой уверенности"""
+        classification = self.classifier.classify(message)
+        classifier_categories_total.labels(classification.category).inc()
+        return classification
+    
+    def route(self, classification: Classification, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Способ ответа: из базы знаний без LLM, с доработкой LLM или запрос к LLM"""
+        if self.intent_router is None:
+            route = ROUTE_LLM
         else:
-            return "general"
+            route = self.intent_router.route(classification, history)
+        chat_routes_total.labels(route).inc()
+        return route
+    
+    def degraded_response(self, message: str, category: str) -> str:
+        """Ответ без LLM при перегрузке: по шаблону из базы знаний или резервный"""
+        if self.intent_router is not None and category in self.knowledge_base:
+            return self.intent_router.render(message, category)
+        return self._get_fallback_response(message, category)
     
-    def _get_fallback_response(self, message: str) -> str:
+    def classify_message(self, message: str) -> str:
+        """Классификация сообщения по категориям"""
+        return self.classify(message).category
+    
+    def _get_fallback_response(self, message: str, category: Optional[str] = None) -> str:
         """Резервный ответ если ИИ недоступен"""
-        category = self.classify_message(message)
+        if category is None:
+            category = self.classify_message(message)
         
         if category in self.knowledge_base:
-            return f"Вот информация по вашему вопросу:\n\n{self.knowledge_base[category]}"
+            # Только фрагменты статей категории, а если совпадений нет - статьи целиком
+            passages = self.find_passages(message, category)
+            context = "\n\n".join(passage.text for passage in passages) or self.knowledge_base[category]
+            return f"Вот информация по вашему вопросу:\n\n{context}"
         
         return """
 Извините, в данный момент я не могу обработать ваш запрос. 
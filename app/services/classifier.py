@@ -0,0 +1,128 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+# Ключевые слова по категориям с весами. Окончание "*" означает основу слова
+# ("парол*" совпадает с "пароль", "пароля", "паролем"), без него - слово целиком.
+# Порядок категорий задает приоритет при равенстве баллов.
+CATEGORY_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "password": {
+        "парол*": 3.0, "password": 3.0, "логин*": 2.0, "сброс*": 2.0, "reset": 2.0,
+        "учетн*": 1.5, "заблокир*": 1.5, "войти": 1.5, "вход*": 1.0, "забыл*": 1.0
+    },
+    "access": {
+        "доступ*": 3.0, "access": 3.0, "папк*": 2.0, "folder": 2.0, "права": 1.5,
+        "прав": 1.5, "разрешени*": 1.5, "диск*": 1.0, "файл*": 0.5
+    },
+    "documents": {
+        "документ*": 3.0, "document": 3.0, "прикреп*": 2.0, "вложени*": 2.0,
+        "отправ*": 1.5, "загруз*": 1.5, "pdf": 1.5, "docx": 1.5, "файл*": 1.0
+    },
+    "connection": {
+        "интернет*": 3.0, "vpn": 3.0, "wi-fi": 3.0, "wifi": 3.0, "вайфай": 3.0,
+        "подключ*": 2.0, "connection": 2.0, "сеть": 2.0, "сети": 2.0, "сетев*": 2.0,
+        "прокси": 1.5
+    },
+    "software": {
+        "софт*": 3.0, "software": 3.0, "программ*": 2.0, "приложени*": 2.0,
+        "установ*": 2.0, "обнов*": 1.5, "лицензи*": 1.5
+    }
+}
+
+# Сумма баллов, начиная с которой категория считается однозначной
+CONFIDENT_SCORE = 3.0
+
+@dataclass(frozen=True)
+class Classification:
+    """Результат классификации сообщения"""
+
+    category: str
+    confidence: float = 0.0
+    scores: Dict[str, float] = field(default_factory=dict)
+
+class MessageClassifier:
+    """Классификатор сообщений по категориям
+
+    Все ключевые слова собираются в префиксное дерево и компилируются
+    в одно регулярное выражение, поэтому сообщение просматривается за
+    один проход движком re. Категория выбирается по сумме весов
+    совпавших ключевых слов.
+    """
+
+    def __init__(self, keywords: Dict[str, Dict[str, float]] = None):
+        self.keywords = keywords or CATEGORY_KEYWORDS
+        self.categories = list(self.keywords)
+        self._priority = {category: -i for i, category in enumerate(self.categories)}
+        self._words: Dict[str, Tuple[int, List[Tuple[str, float]]]] = {}
+        self._stems: Dict[str, Tuple[int, List[Tuple[str, float]]]] = {}
+        self._compile()
+
+    def _compile(self):
+        """Построение регулярного выражения и таблиц поиска
+
+        Каждому ключевому слову присваивается номер, чтобы повторы одного
+        слова в сообщении не увеличивали балл. Одно слово может давать
+        баллы нескольким категориям.
+        """
+        ids: Dict[str, int] = {}
+        trie: Dict[str, dict] = {}
+        for category, words in self.keywords.items():
+            for word, weight in words.items():
+                word = word.lower()
+                is_stem = word.endswith("*")
+                key = word.rstrip("*")
+                table = self._stems if is_stem else self._words
+                ids.setdefault(word, len(ids))
+                table.setdefault(key, (ids[word], []))[1].append((category, weight))
+
+                node = trie
+                for char in key:
+                    node = node.setdefault(char, {})
+                node[""] = "stem" if is_stem else "word"
+
+        # Длины основ по убыванию: для совпадения проверяются только они
+        self._stem_lengths = sorted({len(stem) for stem in self._stems}, reverse=True)
+        self._pattern = re.compile(r"(?<!\w)" + self._trie_pattern(trie))
+
+    def _trie_pattern(self, node: dict) -> str:
+        """Регулярное выражение для узла префиксного дерева"""
+        ending = {"stem": r"\w*", "word": r"(?!\w)"}.get(node.get(""))
+        branches = [
+            re.escape(char) + self._trie_pattern(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ending
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Сначала более длинные продолжения, затем окончание текущего слова
+        return f"(?:{body}|{ending})" if ending else body
+
+    def classify(self, message: str) -> Classification:
+        """Классификация сообщения за один проход"""
+        matched: Dict[int, List[Tuple[str, float]]] = {}
+
+        for token in self._pattern.findall(message.lower()):
+            hit = self._words.get(token)
+            if hit is not None:
+                matched[hit[0]] = hit[1]
+            for length in self._stem_lengths:
+                if length <= len(token):
+                    hit = self._stems.get(token[:length])
+                    if hit is not None:
+                        matched[hit[0]] = hit[1]
+
+        if not matched:
+            return Classification(category="general")
+
+        # Повторы одного слова не увеличивают балл
+        scores: Dict[str, float] = {}
+        for weights in matched.values():
+            for category, weight in weights:
+                scores[category] = scores.get(category, 0.0) + weight
+
+        category = max(scores, key=lambda c: (scores[c], self._priority[c]))
+        top = scores[category]
+        # Доля лидера среди всех баллов, с поправкой на слабые совпадения
+        confidence = top / sum(scores.values()) * min(1.0, top / CONFIDENT_SCORE)
+
+        return Classification(category=category, confidence=round(confidence, 3), scores=scores)
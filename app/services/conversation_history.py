@@ -0,0 +1,188 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.conversation import Conversation
+from app.services.statistics_store import utc_epoch
+
+# Накладные расходы на один ход сверх самих строк (кортеж, слот deque)
+TURN_OVERHEAD = 120
+
+# Пользователь по умолчанию общий для всех анонимных клиентов - историю не ведем
+ANONYMOUS_USER = "anonymous"
+
+# (время, вопрос пользователя, ответ бота)
+Turn = Tuple[float, str, str]
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (для русского текста ~3 символа на токен)"""
+    return len(text) // 3 + 1
+
+class _UserHistory:
+    """Кольцевой буфер последних ходов одного пользователя"""
+
+    __slots__ = ("turns", "size")
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.size = 0
+
+class ConversationHistoryStore:
+    """История диалогов пользователей в памяти
+
+    Для каждого пользователя хранится не больше max_turns последних ходов.
+    Число пользователей ограничено max_users, а общий объем - max_bytes:
+    при превышении вытесняются давно не писавшие пользователи (LRU).
+    Если пользователя нет в памяти, история загружается из БД одним
+    запросом по индексу user_id. Ходы старше max_age_seconds в контекст
+    не попадают.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_turns: int = 10,
+        max_users: int = 10000,
+        max_bytes: int = 64 * 2 ** 20,
+        max_tokens: int = 1500,
+        max_age_seconds: float = 3600
+    ):
+        self.session_factory = session_factory
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.max_age_seconds = max_age_seconds
+
+        self._users: "OrderedDict[str, _UserHistory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    async def get_messages(self, user_id: str) -> List[Dict[str, str]]:
+        """История пользователя в формате сообщений chat completions
+
+        Берутся самые свежие ходы, укладывающиеся в max_tokens.
+        """
+        if not self._enabled(user_id):
+            return []
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is not None:
+                self._users.move_to_end(user_id)
+                turns = list(history.turns)
+                self._stats["hits"] += 1
+        if history is None:
+            turns = await asyncio.to_thread(self._warm, user_id)
+        return self._to_messages(turns)
+
+    def append(self, user_id: str, message: str, response: str, timestamp: Optional[datetime] = None):
+        """Добавление хода в историю
+
+        Пользователь, которого нет в памяти, не добавляется: при следующем
+        обращении его история целиком загрузится из БД.
+        """
+        if not self._enabled(user_id):
+            return
+        moment = utc_epoch(timestamp) if timestamp is not None else time.time()
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is None:
+                return
+            self._users.move_to_end(user_id)
+            self._push(history, (moment, message, response))
+            self._evict()
+
+    def forget(self, user_id: str):
+        """Удаление истории пользователя из памяти"""
+        with self._lock:
+            history = self._users.pop(user_id, None)
+            if history is not None:
+                self._bytes -= history.size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Заполненность и счетчики"""
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "memory_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._stats["hits"],
+                "warm_queries": self._stats["warm_queries"],
+                "evictions": self._stats["evictions"]
+            }
+
+    def _enabled(self, user_id: str) -> bool:
+        return self.max_turns > 0 and bool(user_id) and user_id != ANONYMOUS_USER
+
+    def _warm(self, user_id: str) -> List[Turn]:
+        """Загрузка последних ходов пользователя из БД (в отдельном потоке)"""
+        db = self.session_factory()
+        try:
+            rows = db.query(
+                Conversation.timestamp, Conversation.user_message, Conversation.bot_response
+            ).filter(
+                Conversation.user_id == user_id
+            ).order_by(
+                Conversation.timestamp.desc(), Conversation.id.desc()
+            ).limit(self.max_turns).all()
+        finally:
+            db.close()
+        self._stats["warm_queries"] += 1
+
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is None:
+                # Пользователь без диалогов тоже запоминается, чтобы не повторять запрос
+                history = self._users[user_id] = _UserHistory(self.max_turns)
+                for timestamp, message, response in reversed(rows):
+                    moment = utc_epoch(timestamp) if timestamp is not None else 0.0
+                    self._push(history, (moment, message, response))
+                self._evict()
+            return list(history.turns)
+
+    def _push(self, history: _UserHistory, turn: Turn):
+        if len(history.turns) == history.turns.maxlen:
+            self._resize(history, -self._turn_size(history.turns[0]))
+        history.turns.append(turn)
+        self._resize(history, self._turn_size(turn))
+
+    def _resize(self, history: _UserHistory, delta: int):
+        history.size += delta
+        self._bytes += delta
+
+    def _turn_size(self, turn: Turn) -> int:
+        return sys.getsizeof(turn[1]) + sys.getsizeof(turn[2]) + TURN_OVERHEAD
+
+    def _evict(self):
+        """Вытеснение давно не писавших пользователей сверх лимитов"""
+        while self._users and (len(self._users) > self.max_users or self._bytes > self.max_bytes):
+            _, history = self._users.popitem(last=False)
+            self._bytes -= history.size
+            self._stats["evictions"] += 1
+
+    def _to_messages(self, turns: List[Turn]) -> List[Dict[str, str]]:
+        """Свежие ходы в пределах max_age_seconds и max_tokens"""
+        oldest = time.time() - self.max_age_seconds
+        budget = self.max_tokens
+        selected: List[Turn] = []
+        for turn in reversed(turns):
+            if turn[0] < oldest:
+                break
+            budget -= estimate_tokens(turn[1]) + estimate_tokens(turn[2])
+            if budget < 0:
+                break
+            selected.append(turn)
+
+        messages = []
+        for _, message, response in reversed(selected):
+            messages.append({"role": "user", "content": message})
+            messages.append({"role": "assistant", "content": response})
+        return messages
@@ -0,0 +1,227 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.conversation import Conversation
+from app.services.latency import LatencyRecorder
+from app.services.metrics import db_commit_seconds, db_session_checkout_seconds
+from app.services.statistics_store import StatisticsStore
+
+# Режимы надежности записи
+DURABILITY_ASYNC = "async"  # Ответ сразу после постановки в очередь
+DURABILITY_SYNC = "sync"  # Ответ после commit пачки, в которую попал диалог
+
+class ConversationWriter:
+    """Фоновая пакетная запись диалогов (write-behind)
+
+    Обработчики чата ставят диалоги в ограниченную очередь, а фоновая
+    задача записывает их пачками: один многострочный INSERT, обновление
+    счетчиков статистики и один commit на пачку. Пачка отправляется при
+    наборе batch_size записей или через flush_interval секунд после первой.
+    Запись выполняется в отдельном потоке, чтобы не блокировать event loop.
+
+    Неудачная запись пачки повторяется до max_retries раз с удвоением паузы
+    (начиная с retry_backoff секунд); пока идут повторы, очередь копится и
+    submit ждет места. Если пачка так и не записана, в режиме sync ошибка
+    передается вызывающим, а в режиме async диалоги теряются и учитываются
+    в счетчике dropped.
+
+    Если передан latency_recorder, в той же транзакции записываются
+    накопленные гистограммы времени этапов, а время от постановки в
+    очередь до commit учитывается как этап db_write.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        statistics_store: StatisticsStore,
+        batch_size: int = 200,
+        flush_interval: float = 0.05,
+        max_queue_size: int = 10000,
+        durability: str = DURABILITY_ASYNC,
+        latency_recorder: Optional[LatencyRecorder] = None,
+        max_retries: int = 3,
+        retry_backoff: float = 0.1
+    ):
+        if durability not in (DURABILITY_ASYNC, DURABILITY_SYNC):
+            raise ValueError(f"Неизвестный режим надежности записи: {durability}")
+        self.session_factory = session_factory
+        self.statistics_store = statistics_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.durability = durability
+        self.latency_recorder = latency_recorder
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stats = {
+            "written": 0, "batches": 0, "retries": 0, "failed": 0, "dropped": 0,
+            "max_batch": 0, "last_flush_ms": 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Запуск фоновой задачи записи (внутри работающего event loop)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с записью всего, что осталось в очереди"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+        if self.latency_recorder is not None and len(self.latency_recorder):
+            # Замеры db_write последней пачки
+            await asyncio.to_thread(self._write_batch, [])
+
+    async def submit(self, conversation: Conversation):
+        """Постановка диалога в очередь на запись
+
+        При заполненной очереди ожидает свободного места (backpressure).
+        В режиме sync дополнительно ожидает commit пачки и пробрасывает
+        ошибку записи вызывающему.
+        """
+        if conversation.timestamp is None:
+            conversation.timestamp = datetime.utcnow()
+        if not self.running:
+            # Фоновая запись не запущена (например, скрипт без event loop приложения)
+            started = time.perf_counter()
+            await asyncio.to_thread(self._write_batch, [conversation])
+            self._observe_write([(conversation, None, started)])
+            return
+
+        future = asyncio.get_running_loop().create_future() if self.durability == DURABILITY_SYNC else None
+        await self._queue.put((conversation, future, time.perf_counter()))
+        if future is not None:
+            await future
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние очереди и счетчики записи"""
+        return {
+            "durability": self.durability,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_capacity": self.max_queue_size,
+            **self._stats
+        }
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+
+            # Добираем пачку до batch_size или до истечения flush_interval
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Остановка: записываем все, что успели поставить в очередь
+        remaining_items = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                remaining_items.append(item)
+        for i in range(0, len(remaining_items), self.batch_size):
+            await self._flush(remaining_items[i:i + self.batch_size])
+
+    async def _flush(self, batch: List[Tuple[Conversation, Optional[asyncio.Future], float]]):
+        started = time.perf_counter()
+        conversations = [conversation for conversation, _, _ in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._write_batch, conversations)
+                break
+            except Exception as e:
+                if attempt < self.max_retries:
+                    self._stats["retries"] += 1
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+                    continue
+                # Без future (режим async) вызывающий об ошибке не узнает - диалоги потеряны
+                dropped = sum(1 for _, future, _ in batch if future is None)
+                self._stats["failed"] += len(batch)
+                self._stats["dropped"] += dropped
+                print(f"Ошибка пакетной записи диалогов ({len(batch)} шт., потеряно {dropped}) "
+                      f"после {attempt + 1} попыток: {e}")
+                for _, future, _ in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+                return
+
+        self._stats["written"] += len(batch)
+        self._stats["batches"] += 1
+        self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self._observe_write(batch)
+        for _, future, _ in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def _observe_write(self, batch: List[Tuple[Conversation, Optional[asyncio.Future], float]]):
+        """Учет времени от постановки в очередь до commit (этап db_write)"""
+        if self.latency_recorder is None:
+            return
+        committed = time.perf_counter()
+        for conversation, _, enqueued in batch:
+            self.latency_recorder.observe(
+                conversation.category,
+                {"db_write": (committed - enqueued) * 1000},
+                conversation.timestamp
+            )
+
+    def _write_batch(self, conversations: List[Conversation]):
+        """Запись пачки одной транзакцией (выполняется в отдельном потоке)"""
+        columns = [column.name for column in Conversation.__table__.columns if not column.primary_key]
+        rows = [{name: getattr(conversation, name) for name in columns} for conversation in conversations]
+
+        latency = self.latency_recorder.drain() if self.latency_recorder is not None else []
+        db = self.session_factory()
+        try:
+            started = time.perf_counter()
+            db.connection()
+            db_session_checkout_seconds.observe(time.perf_counter() - started)
+            if rows:
+                db.execute(insert(Conversation), rows)
+                self.statistics_store.record_many(db, conversations)
+            if latency:
+                self.statistics_store.record_latency(db, latency)
+            started = time.perf_counter()
+            db.commit()
+            db_commit_seconds.observe(time.perf_counter() - started)
+        except Exception:
+            db.rollback()
+            if latency:
+                self.latency_recorder.restore(latency)
+            raise
+        finally:
+            db.close()
@@ -0,0 +1,480 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.conversation import Conversation
+from app.models.ingest import IngestItem, IngestJob
+from app.services.intent_router import ROUTE_KB
+from app.services.statistics_store import StatisticsStore
+
+# Состояния задания и обращения
+JOB_LOADING = "loading"  # Входные данные еще принимаются
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+ITEM_PENDING = "pending"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+
+class LeaseLost(Exception):
+    """Задание перехватил другой процесс (аренда истекла)"""
+
+def parse_item(value: Any) -> Dict[str, Any]:
+    """Обращение из входных данных: объект или строка NDJSON
+
+    Некорректное обращение не прерывает загрузку: оно сохраняется с
+    текстом ошибки и попадает в результаты как failed.
+    """
+    if isinstance(value, (bytes, str)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {"external_id": None, "user_id": "anonymous", "message": "", "error": "Некорректный JSON"}
+    if not isinstance(value, dict):
+        return {"external_id": None, "user_id": "anonymous", "message": "", "error": "Ожидается JSON-объект"}
+    external_id = value.get("id")
+    item = {
+        "external_id": str(external_id) if external_id is not None else None,
+        "user_id": str(value.get("user_id") or "anonymous"),
+        "message": value.get("message") if isinstance(value.get("message"), str) else "",
+        "error": None
+    }
+    if not item["message"].strip():
+        item["error"] = "Пустое сообщение"
+    return item
+
+async def iter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Строки NDJSON из потока фрагментов тела запроса (пустые пропускаются)"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+class IngestService:
+    """Пакетная обработка обращений из почты и мессенджеров
+
+    Входные обращения сохраняются в ingest_items, затем задание
+    обрабатывается в фоне независимо от клиента:
+    1. страница ожидающих обращений классифицируется целиком;
+    2. уверенно классифицированные типовые вопросы получают ответ из базы
+       знаний сразу, остальные ждут одного из concurrency обработчиков
+       с запросом к LLM (кэш ответов и объединение одинаковых запросов
+       ChatbotService работают и здесь);
+    3. готовые результаты записываются пачками: диалоги, статистика,
+       статусы обращений и счетчики задания - одной транзакцией.
+
+    Задание принадлежит процессу, пока тот продлевает аренду. После
+    перезапуска незавершенные задания подхватываются фоновой задачей
+    (start) и продолжаются с необработанных обращений.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        chatbot_service,
+        statistics_store: StatisticsStore,
+        concurrency: int = 4,
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        max_items: int = 100000,
+        lease_seconds: float = 30
+    ):
+        self.session_factory = session_factory
+        self.chatbot_service = chatbot_service
+        self.statistics_store = statistics_store
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+
+        # Общий предел запросов к LLM для всех заданий процесса
+        self._llm_slots = asyncio.Semaphore(concurrency)
+        self._runners: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, asyncio.Event] = {}
+        # Число открытых results() по заданию: событие удаляется вместе с последним
+        self._readers = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = Counter()
+
+    async def create_job(self, items: AsyncIterable[Any], source: Optional[str] = None) -> Dict[str, Any]:
+        """Сохранение входных обращений и запуск задания
+
+        items - объекты или строки NDJSON; сохраняются пачками по мере
+        чтения. ValueError, если обращений больше max_items (задание
+        при этом удаляется).
+        """
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._insert_job, job_id, source)
+        rows, total = [], 0
+        try:
+            async for value in items:
+                total += 1
+                if total > self.max_items:
+                    raise ValueError(f"Больше {self.max_items} обращений в одном задании")
+                rows.append({"job_id": job_id, "seq": total, **parse_item(value)})
+                if len(rows) >= self.batch_size * 10:
+                    await asyncio.to_thread(self._insert_items, rows)
+                    rows = []
+            if rows:
+                await asyncio.to_thread(self._insert_items, rows)
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(self._delete_job, job_id))
+            raise
+        await asyncio.to_thread(self._start_job, job_id, total)
+        self._stats["jobs"] += 1
+        self._run(job_id)
+        return {"job_id": job_id, "total": total}
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._job, job_id)
+
+    async def results(self, job_id: str, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Готовые результаты задания после курсора after (номера result_no)
+
+        Пока задание выполняется, ожидает новые результаты; завершается,
+        когда выданы все результаты завершенного задания.
+        """
+        self._readers[job_id] += 1
+        try:
+            while True:
+                # Событие берется до чтения, чтобы не пропустить запись между ними
+                event = self._progress.setdefault(job_id, asyncio.Event())
+                rows = await asyncio.to_thread(self._results_after, job_id, after)
+                for row in rows:
+                    after = row["n"]
+                    yield row
+                if rows:
+                    continue
+                job = await asyncio.to_thread(self._job, job_id)
+                if job is None or job["status"] == JOB_DONE:
+                    # Последняя пачка записана вместе со сменой статуса
+                    for row in await asyncio.to_thread(self._results_after, job_id, after):
+                        yield row
+                    return
+                try:
+                    # Задание может выполнять и другой процесс - проверяем базу периодически
+                    await asyncio.wait_for(event.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Завершенное, неизвестное или брошенное читателем задание не оставляет событие
+            self._readers[job_id] -= 1
+            if not self._readers[job_id]:
+                del self._readers[job_id]
+                self._progress.pop(job_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"running": len(self._runners), "concurrency": self.concurrency, **self._stats}
+
+    def start(self):
+        """Фоновое продолжение незавершенных заданий (внутри работающего event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._resume_periodically())
+
+    async def stop(self):
+        """Остановка обработки; аренда снимается, чтобы задания сразу продолжил
+        следующий запущенный процесс"""
+        tasks = [task for task in (self._task, *self._runners.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
+        await asyncio.to_thread(self._release_leases)
+
+    async def resume(self) -> int:
+        """Захват заданий с истекшей арендой; возвращает число продолженных"""
+        resumed = 0
+        for job_id in await asyncio.to_thread(self._claim_orphaned):
+            self._run(job_id)
+            resumed += 1
+        self._stats["resumed"] += resumed
+        return resumed
+
+    def _run(self, job_id: str):
+        if job_id not in self._runners:
+            task = asyncio.create_task(self._run_job(job_id))
+            self._runners[job_id] = task
+            task.add_done_callback(lambda _: self._runners.pop(job_id, None))
+
+    async def _resume_periodically(self):
+        while True:
+            try:
+                resumed = await self.resume()
+                if resumed:
+                    print(f"Продолжено заданий загрузки обращений: {resumed}")
+            except Exception as e:
+                print(f"Ошибка продолжения заданий загрузки: {e}")
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _run_job(self, job_id: str):
+        job = await asyncio.to_thread(self._job, job_id)
+        if job is None:
+            return
+        results: asyncio.Queue = asyncio.Queue()
+        llm_queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        writer = asyncio.create_task(self._write_results(job_id, job["processed"], results))
+        workers = [asyncio.create_task(self._llm_worker(llm_queue, results)) for _ in range(self.concurrency)]
+        try:
+            after = 0
+            while not writer.done():
+                page = await asyncio.to_thread(self._pending_items, job_id, after, self.batch_size * 5)
+                if not page:
+                    break
+                after = page[-1]["seq"]
+                await self._dispatch(page, llm_queue, results)
+            for _ in workers:
+                await llm_queue.put(None)
+            await asyncio.gather(*workers)
+            await results.put(None)
+            await writer
+        except LeaseLost:
+            print(f"Задание загрузки {job_id} продолжает другой процесс")
+        except Exception as e:
+            print(f"Ошибка задания загрузки {job_id}: {e}")
+        finally:
+            for task in (writer, *workers):
+                task.cancel()
+            self._notify(job_id)
+
+    async def _dispatch(self, page: List[Dict[str, Any]], llm_queue: asyncio.Queue, results: asyncio.Queue):
+        """Классификация страницы обращений и ответ без LLM, где это возможно"""
+        for item in page:
+            if item["error"]:
+                await results.put({**item, "status": ITEM_FAILED, "category": None, "response": None})
+                continue
+            classification = self.chatbot_service.classify(item["message"])
+            route = self.chatbot_service.route(classification)
+            if route == ROUTE_KB:
+                response = await self.chatbot_service.get_response(
+                    item["message"], item["user_id"], classification, route=route
+                )
+                self._stats["kb"] += 1
+                await results.put(self._result(item, classification.category, response))
+            else:
+                await llm_queue.put((item, classification, route))
+
+    async def _llm_worker(self, llm_queue: asyncio.Queue, results: asyncio.Queue):
+        while True:
+            task = await llm_queue.get()
+            if task is None:
+                return
+            item, classification, route = task
+            try:
+                async with self._llm_slots:
+                    response = await self.chatbot_service.get_response(
+                        item["message"], item["user_id"], classification, route=route
+                    )
+            except Exception as e:
+                await results.put({**item, "status": ITEM_FAILED, "category": classification.category,
+                                   "response": None, "error": str(e)})
+                continue
+            self._stats["llm"] += 1
+            await results.put(self._result(item, classification.category, response))
+
+    def _result(self, item: Dict[str, Any], category: str, response: str) -> Dict[str, Any]:
+        return {**item, "status": ITEM_DONE, "category": category, "response": response, "error": None}
+
+    async def _write_results(self, job_id: str, processed: int, results: asyncio.Queue):
+        """Запись готовых результатов пачками по batch_size или flush_interval"""
+        finished = False
+        lease_renewed = time.monotonic()
+        while not finished:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    result = await asyncio.wait_for(results.get(), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+                if result is None:
+                    finished = True
+                    break
+                batch.append(result)
+            # Аренда продлевается с каждой пачкой, а при долгих ответах LLM - отдельно
+            if batch or finished or time.monotonic() - lease_renewed > self.lease_seconds / 3:
+                for number, result in enumerate(batch, start=processed + 1):
+                    result["result_no"] = number
+                await asyncio.to_thread(self._flush, job_id, batch, finished)
+                processed += len(batch)
+                lease_renewed = time.monotonic()
+                self._stats["processed"] += len(batch)
+                self._stats["failed"] += sum(1 for result in batch if result["status"] == ITEM_FAILED)
+                self._notify(job_id)
+
+    def _notify(self, job_id: str):
+        event = self._progress.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def _lease_until(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def _flush(self, job_id: str, batch: List[Dict[str, Any]], finished: bool):
+        """Результаты пачки, диалоги и счетчики задания одной транзакцией"""
+        db = self.session_factory()
+        try:
+            failed = sum(1 for result in batch if result["status"] == ITEM_FAILED)
+            values = {
+                "processed": IngestJob.processed + len(batch),
+                "failed": IngestJob.failed + failed,
+                "lease_until": self._lease_until()
+            }
+            if finished:
+                values.update(status=JOB_DONE, finished_at=datetime.utcnow(), lease_owner=None, lease_until=None)
+            claimed = db.execute(
+                update(IngestJob).where(IngestJob.id == job_id, IngestJob.lease_owner == self.owner).values(**values)
+            ).rowcount
+            if not claimed:
+                raise LeaseLost(job_id)
+            if batch:
+                db.execute(update(IngestItem), [
+                    {
+                        "job_id": job_id,
+                        "seq": result["seq"],
+                        "status": result["status"],
+                        "category": result["category"],
+                        "response": result["response"],
+                        "error": result["error"],
+                        "result_no": result["result_no"]
+                    }
+                    for result in batch
+                ])
+            timestamp = datetime.utcnow()
+            conversations = [
+                Conversation(
+                    user_id=result["user_id"],
+                    user_message=result["message"],
+                    bot_response=result["response"],
+                    timestamp=timestamp,
+                    category=result["category"]
+                )
+                for result in batch if result["status"] == ITEM_DONE
+            ]
+            if conversations:
+                columns = [column.name for column in Conversation.__table__.columns if not column.primary_key]
+                db.execute(insert(Conversation), [
+                    {name: getattr(conversation, name) for name in columns} for conversation in conversations
+                ])
+                self.statistics_store.record_many(db, conversations)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _insert_job(self, job_id: str, source: Optional[str]):
+        with self.session_factory() as db:
+            db.add(IngestJob(id=job_id, source=source, status=JOB_LOADING))
+            db.commit()
+
+    def _insert_items(self, rows: List[Dict[str, Any]]):
+        with self.session_factory() as db:
+            db.execute(insert(IngestItem), rows)
+            db.commit()
+
+    def _delete_job(self, job_id: str):
+        with self.session_factory() as db:
+            db.execute(delete(IngestItem).where(IngestItem.job_id == job_id))
+            db.execute(delete(IngestJob).where(IngestJob.id == job_id))
+            db.commit()
+
+    def _start_job(self, job_id: str, total: int):
+        with self.session_factory() as db:
+            db.execute(update(IngestJob).where(IngestJob.id == job_id).values(
+                status=JOB_RUNNING, total=total, lease_owner=self.owner, lease_until=self._lease_until()
+            ))
+            db.commit()
+
+    def _claim_orphaned(self) -> List[str]:
+        """Захват выполняющихся заданий без действующей аренды"""
+        now = datetime.utcnow()
+        claimed = []
+        with self.session_factory() as db:
+            candidates = db.execute(select(IngestJob.id).where(
+                IngestJob.status == JOB_RUNNING,
+                (IngestJob.lease_until.is_(None)) | (IngestJob.lease_until < now)
+            )).scalars().all()
+            for job_id in candidates:
+                # Условие повторяется в UPDATE: задание захватит только один процесс
+                result = db.execute(update(IngestJob).where(
+                    IngestJob.id == job_id,
+                    IngestJob.status == JOB_RUNNING,
+                    (IngestJob.lease_until.is_(None)) | (IngestJob.lease_until < now)
+                ).values(lease_owner=self.owner, lease_until=self._lease_until()))
+                db.commit()
+                if result.rowcount:
+                    claimed.append(job_id)
+        return claimed
+
+    def _release_leases(self):
+        with self.session_factory() as db:
+            db.execute(update(IngestJob).where(
+                IngestJob.lease_owner == self.owner, IngestJob.status == JOB_RUNNING
+            ).values(lease_owner=None, lease_until=None))
+            db.commit()
+
+    def _pending_items(self, job_id: str, after: int, limit: int) -> List[Dict[str, Any]]:
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(IngestItem.seq, IngestItem.external_id, IngestItem.user_id, IngestItem.message,
+                       IngestItem.error)
+                .where(IngestItem.job_id == job_id, IngestItem.seq > after, IngestItem.status == ITEM_PENDING)
+                .order_by(IngestItem.seq).limit(limit)
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def _job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.session_factory() as db:
+            job = db.get(IngestJob, job_id)
+            if job is None:
+                return None
+            return {
+                "job_id": job.id,
+                "source": job.source,
+                "status": job.status,
+                "total": job.total,
+                "processed": job.processed,
+                "failed": job.failed,
+                "created_at": job.created_at.isoformat() if job.created_at else None,
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None
+            }
+
+    def _results_after(self, job_id: str, after: int, limit: int = 500) -> List[Dict[str, Any]]:
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(IngestItem.result_no, IngestItem.seq, IngestItem.external_id, IngestItem.user_id,
+                       IngestItem.status, IngestItem.category, IngestItem.response, IngestItem.error)
+                .where(IngestItem.job_id == job_id, IngestItem.result_no > after)
+                .order_by(IngestItem.result_no).limit(limit)
+            ).all()
+        return [
+            {
+                "n": row.result_no,
+                "seq": row.seq,
+                "id": row.external_id,
+                "user_id": row.user_id,
+                "status": row.status,
+                "category": row.category,
+                "response": row.response,
+                "error": row.error
+            }
+            for row in rows
+        ]
@@ -0,0 +1,85 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from app.services.classifier import Classification
+from app.services.knowledge_base import KnowledgeBase, Passage
+
+# Способы ответа: из базы знаний по шаблону без LLM, из базы знаний
+# с доработкой LLM (уточняющие вопросы) и обычный запрос к LLM
+ROUTE_KB = "kb"
+ROUTE_KB_POLISH = "kb_polish"
+ROUTE_LLM = "llm"
+ROUTES = (ROUTE_KB, ROUTE_KB_POLISH, ROUTE_LLM)
+
+# Вступление ответа по категориям
+CATEGORY_INTROS: Dict[str, str] = {
+    "password": "Похоже, вам нужно восстановить доступ к учетной записи.",
+    "access": "Похоже, вам нужен доступ к ресурсу.",
+    "documents": "Похоже, у вас вопрос о работе с документами.",
+    "connection": "Похоже, у вас проблема с подключением к сети.",
+    "software": "Похоже, у вас вопрос об установке или обновлении программ."
+}
+DEFAULT_INTRO = "Вот что может помочь:"
+OUTRO = "Если это не помогло, напишите, что именно не получилось, - я подскажу, что делать дальше."
+
+class IntentRouter:
+    """Выбор способа ответа по уверенности классификатора
+
+    На типовые вопросы с уверенно определенной категорией, для которой
+    есть статьи, ответ собирается из фрагментов базы знаний по шаблону,
+    без запроса к LLM. Уточняющие вопросы (есть история диалога) с такой
+    же категорией отправляются в LLM только для доработки готового
+    ответа, если включено polish_followups. Остальное уходит в LLM.
+    """
+
+    def __init__(
+        self,
+        knowledge_base: KnowledgeBase,
+        threshold: float = 0.8,
+        polish_followups: bool = True,
+        top_k: int = 3
+    ):
+        self.knowledge_base = knowledge_base
+        self.threshold = threshold
+        self.polish_followups = polish_followups
+        self.top_k = top_k
+        self._stats = Counter()
+
+    def route(self, classification: Classification, history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Способ ответа (ROUTE_*) с учетом в статистике"""
+        if classification.confidence < self.threshold or classification.category not in self.knowledge_base:
+            route = ROUTE_LLM
+        elif history and self.polish_followups:
+            route = ROUTE_KB_POLISH
+        else:
+            route = ROUTE_KB
+        self._stats[route] += 1
+        return route
+
+    def render(self, message: str, category: str) -> str:
+        """Ответ из базы знаний по шаблону
+
+        В ответ попадают самые релевантные вопросу фрагменты статей
+        категории, под заголовками статей; если совпадений нет - статьи
+        категории целиком.
+        """
+        passages = self.knowledge_base.search(message, k=self.top_k, category=category)
+        body = self._format_passages(passages) if passages else self.knowledge_base[category]
+        intro = CATEGORY_INTROS.get(category, DEFAULT_INTRO)
+        return f"{intro}\n\n{body}\n\n{OUTRO}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Число ответов по способам и доля ответов без LLM"""
+        total = sum(self._stats.values())
+        return {
+            "threshold": self.threshold,
+            "routes": {route: self._stats[route] for route in ROUTES},
+            "skipped_llm_ratio": round(self._stats[ROUTE_KB] / total, 4) if total else 0.0
+        }
+
+    def _format_passages(self, passages: List[Passage]) -> str:
+        # Фрагменты одной статьи идут под общим заголовком
+        sections: Dict[str, List[str]] = {}
+        for passage in passages:
+            sections.setdefault(passage.title, []).append(passage.text)
+        return "\n\n".join(f"{title}:\n" + "\n\n".join(texts) for title, texts in sections.items())
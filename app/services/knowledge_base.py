@@ -0,0 +1,405 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Версия формата сохраненного индекса
+INDEX_FORMAT = 1
+
+# Параметры ранжирования BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Слова длиннее STEM_LENGTH обрезаются до основы: "пароль", "пароля"
+# и "паролем" дают один термин. Для русских окончаний этого достаточно.
+# Токены с цифрами не обрезаются.
+STEM_LENGTH = 5
+
+STOP_WORDS = frozenset("""
+а без в во вам вас ваш ваша ваше ваши все вы да для до если есть же за и из или
+к как ли мне мой на не нет но о об от по при с со так то у что это я
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+_FRONT_MATTER = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+_HEADING = re.compile(r"^#\s+(.+)$", re.MULTILINE)
+
+def tokenize(text: str) -> List[str]:
+    """Термины текста для индекса и запросов"""
+    terms = []
+    for token in _TOKEN.findall(text.lower().replace("ё", "е")):
+        if token in STOP_WORDS:
+            continue
+        # Коды ошибок, версии и имена с цифрами сохраняются целиком
+        terms.append(token[:STEM_LENGTH] if token.isalpha() else token)
+    return terms
+
+def split_passages(text: str, max_chars: int) -> List[str]:
+    """Разбиение статьи на фрагменты по абзацам
+
+    Соседние абзацы объединяются, пока фрагмент не длиннее max_chars.
+    Слишком длинный абзац делится по строкам.
+    """
+    blocks = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            blocks.append(paragraph)
+            continue
+        current = ""
+        for line in paragraph.splitlines():
+            if current and len(current) + len(line) + 1 > max_chars:
+                blocks.append(current)
+                current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            blocks.append(current)
+
+    passages, current = [], ""
+    for block in blocks:
+        if not block:
+            continue
+        if current and len(current) + len(block) + 2 > max_chars:
+            passages.append(current)
+            current = block
+        else:
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        passages.append(current)
+    return passages
+
+@dataclass(frozen=True)
+class Article:
+    """Статья базы знаний"""
+
+    category: str
+    title: str
+    text: str
+    source: str
+
+@dataclass(frozen=True)
+class Passage:
+    """Фрагмент статьи - единица поиска"""
+
+    id: int
+    category: str
+    title: str
+    text: str
+    source: str
+
+class _Index:
+    """Неизменяемый снимок базы знаний с инвертированным индексом
+
+    В списках вхождений хранится готовый вклад термина в оценку BM25,
+    поэтому поиск сводится к суммированию весов по терминам запроса.
+    При перезагрузке строится новый снимок и подменяется целиком.
+    """
+
+    def __init__(self, articles: List[Article], passages: List[Passage],
+                 postings: Dict[str, Tuple[List[int], List[float]]], signature: str):
+        self.articles = articles
+        self.passages = passages
+        self.postings = postings
+        self.signature = signature
+
+        by_category: Dict[str, List[str]] = {}
+        for article in articles:
+            by_category.setdefault(article.category, []).append(article.text)
+        self.texts = {category: "\n\n".join(texts) for category, texts in by_category.items()}
+        self.versions = {
+            category: hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+            for category, text in self.texts.items()
+        }
+        digest = hashlib.sha1()
+        for category in sorted(self.versions):
+            digest.update(f"{category}:{self.versions[category]};".encode("utf-8"))
+        self.version = digest.hexdigest()[:12] if articles else ""
+
+    @classmethod
+    def build(cls, articles: List[Article], passage_chars: int, signature: str) -> "_Index":
+        passages: List[Passage] = []
+        term_counts: List[Counter] = []
+        for article in articles:
+            for text in split_passages(article.text, passage_chars):
+                passages.append(Passage(len(passages), article.category, article.title, text, article.source))
+                # Заголовок статьи учитывается в каждом ее фрагменте
+                term_counts.append(Counter(tokenize(f"{article.title}\n{text}")))
+
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / len(lengths) if lengths else 0.0) or 1.0
+        document_frequency = Counter()
+        for counts in term_counts:
+            document_frequency.update(counts.keys())
+
+        total = len(passages)
+        idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for passage_id, counts in enumerate(term_counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[passage_id] / avg_length)
+            for term, tf in counts.items():
+                ids, weights = postings.setdefault(term, ([], []))
+                ids.append(passage_id)
+                weights.append(idf[term] * tf * (BM25_K1 + 1) / (tf + norm))
+
+        return cls(articles, passages, postings, signature)
+
+    def search(self, query: str, k: int, category: Optional[str]) -> List[Passage]:
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            for passage_id, weight in zip(*posting):
+                scores[passage_id] = scores.get(passage_id, 0.0) + weight
+
+        if category is not None:
+            passages = self.passages
+            scores = {i: score for i, score in scores.items() if passages[i].category == category}
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.passages[passage_id] for passage_id, _ in best]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "format": INDEX_FORMAT,
+            "signature": self.signature,
+            "articles": [[a.category, a.title, a.text, a.source] for a in self.articles],
+            "passages": [[p.category, p.title, p.text, p.source] for p in self.passages],
+            "postings": {term: [ids, weights] for term, (ids, weights) in self.postings.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_Index":
+        articles = [Article(*row) for row in data["articles"]]
+        passages = [Passage(i, *row) for i, row in enumerate(data["passages"])]
+        postings = {term: (ids, weights) for term, (ids, weights) in data["postings"].items()}
+        return cls(articles, passages, postings, data["signature"])
+
+class KnowledgeBase:
+    """База знаний из каталога Markdown/JSON-файлов с поиском по фрагментам
+
+    Статьи режутся на фрагменты, по которым строится инвертированный
+    индекс BM25. Индекс строится при запуске или загружается из заранее
+    собранного файла (build_kb_index.py), если тот соответствует текущим
+    файлам. Изменения в каталоге подхватываются автоматически: не чаще
+    раза в reload_interval секунд проверяются размеры и даты файлов, и
+    при отличиях индекс перестраивается в фоновом потоке.
+
+    Для совместимости база ведет себя как словарь "категория -> текст
+    статей категории" (in, [], get).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        index_path: Optional[str] = None,
+        passage_chars: int = 600,
+        reload_interval: float = 5.0
+    ):
+        self.directory = directory
+        self.index_path = index_path
+        self.passage_chars = passage_chars
+        self.reload_interval = reload_interval
+
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._next_check = 0.0
+        self._stats = {"reloads": 0, "loaded_from": "files", "build_ms": 0.0}
+        self._index = self._load()
+
+    # --- Интерфейс словаря статей ---
+
+    def __contains__(self, category: str) -> bool:
+        self.maybe_reload()
+        return category in self._index.texts
+
+    def __getitem__(self, category: str) -> str:
+        self.maybe_reload()
+        return self._index.texts[category]
+
+    def get(self, category: str, default: Optional[str] = None) -> Optional[str]:
+        self.maybe_reload()
+        return self._index.texts.get(category, default)
+
+    @property
+    def categories(self) -> List[str]:
+        return list(self._index.texts)
+
+    # --- Поиск ---
+
+    def search(self, query: str, k: int = 3, category: Optional[str] = None) -> List[Passage]:
+        """Самые релевантные запросу фрагменты (не более k)
+
+        При заданной категории ищутся только фрагменты ее статей.
+        """
+        self.maybe_reload()
+        return self._index.search(query, k, category)
+
+    def version(self, category: Optional[str] = None) -> str:
+        """Версия статей категории (хэш текста) для инвалидации кэша ответов
+
+        Для категории без статей - версия всей базы, так как фрагменты
+        для ответа тогда подбираются из любых статей.
+        """
+        index = self._index
+        return index.versions.get(category, index.version)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Размер индекса и счетчики перезагрузок"""
+        index = self._index
+        return {
+            "articles": len(index.articles),
+            "passages": len(index.passages),
+            "terms": len(index.postings),
+            **self._stats
+        }
+
+    # --- Загрузка и перезагрузка ---
+
+    def maybe_reload(self):
+        """Проверка изменений каталога не чаще раза в reload_interval секунд
+
+        Проверка и перестройка индекса выполняются в фоновом потоке: до их
+        окончания запросы обслуживает прежний снимок.
+        """
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if self._reloading or now < self._next_check:
+                return
+            self._next_check = now + self.reload_interval
+            self._reloading = True
+        threading.Thread(target=self._reload_in_background, daemon=True).start()
+
+    def reload(self, force: bool = False) -> bool:
+        """Синхронная перестройка индекса, если файлы изменились
+
+        Возвращает True, если индекс был перестроен.
+        """
+        signature = self._signature()
+        if not force and signature == self._index.signature:
+            return False
+        self._index = self._build(signature)
+        self._stats["reloads"] += 1
+        return True
+
+    def save_index(self, path: Optional[str] = None):
+        """Сохранение собранного индекса на диск"""
+        path = path or self.index_path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"Ошибка перезагрузки базы знаний: {e}")
+        finally:
+            self._reloading = False
+
+    def _load(self) -> _Index:
+        signature = self._signature()
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("format") == INDEX_FORMAT and data.get("signature") == signature:
+                    self._stats["loaded_from"] = "index"
+                    return _Index.from_dict(data)
+                print("Сохраненный индекс базы знаний устарел, индекс будет перестроен")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Не удалось загрузить индекс базы знаний: {e}")
+        return self._build(signature)
+
+    def _build(self, signature: str) -> _Index:
+        started = time.perf_counter()
+        index = _Index.build(list(self._read_articles()), self.passage_chars, signature)
+        self._stats["build_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return index
+
+    def _files(self) -> List[str]:
+        """Файлы статей в каталоге (рекурсивно, в стабильном порядке)"""
+        if not os.path.isdir(self.directory):
+            return []
+        paths = []
+        for root, dirs, files in os.walk(self.directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith((".md", ".json")):
+                    paths.append(os.path.join(root, name))
+        return paths
+
+    def _signature(self) -> str:
+        """Отпечаток каталога по именам, размерам и датам изменения файлов"""
+        digest = hashlib.sha1()
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(path, self.directory)}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _read_articles(self) -> Iterator[Article]:
+        for path in self._files():
+            source = os.path.relpath(path, self.directory)
+            default_category = os.path.splitext(os.path.basename(path))[0]
+            try:
+                with open(path, encoding="utf-8") as f:
+                    content = f.read()
+                if path.endswith(".json"):
+                    yield from self._parse_json(content, default_category, source)
+                else:
+                    yield self._parse_markdown(content, default_category, source)
+            except (OSError, ValueError) as e:
+                print(f"Пропущен файл базы знаний {source}: {e}")
+
+    def _parse_markdown(self, content: str, default_category: str, source: str) -> Article:
+        """Статья Markdown с необязательным заголовком вида
+
+        ---
+        category: password
+        title: Сброс пароля
+        ---
+        """
+        meta = {}
+        match = _FRONT_MATTER.match(content)
+        if match:
+            for line in match.group(1).splitlines():
+                key, sep, value = line.partition(":")
+                if sep:
+                    meta[key.strip()] = value.strip()
+            content = content[match.end():]
+        heading = _HEADING.search(content)
+        title = meta.get("title") or (heading.group(1).strip() if heading else default_category)
+        return Article(meta.get("category") or default_category, title, content.strip(), source)
+
+    def _parse_json(self, content: str, default_category: str, source: str) -> Iterator[Article]:
+        """Одна статья или список статей с полями category, title, text
+
+        Элементы без строкового text пропускаются, остальные статьи файла загружаются.
+        """
+        data = json.loads(content)
+        for number, item in enumerate(data if isinstance(data, list) else [data]):
+            if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+                print(f"Пропущена статья {number} в файле базы знаний {source}: нет поля text")
+                continue
+            category = item.get("category")
+            category = category if isinstance(category, str) and category else default_category
+            title = item.get("title")
+            yield Article(category, title if isinstance(title, str) and title else category, item["text"].strip(), source)
@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Этапы обработки запроса чата
+STAGES = ("classification", "kb", "cache", "llm", "db_write", "total")
+
+# Границы корзин растут в GROWTH раз: погрешность квантиля не больше ~12%
+GROWTH = 1.25
+_LOG_GROWTH = math.log(GROWTH)
+
+def bucket_for(ms: float) -> int:
+    """Номер логарифмической корзины для времени в миллисекундах
+
+    Корзина 0 - до 1 мс включительно, корзина i - (GROWTH^(i-1), GROWTH^i] мс.
+    """
+    if ms <= 1:
+        return 0
+    return max(1, math.ceil(math.log(ms) / _LOG_GROWTH - 1e-9))
+
+def bucket_upper(index: int) -> float:
+    """Верхняя граница корзины, мс"""
+    return GROWTH ** index
+
+def bucket_lower(index: int) -> float:
+    """Нижняя граница корзины, мс"""
+    return 0.0 if index == 0 else GROWTH ** (index - 1)
+
+class LatencyHistogram:
+    """Гистограмма времени с логарифмическими корзинами
+
+    Гистограммы складываются покорзинно, поэтому их можно хранить по дням
+    и категориям и объединять за любой период без исходных замеров.
+    """
+
+    __slots__ = ("counts",)
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, ms: float, count: int = 1):
+        self.add_bucket(bucket_for(ms), count)
+
+    def add_bucket(self, index: int, count: int):
+        """Прибавление готового счетчика корзины (при чтении из БД)"""
+        self.counts[index] = self.counts.get(index, 0) + count
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Квантиль q (0..1) в миллисекундах, None для пустой гистограммы
+
+        Внутри корзины значение интерполируется линейно.
+        """
+        total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index in sorted(self.counts):
+            count = self.counts[index]
+            if seen + count >= rank:
+                lower, upper = bucket_lower(index), bucket_upper(index)
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+        return bucket_upper(max(self.counts))
+
+    def share_within(self, ms: float) -> Optional[float]:
+        """Доля замеров не дольше ms (0..1), None для пустой гистограммы"""
+        total = self.count
+        if not total:
+            return None
+        within = 0.0
+        for index, count in self.counts.items():
+            lower, upper = bucket_lower(index), bucket_upper(index)
+            if upper <= ms:
+                within += count
+            elif lower < ms:
+                within += count * (ms - lower) / (upper - lower)
+        return within / total
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Число замеров и основные перцентили"""
+        def rounded(value):
+            return round(value, 1) if value is not None else None
+
+        return {
+            'count': self.count,
+            'p50': rounded(self.quantile(0.5)),
+            'p95': rounded(self.quantile(0.95)),
+            'p99': rounded(self.quantile(0.99))
+        }
+
+class StageTimer:
+    """Замер длительности этапов одного запроса, мс"""
+
+    __slots__ = ("timings",)
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record(self, name: str, ms: float):
+        # Повторный этап (например, два обращения к кэшу) суммируется
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+# Ключ накопленной дельты: (день, категория, этап, корзина)
+LatencyKey = Tuple[datetime, str, str, int]
+
+class LatencyRecorder:
+    """Накопитель замеров этапов до записи в БД
+
+    Замеры складываются в дельты гистограмм по дням и категориям, которые
+    фоновая запись диалогов забирает в своей транзакции (drain).
+    """
+
+    def __init__(self):
+        self._pending: Dict[LatencyKey, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, category: Optional[str], timings: Dict[str, float], timestamp: Optional[datetime] = None):
+        """Учет замеров этапов одного запроса"""
+        day = (timestamp or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+        category = category or 'general'
+        with self._lock:
+            for stage, ms in timings.items():
+                key = (day, category, stage, bucket_for(ms))
+                self._pending[key] = self._pending.get(key, 0) + 1
+
+    def drain(self) -> List[Tuple[LatencyKey, int]]:
+        """Забрать накопленные дельты"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return list(pending.items())
+
+    def restore(self, deltas: Iterable[Tuple[LatencyKey, int]]):
+        """Вернуть дельты, которые не удалось записать"""
+        with self._lock:
+            for key, count in deltas:
+                self._pending[key] = self._pending.get(key, 0) + count
+
+    def __len__(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,355 @@
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.services.metrics import llm_backend_requests_total, llm_hedged_requests_total
+
+# Штраф за ошибку при выборе бэкенда, с: доля ошибок 0.5 равна лишним 0.5 с ожидания
+ERROR_PENALTY = 1.0
+
+# Состояния автомата отключения (circuit breaker)
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class NoBackendAvailable(Exception):
+    """Все бэкенды LLM отключены автоматом - запрос не отправляется"""
+
+class CircuitBreaker:
+    """Автомат отключения бэкенда после серии ошибок
+
+    После failure_threshold ошибок подряд бэкенд отключается (open) на
+    reset_timeout секунд: запросы к нему не отправляются. Затем
+    пропускается один пробный запрос (half_open); его успех снова
+    включает бэкенд, ошибка - отключает еще на reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос; в half_open - только один пробный"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+        self._probing = False
+
+    def record_cancel(self):
+        """Запрос отменен без результата: пробный запрос можно повторить"""
+        self._probing = False
+
+class LLMBackend:
+    """OpenAI-совместимый бэкенд: клиент, модель и оценки задержки и ошибок
+
+    Задержка и доля ошибок сглаживаются экспоненциально (EWMA) с
+    коэффициентом alpha; для p95 хранятся последние window задержек.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: Any,
+        model: str,
+        breaker: Optional[CircuitBreaker] = None,
+        alpha: float = 0.2,
+        window: int = 200,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.breaker = breaker or CircuitBreaker()
+        self.alpha = alpha
+        self.http_client = http_client
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self._latencies = deque(maxlen=window)
+
+    def record_latency(self, seconds: float):
+        self.latency = seconds if self.latency is None else self.alpha * seconds + (1 - self.alpha) * self.latency
+        self._latencies.append(seconds)
+
+    def record_success(self, seconds: Optional[float] = None):
+        if seconds is not None:
+            self.record_latency(seconds)
+        self.error_rate *= 1 - self.alpha
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        self.breaker.record_failure()
+
+    def p95(self, min_samples: int = 20) -> Optional[float]:
+        """95-й перцентиль последних задержек, если замеров достаточно"""
+        if len(self._latencies) < min_samples:
+            return None
+        values = sorted(self._latencies)
+        return values[min(len(values) - 1, int(0.95 * len(values)))]
+
+    def expected_latency(self) -> float:
+        """Ожидаемое время ответа с учетом доли ошибок (для выбора бэкенда)
+
+        Бэкенд без замеров задержки считается самым быстрым, чтобы он
+        получил запросы и оценки.
+        """
+        return (self.latency or 0.0) / max(0.1, 1 - self.error_rate) + self.error_rate * ERROR_PENALTY
+
+    def get_stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "name": self.name,
+            "model": self.model,
+            "state": self.breaker.state,
+            "ewma_latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 4)
+        }
+
+class LLMRouter:
+    """Маршрутизация запросов к LLM по нескольким бэкендам
+
+    Запрос уходит бэкенду с наименьшей ожидаемой задержкой среди
+    включенных автоматом отключения; при ошибке - следующему. Если все
+    бэкенды отключены, сразу выбрасывается NoBackendAvailable, чтобы
+    вызывающий код без ожидания отдал резервный ответ.
+
+    При hedge=True, если первый бэкенд не ответил за p95 своей задержки
+    (не меньше hedge_delay), тот же запрос отправляется второму; берется
+    первый успешный ответ, второй запрос отменяется.
+    """
+
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        timeout: Optional[float] = None,
+        hedge: bool = False,
+        hedge_delay: float = 0.5
+    ):
+        self.backends = backends
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self._stats = Counter()
+
+    async def aclose(self):
+        """Закрытие пулов HTTP-соединений бэкендов"""
+        for backend in self.backends:
+            if backend.http_client is not None:
+                await backend.http_client.aclose()
+
+    def candidates(self) -> List[LLMBackend]:
+        """Бэкенды по возрастанию ожидаемой задержки (при равенстве - в порядке настройки)"""
+        return sorted(self.backends, key=LLMBackend.expected_latency)
+
+    async def complete(self, **kwargs) -> Any:
+        """Ответ chat.completions.create первого успешно ответившего бэкенда"""
+        queue = self.candidates()
+        pending: Dict[asyncio.Task, tuple] = {}
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                if not pending:
+                    backend = self._next(queue)
+                    if backend is None:
+                        break
+                    pending[asyncio.ensure_future(self._call(backend, kwargs))] = (backend, time.perf_counter())
+                delay = self._hedge_delay(next(iter(pending.values()))[0]) if len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    backend = self._next(queue)
+                    if backend is None:
+                        # Второго бэкенда нет - просто ждем первый
+                        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        self._stats["hedged"] += 1
+                        llm_hedged_requests_total.inc()
+                        pending[asyncio.ensure_future(self._call(backend, kwargs))] = (backend, time.perf_counter())
+                        continue
+                for task in done:
+                    backend, _ = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task, (backend, started) in pending.items():
+                # Проигравший запрос: его время - нижняя граница задержки бэкенда
+                task.cancel()
+                backend.record_latency(time.perf_counter() - started)
+        if error is not None:
+            raise error
+        self._stats["rejected"] += 1
+        raise NoBackendAvailable("Все бэкенды LLM отключены")
+
+    async def stream(self, **kwargs) -> AsyncIterator[Any]:
+        """Части потокового ответа
+
+        Если бэкенд не ответил или ошибся до первой части, запрос
+        повторяется на следующем. Время до первой части в оценки задержки
+        не входит: оно несравнимо со временем полного ответа.
+        """
+        queue = self.candidates()
+        error: Optional[BaseException] = None
+        while True:
+            backend = self._next(queue)
+            if backend is None:
+                break
+            streamed = False
+            try:
+                stream = await self._with_timeout(
+                    backend.client.chat.completions.create(model=backend.model, stream=True, **kwargs)
+                )
+                try:
+                    async for chunk in stream:
+                        streamed = True
+                        yield chunk
+                finally:
+                    await stream.response.aclose()
+            except (asyncio.CancelledError, GeneratorExit):
+                backend.breaker.record_cancel()
+                raise
+            except Exception as e:
+                self._record(backend, "error")
+                if streamed:
+                    raise
+                error = e
+                continue
+            self._record(backend, "ok")
+            return
+        if error is not None:
+            raise error
+        self._stats["rejected"] += 1
+        raise NoBackendAvailable("Все бэкенды LLM отключены")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "hedge": self.hedge,
+            "hedged": self._stats["hedged"],
+            "rejected": self._stats["rejected"],
+            "backends": [backend.get_stats() for backend in self.backends]
+        }
+
+    def _next(self, queue: List[LLMBackend]) -> Optional[LLMBackend]:
+        """Следующий бэкенд из очереди, пропускающий запрос"""
+        while queue:
+            backend = queue.pop(0)
+            if backend.breaker.allow():
+                return backend
+        return None
+
+    def _hedge_delay(self, backend: LLMBackend) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return max(self.hedge_delay, backend.p95() or 0.0)
+
+    async def _call(self, backend: LLMBackend, kwargs: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            response = await self._with_timeout(
+                backend.client.chat.completions.create(model=backend.model, **kwargs)
+            )
+        except asyncio.CancelledError:
+            backend.breaker.record_cancel()
+            raise
+        except Exception:
+            self._record(backend, "error")
+            raise
+        self._record(backend, "ok", time.perf_counter() - started)
+        return response
+
+    async def _with_timeout(self, coro):
+        if self.timeout is None:
+            return await coro
+        return await asyncio.wait_for(coro, timeout=self.timeout)
+
+    def _record(self, backend: LLMBackend, outcome: str, seconds: Optional[float] = None):
+        if outcome == "ok":
+            backend.record_success(seconds)
+        else:
+            backend.record_failure()
+        llm_backend_requests_total.labels(backend.name, outcome).inc()
+
+def parse_backends(spec: str) -> List[Dict[str, str]]:
+    """Разбор LLM_BACKENDS: "имя|base_url|модель[|переменная с ключом],..."
+
+    Пустой base_url - адрес OpenAI по умолчанию.
+    """
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        parts = [part.strip() for part in entry.split("|")]
+        if len(parts) not in (3, 4) or not parts[0] or not parts[2]:
+            raise ValueError(f"Неверное описание бэкенда LLM: {entry!r}")
+        backends.append({
+            "name": parts[0],
+            "base_url": parts[1],
+            "model": parts[2],
+            "api_key_env": parts[3] if len(parts) == 4 else ""
+        })
+    return backends
+
+def create_backend(
+    name: str,
+    base_url: Optional[str],
+    model: str,
+    api_key: str,
+    timeout: float,
+    max_retries: int,
+    max_connections: int,
+    max_keepalive_connections: int,
+    breaker: CircuitBreaker,
+    alpha: float
+) -> LLMBackend:
+    """Бэкенд с собственным пулом keep-alive соединений"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+        timeout=httpx.Timeout(timeout, connect=5.0)
+    )
+    client = AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url or None,
+        http_client=http_client,
+        timeout=timeout,
+        max_retries=max_retries
+    )
+    return LLMBackend(name, client, model, breaker=breaker, alpha=alpha, http_client=http_client)
+
+def api_key_for(backend: Dict[str, str], default: str) -> str:
+    """Ключ бэкенда; локальным OpenAI-совместимым серверам ключ не нужен"""
+    if backend["api_key_env"]:
+        return os.getenv(backend["api_key_env"], "") or default or "none"
+    return default or "none"
@@ -0,0 +1,454 @@
+import asyncio
+import glob
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Пустой набор меток
+NO_LABELS: Tuple[str, ...] = ()
+
+class _CounterChild:
+    """Значение счетчика для одного набора меток"""
+
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+class _GaugeChild(_CounterChild):
+    """Значение gauge для одного набора меток"""
+
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+class _HistogramChild:
+    """Гистограмма для одного набора меток (некумулятивные корзины)"""
+
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Sequence[float]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # Последняя корзина - +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class _Metric:
+    """Метрика с метками: значения хранятся по кортежам значений меток"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = NO_LABELS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self._default = None if self.labelnames else self.labels()
+
+    def labels(self, *values: str):
+        """Значение метрики для набора меток (в порядке labelnames)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        """Снимок значений: [(значения меток, значение)]"""
+        seen = set()
+        samples = []
+        for values, child in list(self._children.items()):
+            if id(child) in seen:
+                continue
+            seen.add(id(child))
+            samples.append((tuple(str(v) for v in values), self._value(child)))
+        return samples
+
+    def _value(self, child) -> Any:
+        return child.value
+
+class _FunctionMetric(_Metric):
+    """Метрика, значение которой может вычислять function в момент сбора"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = NO_LABELS,
+                 function: Optional[Callable[[], float]] = None):
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def collect(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        if self.function is not None:
+            try:
+                return [(NO_LABELS, float(self.function()))]
+            except Exception:
+                return []
+        return super().collect()
+
+class Counter(_FunctionMetric):
+    """Монотонно растущий счетчик; function - счетчик, который ведет сам сервис"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+class Gauge(_FunctionMetric):
+    """Текущее значение; function вычисляет его в момент сбора метрик"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = NO_LABELS,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _value(self, child) -> Any:
+        return {"counts": list(child.counts), "sum": child.sum}
+
+class _NullMetric:
+    """Заглушка метрики при METRICS_ENABLED=false: все операции ничего не делают"""
+
+    def labels(self, *values: str) -> "_NullMetric":
+        return self
+
+    def inc(self, amount: float = 1.0):
+        pass
+
+    def dec(self, amount: float = 1.0):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+_NULL_METRIC = _NullMetric()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class MetricsRegistry:
+    """Реестр метрик с выводом в текстовом формате Prometheus
+
+    Обновление метрики - прибавление под блокировкой без выделения
+    памяти. Если задан multiprocess_dir, каждый процесс (воркер uvicorn)
+    периодически сохраняет снимок своих метрик в файл каталога, а
+    /metrics любого воркера суммирует файлы всех процессов: счетчики и
+    гистограммы - всех, в том числе завершившихся, gauge - только живых.
+    Каталог нужно очищать перед запуском приложения.
+    """
+
+    def __init__(self, enabled: bool = True, multiprocess_dir: Optional[str] = None):
+        self.enabled = enabled
+        self.multiprocess_dir = multiprocess_dir or None
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        if self.enabled and self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = NO_LABELS,
+                function: Optional[Callable[[], float]] = None):
+        return self._register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = NO_LABELS,
+              function: Optional[Callable[[], float]] = None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = NO_LABELS,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        if not self.enabled:
+            return _NULL_METRIC
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    # --- Сбор и вывод ---
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """Снимок метрик текущего процесса"""
+        snapshot = {}
+        for name, metric in list(self._metrics.items()):
+            snapshot[name] = {
+                "kind": metric.kind,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": [[list(values), value] for values, value in metric.collect()]
+            }
+        return snapshot
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus (для всех процессов)"""
+        if not self.multiprocess_dir:
+            return self._format(self.collect())
+        self.write_snapshot()
+        return self._format(self._merge(self._read_snapshots()))
+
+    def _format(self, snapshot: Dict[str, Dict[str, Any]]) -> str:
+        lines = []
+        for name in sorted(snapshot):
+            metric = snapshot[name]
+            names = metric["labelnames"]
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for values, value in sorted(metric["samples"], key=lambda sample: sample[0]):
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                bounds = list(metric["buckets"]) + [math.inf]
+                for bound, count in zip(bounds, value["counts"]):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{name}_bucket{_format_labels(names, values, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, values)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(names, values)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    # --- Режим нескольких процессов ---
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.multiprocess_dir, f"metrics_{pid}.json")
+
+    def write_snapshot(self):
+        """Сохранение снимка метрик процесса в каталог multiprocess_dir"""
+        if not (self.enabled and self.multiprocess_dir):
+            return
+        pid = os.getpid()
+        path = self._snapshot_path(pid)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pid": pid, "written_at": time.time(), "metrics": self.collect()}, f)
+        os.replace(tmp_path, path)
+
+    def _read_snapshots(self) -> Iterable[Dict[str, Any]]:
+        for path in sorted(glob.glob(os.path.join(self.multiprocess_dir, "metrics_*.json"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                # Файл мог быть заменен во время чтения - пропускаем до следующего сбора
+                continue
+
+    def _merge(self, snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for snapshot in snapshots:
+            alive = _pid_alive(snapshot["pid"])
+            for name, metric in snapshot["metrics"].items():
+                if metric["kind"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**metric, "samples": {}})
+                for values, value in metric["samples"]:
+                    key = tuple(values)
+                    current = target["samples"].get(key)
+                    if metric["kind"] == "histogram":
+                        if current is None:
+                            current = target["samples"][key] = {"counts": [0] * len(value["counts"]), "sum": 0.0}
+                        current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                        current["sum"] += value["sum"]
+                    else:
+                        target["samples"][key] = (current or 0.0) + value
+        for metric in merged.values():
+            metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+        return merged
+
+    def start(self, interval: float = 1.0):
+        """Периодическое сохранение снимка (внутри работающего event loop)"""
+        if self.enabled and self.multiprocess_dir and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically(interval))
+
+    async def stop(self):
+        """Остановка сохранения с записью последнего снимка"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        self.write_snapshot()
+
+    async def _flush_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write_snapshot)
+            except OSError as e:
+                print(f"Ошибка сохранения метрик: {e}")
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MetricsMiddleware:
+    """ASGI-middleware: число и длительность запросов по маршрутам
+
+    Меткой служит шаблон маршрута (/api/users/{user_id}/activity), а не
+    фактический путь, чтобы число рядов метрики не росло с числом
+    пользователей. Запросы без маршрута учитываются как unmatched.
+    """
+
+    def __init__(self, app, requests_total, request_duration):
+        self.app = app
+        self.requests_total = requests_total
+        self.request_duration = request_duration
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            self.requests_total.labels(scope["method"], path, str(status)).inc()
+            self.request_duration.labels(path).observe(time.perf_counter() - started)
+
+# Реестр приложения и метрики горячего пути
+metrics = MetricsRegistry(
+    enabled=settings.METRICS_ENABLED,
+    multiprocess_dir=settings.METRICS_MULTIPROC_DIR
+)
+
+http_requests_total = metrics.counter(
+    "http_requests_total", "Число HTTP-запросов", ("method", "route", "status")
+)
+http_request_duration_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Длительность HTTP-запросов, с", ("route",)
+)
+llm_requests_total = metrics.counter(
+    "llm_requests_total", "Запросы к LLM по результату (ok, error, timeout, cancelled, unavailable)", ("outcome",)
+)
+llm_request_duration_seconds = metrics.histogram(
+    "llm_request_duration_seconds", "Длительность запросов к LLM, с",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0)
+)
+llm_tokens_total = metrics.counter(
+    "llm_tokens_total", "Токены по данным usage ответа LLM", ("type",)
+)
+db_session_checkout_seconds = metrics.histogram(
+    "db_session_checkout_seconds", "Время получения соединения из пула, с"
+)
+db_commit_seconds = metrics.histogram(
+    "db_commit_seconds", "Время commit пачки диалогов, с"
+)
+classifier_categories_total = metrics.counter(
+    "classifier_categories_total", "Классифицированные сообщения по категориям", ("category",)
+)
+
+llm_backend_requests_total = metrics.counter(
+    "llm_backend_requests_total", "Запросы к бэкендам LLM по результату (ok, error)", ("backend", "outcome")
+)
+llm_hedged_requests_total = metrics.counter(
+    "llm_hedged_requests_total", "Повторные (hedged) запросы к второму бэкенду LLM"
+)
+chat_routes_total = metrics.counter(
+    "chat_routes_total", "Ответы по способу: kb (без LLM), kb_polish, llm", ("route",)
+)
+chat_admission_total = metrics.counter(
+    "chat_admission_total", "Решения контроля приема запросов: admit, degrade, throttle, shed", ("decision",)
+)
+
+def observe_llm_call(outcome: str, seconds: float):
+    """Учет запроса к LLM: результат (ok, error, timeout, cancelled) и длительность"""
+    llm_requests_total.labels(outcome).inc()
+    llm_request_duration_seconds.observe(seconds)
+
+def record_llm_usage(usage):
+    """Учет токенов из поля usage ответа chat completions"""
+    if usage is None:
+        return
+    llm_tokens_total.labels("prompt").inc(int(usage.prompt_tokens or 0))
+    llm_tokens_total.labels("completion").inc(int(usage.completion_tokens or 0))
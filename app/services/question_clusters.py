@@ -0,0 +1,499 @@
+import asyncio
+import json
+import os
+import re
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.models.conversation import Conversation
+from app.models.statistics import QuestionClusterStat
+from app.services.archive import _DirectoryLock
+from app.services.knowledge_base import KnowledgeBase, tokenize
+
+# Версия формата сохраненного состояния
+STATE_FORMAT = 1
+
+# Размер пространства хэшированных признаков: словарь не хранится, и
+# память модели не растет с числом разных слов в обращениях
+HASH_FEATURES = 2 ** 18
+
+# Формулировок, которые считаются в кластере (самые частые, алгоритм
+# Space-Saving), из них показываются EXAMPLES; длина формулировки
+PHRASINGS = 10
+EXAMPLES = 3
+EXAMPLE_LENGTH = 200
+
+_LONG_NUMBER = re.compile(r"\b\d{4,}\b")
+
+# Строк пачки, сравниваемых с центрами кластеров за одно умножение
+# матриц: ограничивает размер матрицы сходства
+SIMILARITY_BLOCK = 1000
+
+def phrasing_key(text: str) -> str:
+    """Формулировка вопроса без регистра, знаков в конце и длинных чисел"""
+    text = _LONG_NUMBER.sub(" ", text.lower().replace("ё", "е"))
+    return " ".join(text.split()).strip(" ?!.,")
+
+def question_terms(text: str) -> List[str]:
+    """Признаки вопроса: термины базы знаний (основы слов без стоп-слов)
+    без длинных чисел - номеров заявок, телефонов, инвентарных номеров"""
+    return [term for term in tokenize(text) if not (term.isdigit() and len(term) > 3)]
+
+def feature_index(term: str, n_features: int = HASH_FEATURES) -> int:
+    """Номер признака термина (crc32 одинаков во всех процессах, в отличие от hash())"""
+    return zlib.crc32(term.encode("utf-8")) % n_features
+
+def normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Строки единичной длины: скалярное произведение становится косинусом"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+class HashedTfidf:
+    """TF-IDF по хэшированным признакам с IDF, дополняемым каждой пачкой
+
+    Частоты документов (df) накапливаются по всем обработанным
+    обращениям, поэтому веса новых пачек учитывают всю историю без
+    повторного чтения. Для подписей кластеров запоминается первый
+    термин, попавший в каждый признак.
+    """
+
+    def __init__(self, n_features: int = HASH_FEATURES, min_df: int = 2):
+        self.n_features = n_features
+        self.min_df = min_df
+        self.df = np.zeros(n_features, dtype=np.float64)
+        self.n_docs = 0
+        self.terms: Dict[int, str] = {}
+
+    def partial_fit_transform(self, texts: Sequence[str]) -> sparse.csr_matrix:
+        """Учет пачки в df и ее векторы TF-IDF (строки единичной длины)"""
+        counts = self._counts(texts)
+        self.df += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_docs += len(texts)
+        return self._weigh(counts)
+
+    def _weigh(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        idf = np.log((1.0 + self.n_docs) / (1.0 + self.df)) + 1.0
+        # Сублинейная частота: повтор слова в одном вопросе почти не добавляет смысла
+        weights = (1.0 + np.log(counts.data)) * idf[counts.indices]
+        # Термины, встреченные меньше min_df раз (опечатки, коды), не учитываются:
+        # с наибольшим весом они разводили бы одинаковые вопросы. Вопрос только из
+        # новых терминов сохраняет их - иначе новая тема не получила бы кластер
+        rare = self.df[counts.indices] < self.min_df
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        common = np.bincount(rows, weights=~rare, minlength=counts.shape[0]) > 0
+        weights[rare & common[rows]] = 0.0
+        counts.data = weights.astype(np.float32)
+        counts.eliminate_zeros()
+        return normalize_rows(counts).tocsr()
+
+    def _counts(self, texts: Sequence[str]) -> sparse.csr_matrix:
+        indices: List[int] = []
+        indptr = [0]
+        terms = self.terms
+        for text in texts:
+            for term in question_terms(text):
+                index = feature_index(term, self.n_features)
+                indices.append(index)
+                if index not in terms:
+                    terms[index] = term
+            indptr.append(len(indices))
+        counts = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(texts), self.n_features)
+        )
+        counts.sum_duplicates()
+        return counts
+
+class QuestionClusters:
+    """Инкрементальная кластеризация похожих вопросов по пачкам
+
+    Вопрос относится к ближайшему кластеру, если косинус с его центром не
+    меньше similarity; из остальных вопросов пачки жадно собираются новые
+    кластеры (вопрос и все еще не занятые вопросы, похожие на него). Центр
+    кластера - среднее векторов его вопросов, обновляется после каждой
+    пачки одним умножением разреженных матриц. Память ограничена: центры
+    разреженные (веса меньше min_weight отбрасываются), а при превышении
+    max_clusters мелкие кластеры вытесняются.
+    """
+
+    def __init__(
+        self,
+        similarity: float = 0.5,
+        max_clusters: int = 2000,
+        min_weight: float = 0.01,
+        n_features: int = HASH_FEATURES
+    ):
+        self.similarity = similarity
+        self.max_clusters = max_clusters
+        self.min_weight = min_weight
+        self.vectorizer = HashedTfidf(n_features)
+
+        self.centroids = sparse.csr_matrix((0, n_features), dtype=np.float32)
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.categories: List[Counter] = []
+        self.phrasings: List[Dict[str, List[Any]]] = []  # Формулировка -> [число, текст]
+        self.next_id = 1
+        self.last_id = 0  # Последний обработанный id диалога
+        self.stats = Counter()
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def partial_fit(self, texts: Sequence[str], categories: Sequence[Optional[str]]):
+        """Распределение пачки вопросов по кластерам"""
+        X = self.vectorizer.partial_fit_transform(texts)
+        filled = np.flatnonzero(np.diff(X.indptr) > 0)
+        self.stats["processed"] += len(texts)
+        self.stats["empty"] += len(texts) - len(filled)
+        if not len(filled):
+            return
+        X = X[filled]
+        texts = [texts[i] for i in filled]
+        categories = [categories[i] for i in filled]
+
+        labels = self._assign(X)
+        new = max(0, int(labels.max()) + 1 - len(self.sizes))
+        self._update_centroids(X, labels, new)
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + new)])
+        self.next_id += new
+        self.categories.extend(Counter() for _ in range(new))
+        self.phrasings.extend({} for _ in range(new))
+
+        for (label, category), count in Counter(zip(labels.tolist(), categories)).items():
+            self.categories[label][category or "general"] += count
+        for text, label in zip(texts, labels.tolist()):
+            self._count_phrasing(self.phrasings[label], text)
+
+        if len(self.sizes) > self.max_clusters:
+            self._evict()
+
+    def top(self, count: int) -> List[Dict[str, Any]]:
+        """Самые крупные кластеры: формулировки, ключевые слова, категория"""
+        order = np.argsort(-self.sizes, kind="stable")[:count]
+        clusters = []
+        for slot in order.tolist():
+            # Подпись - самая частая формулировка
+            examples = [text for _, text in sorted(self.phrasings[slot].values(), key=lambda item: -item[0])]
+            categories = self.categories[slot]
+            clusters.append({
+                "cluster_id": int(self.ids[slot]),
+                "size": int(self.sizes[slot]),
+                "category": categories.most_common(1)[0][0] if categories else None,
+                "label": examples[0] if examples else "",
+                "examples": examples[1:EXAMPLES],
+                "keywords": self._keywords(slot)
+            })
+        return clusters
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "clusters": len(self),
+            "documents": self.vectorizer.n_docs,
+            "centroid_weights": int(self.centroids.nnz),
+            "last_id": self.last_id,
+            **self.stats
+        }
+
+    # --- Сохранение состояния между запусками ---
+
+    def save(self, path: str):
+        """Атомарная запись состояния (.npz): следующий запуск продолжит с last_id"""
+        meta = {
+            "format": STATE_FORMAT,
+            "similarity": self.similarity,
+            "n_docs": self.vectorizer.n_docs,
+            "next_id": self.next_id,
+            "last_id": self.last_id,
+            "stats": dict(self.stats),
+            "categories": [dict(counter) for counter in self.categories],
+            "phrasings": self.phrasings,
+            "terms": self.vectorizer.terms
+        }
+        centroids = self.centroids.tocsr()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                data=centroids.data, indices=centroids.indices, indptr=centroids.indptr,
+                sizes=self.sizes, ids=self.ids, df=self.vectorizer.df,
+                meta=np.array(json.dumps(meta, ensure_ascii=False))
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Optional["QuestionClusters"]:
+        """Состояние из файла; None, если файла нет или он другого формата"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as state:
+            meta = json.loads(str(state["meta"]))
+            df = state["df"]
+            if meta.get("format") != STATE_FORMAT or meta.get("similarity") != kwargs.get("similarity", 0.5):
+                return None
+            clusters = cls(n_features=len(df), **kwargs)
+            clusters.centroids = sparse.csr_matrix(
+                (state["data"], state["indices"], state["indptr"]), shape=(len(state["sizes"]), len(df))
+            )
+            clusters.sizes = state["sizes"]
+            clusters.ids = state["ids"]
+            clusters.vectorizer.df = df
+        clusters.vectorizer.n_docs = meta["n_docs"]
+        clusters.vectorizer.terms = {int(index): term for index, term in meta["terms"].items()}
+        clusters.next_id = meta["next_id"]
+        clusters.last_id = meta["last_id"]
+        clusters.stats = Counter(meta["stats"])
+        clusters.categories = [Counter(counter) for counter in meta["categories"]]
+        clusters.phrasings = meta["phrasings"]
+        return clusters
+
+    # --- Шаги пачки ---
+
+    def _assign(self, X: sparse.csr_matrix):
+        """Номера кластеров строк пачки (новые кластеры - номера после текущих)"""
+        rows = X.shape[0]
+        labels = np.full(rows, -1, dtype=np.int64)
+
+        if len(self.sizes):
+            centers = normalize_rows(self.centroids).T.tocsc()
+            for start in range(0, rows, SIMILARITY_BLOCK):
+                block = (X[start:start + SIMILARITY_BLOCK] @ centers).tocsr()
+                best = np.asarray(block.argmax(axis=1)).ravel()
+                best_similarity = block.max(axis=1).toarray().ravel()
+                matched = best_similarity >= self.similarity
+                labels[start:start + len(best)][matched] = best[matched]
+
+        rest = np.flatnonzero(labels < 0)
+        if len(rest):
+            # Сходство оставшихся вопросов между собой; жадно: первый свободный
+            # вопрос открывает кластер и забирает все похожие на него
+            pairs = (X[rest] @ X[rest].T).tocsr()
+            taken = np.zeros(len(rest), dtype=bool)
+            label = len(self.sizes)
+            for i in range(len(rest)):
+                if taken[i]:
+                    continue
+                row = slice(pairs.indptr[i], pairs.indptr[i + 1])
+                columns, values = pairs.indices[row], pairs.data[row]
+                close = (values >= self.similarity) & ~taken[columns]
+                members = np.append(columns[close], i)
+                taken[members] = True
+                labels[rest[members]] = label
+                label += 1
+        return labels
+
+    def _update_centroids(self, X: sparse.csr_matrix, labels: np.ndarray, new: int):
+        """Центры - скользящее среднее векторов кластера"""
+        total = len(self.sizes) + new
+        assignment = sparse.csr_matrix(
+            (np.ones(len(labels), dtype=np.float32), (np.arange(len(labels)), labels)),
+            shape=(len(labels), total)
+        )
+        sums = (assignment.T @ X).tocsr()
+        added = np.bincount(labels, minlength=total)
+        sizes = np.concatenate([self.sizes, np.zeros(new, dtype=np.int64)])
+        grown = sizes + added
+        centroids = sparse.vstack([
+            self.centroids, sparse.csr_matrix((new, X.shape[1]), dtype=np.float32)
+        ]).tocsr()
+        centroids = sparse.diags(sizes / grown) @ centroids + sparse.diags(1.0 / grown) @ sums
+        centroids = centroids.tocsr().astype(np.float32)
+        centroids.data[centroids.data < self.min_weight] = 0
+        centroids.eliminate_zeros()
+        self.centroids = centroids
+        self.sizes = grown
+
+    def _evict(self):
+        """Вытеснение мелких кластеров с запасом, чтобы новым темам было куда расти"""
+        keep = np.sort(np.argsort(-self.sizes, kind="stable")[:int(self.max_clusters * 0.8)])
+        evicted = np.setdiff1d(np.arange(len(self.sizes)), keep)
+        self.stats["evicted_clusters"] += len(evicted)
+        self.stats["evicted_questions"] += int(self.sizes[evicted].sum())
+        self.centroids = self.centroids[keep]
+        self.sizes = self.sizes[keep]
+        self.ids = self.ids[keep]
+        self.categories = [self.categories[i] for i in keep.tolist()]
+        self.phrasings = [self.phrasings[i] for i in keep.tolist()]
+
+    def _count_phrasing(self, phrasings: Dict[str, List[Any]], text: str):
+        """Приблизительные счетчики самых частых формулировок (Space-Saving):
+        новая формулировка вытесняет самую редкую и наследует ее счетчик"""
+        key = phrasing_key(text)
+        if not key:
+            return
+        text = " ".join(text.split())[:EXAMPLE_LENGTH]
+        entry = phrasings.get(key)
+        if entry is not None:
+            entry[0] += 1
+            # Показывается самый короткий вариант - обычно без номера заявки
+            if len(text) < len(entry[1]):
+                entry[1] = text
+        elif len(phrasings) < PHRASINGS:
+            phrasings[key] = [1, text]
+        else:
+            weakest = min(phrasings, key=lambda item: phrasings[item][0])
+            phrasings[key] = [phrasings.pop(weakest)[0] + 1, text]
+
+    def _keywords(self, slot: int, count: int = 5) -> List[str]:
+        row = self.centroids[slot]
+        order = np.argsort(-row.data)
+        keywords = []
+        for index in row.indices[order].tolist():
+            term = self.vectorizer.terms.get(index)
+            if term is None or term in keywords:
+                continue
+            keywords.append(term)
+            if len(keywords) == count:
+                break
+        return keywords
+
+class QuestionClusterJob:
+    """Задание кластеризации новых обращений и публикации популярных вопросов
+
+    Читает из conversations только строки после последнего обработанного
+    id пачками по chunk_size (в памяти одновременно одна пачка), дополняет
+    кластеры и сохраняет состояние в state_path. Затем перезаписывает
+    stats_question_clusters top самыми крупными кластерами; кластер из
+    suggest_min_size и более вопросов, для которого в базе знаний нет
+    подходящей статьи, помечается как предложение для новой статьи.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        state_path: str,
+        knowledge_base: Optional[KnowledgeBase] = None,
+        similarity: float = 0.5,
+        max_clusters: int = 2000,
+        chunk_size: int = 2000,
+        top: int = 50,
+        suggest_min_size: int = 20
+    ):
+        self.session_factory = session_factory
+        self.state_path = state_path
+        self.knowledge_base = knowledge_base
+        self.similarity = similarity
+        self.max_clusters = max_clusters
+        self.chunk_size = chunk_size
+        self.top = top
+        self.suggest_min_size = suggest_min_size
+
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"runs": 0, "processed": 0, "last_run": None}
+
+    def run(self, rebuild: bool = False, limit: Optional[int] = None) -> Dict[str, int]:
+        """Обработка новых обращений (не более limit) и публикация кластеров
+
+        При нескольких процессах одновременно работает только один:
+        остальные пропускают запуск.
+        """
+        with _DirectoryLock(f"{os.path.abspath(self.state_path)}.lock") as acquired:
+            if not acquired:
+                return {"processed": 0, "clusters": 0}
+            clusters = None if rebuild else QuestionClusters.load(
+                self.state_path, similarity=self.similarity, max_clusters=self.max_clusters
+            )
+            if clusters is None:
+                clusters = QuestionClusters(similarity=self.similarity, max_clusters=self.max_clusters)
+            processed = self._fit_new_rows(clusters, limit)
+            if processed or rebuild:
+                clusters.save(self.state_path)
+            self.publish(clusters)
+
+        self._stats["runs"] += 1
+        self._stats["processed"] += processed
+        self._stats["last_run"] = datetime.utcnow().isoformat()
+        return {"processed": processed, "clusters": len(clusters)}
+
+    def publish(self, clusters: QuestionClusters):
+        """Перезапись таблицы популярных вопросов"""
+        now = datetime.utcnow()
+        rows = []
+        for cluster in clusters.top(self.top):
+            kb_title = self._closest_article(cluster["keywords"])
+            rows.append({
+                "cluster_id": cluster["cluster_id"],
+                "size": cluster["size"],
+                "category": cluster["category"],
+                "label": cluster["label"],
+                "keywords": json.dumps(cluster["keywords"], ensure_ascii=False),
+                "examples": json.dumps(cluster["examples"], ensure_ascii=False),
+                "kb_title": kb_title,
+                "suggested": kb_title is None and cluster["size"] >= self.suggest_min_size,
+                "updated_at": now
+            })
+        db = self.session_factory()
+        try:
+            db.execute(delete(QuestionClusterStat))
+            if rows:
+                db.bulk_insert_mappings(QuestionClusterStat, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
+
+    def start(self, interval: float):
+        """Периодическая кластеризация в фоне (внутри работающего event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_periodically(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_periodically(self, interval: float):
+        while True:
+            try:
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                print(f"Ошибка кластеризации вопросов: {e}")
+            await asyncio.sleep(interval)
+
+    def _fit_new_rows(self, clusters: QuestionClusters, limit: Optional[int]) -> int:
+        processed = 0
+        db = self.session_factory()
+        try:
+            while limit is None or processed < limit:
+                size = self.chunk_size if limit is None else min(self.chunk_size, limit - processed)
+                rows = db.query(Conversation.id, Conversation.user_message, Conversation.category).filter(
+                    Conversation.id > clusters.last_id
+                ).order_by(Conversation.id).limit(size).all()
+                if not rows:
+                    break
+                clusters.partial_fit([row.user_message for row in rows], [row.category for row in rows])
+                clusters.last_id = rows[-1].id
+                processed += len(rows)
+        finally:
+            db.close()
+        return processed
+
+    def _closest_article(self, keywords: List[str]) -> Optional[str]:
+        """Статья базы знаний, в которой есть хотя бы половина ключевых слов кластера"""
+        if self.knowledge_base is None or not keywords:
+            return None
+        for passage in self.knowledge_base.search(" ".join(keywords), k=1):
+            terms = set(tokenize(f"{passage.title} {passage.text}"))
+            if sum(keyword in terms for keyword in keywords) * 2 >= len(keywords):
+                return passage.title
+        return None
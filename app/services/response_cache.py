@@ -0,0 +1,249 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+# Все, кроме букв, цифр и пробелов, при нормализации отбрасывается
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+def normalize_message(message: str) -> str:
+    """Нормализация текста вопроса для ключа кэша"""
+    text = message.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Символьные n-граммы нормализованного текста
+
+    Устойчивы к окончаниям и опечаткам: "забыл пароль" и "забыла пароль"
+    отличаются лишь несколькими n-граммами.
+    """
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+class _Entry:
+    """Запись кэша в памяти"""
+
+    __slots__ = ("response", "kb_version", "expires_at", "shingles")
+
+    def __init__(self, response: str, kb_version: str, expires_at: float, shingles: Set[str]):
+        self.response = response
+        self.kb_version = kb_version
+        self.expires_at = expires_at
+        self.shingles = shingles
+
+class ResponseCache:
+    """Кэш ответов LLM на типовые вопросы
+
+    Уровни поиска:
+    1. точное совпадение нормализованного вопроса в категории;
+    2. почти дубликат - сходство Жаккара по символьным n-граммам не ниже порога;
+    3. необязательное SQLite-хранилище, переживающее перезапуск (только точные совпадения).
+
+    Каждая запись помнит версию статьи базы знаний, на основе которой был
+    получен ответ: при изменении статьи запись считается недействительной.
+    Из event loop используются aget/aset - хранилище SQLite читается и
+    пишется в отдельном потоке; get/set выполняют все в текущем потоке.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.85,
+        persist_path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        # Инвертированный индекс n-грамм по категориям для поиска почти дубликатов
+        self._index: Dict[str, Dict[str, Set[str]]] = {}
+        self._lock = threading.Lock()
+        # Отдельная блокировка хранилища: поиск в памяти не ждет диска
+        self._db_lock = threading.Lock()
+        self._stats = Counter()
+
+        self._db = self._open_persistent(persist_path) if persist_path else None
+
+    def _open_persistent(self, path: str) -> sqlite3.Connection:
+        """Открытие SQLite-хранилища кэша"""
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                category TEXT NOT NULL,
+                message TEXT NOT NULL,
+                kb_version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (category, message)
+            )
+        """)
+        db.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        return db
+
+    def get(self, message: str, category: str, kb_version: str = "") -> Optional[str]:
+        """Поиск ответа в кэше"""
+        normalized = normalize_message(message)
+        now = time.time()
+        response = self._get_memory(category, normalized, kb_version, now)
+        if response is None:
+            response = self._get_persistent(category, normalized, kb_version, now)
+        if response is None:
+            self._stats["misses"] += 1
+        return response
+
+    async def aget(self, message: str, category: str, kb_version: str = "") -> Optional[str]:
+        """Поиск ответа из event loop (хранилище SQLite - в отдельном потоке)"""
+        normalized = normalize_message(message)
+        now = time.time()
+        response = self._get_memory(category, normalized, kb_version, now)
+        if response is None and self._db is not None:
+            response = await asyncio.to_thread(self._get_persistent, category, normalized, kb_version, now)
+        if response is None:
+            self._stats["misses"] += 1
+        return response
+
+    def set(self, message: str, category: str, response: str, kb_version: str = ""):
+        """Сохранение ответа в кэш"""
+        normalized = normalize_message(message)
+        expires_at = time.time() + self.ttl_seconds
+        self._put(category, normalized, kb_version, response, expires_at)
+        self._set_persistent(category, normalized, kb_version, response, expires_at)
+
+    async def aset(self, message: str, category: str, response: str, kb_version: str = ""):
+        """Сохранение ответа из event loop (хранилище SQLite - в отдельном потоке)"""
+        normalized = normalize_message(message)
+        expires_at = time.time() + self.ttl_seconds
+        self._put(category, normalized, kb_version, response, expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_persistent, category, normalized, kb_version, response, expires_at)
+
+    def invalidate_category(self, category: str):
+        """Удаление всех ответов категории (например, после правки статьи)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == category]:
+                self._remove(key)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM response_cache WHERE category = ?", (category,))
+        self._stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        hits = self._stats["hits_exact"] + self._stats["hits_similar"] + self._stats["hits_persistent"]
+        lookups = hits + self._stats["misses"]
+        return {
+            "size": len(self._entries),
+            "hits_exact": self._stats["hits_exact"],
+            "hits_similar": self._stats["hits_similar"],
+            "hits_persistent": self._stats["hits_persistent"],
+            "misses": self._stats["misses"],
+            "evictions": self._stats["evictions"],
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+        }
+
+    def _is_valid(self, entry: _Entry, kb_version: str, now: float) -> bool:
+        return entry.expires_at > now and entry.kb_version == kb_version
+
+    def _get_memory(self, category: str, normalized: str, kb_version: str, now: float) -> Optional[str]:
+        with self._lock:
+            key = (category, normalized)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_valid(entry, kb_version, now):
+                    self._entries.move_to_end(key)
+                    self._stats["hits_exact"] += 1
+                    return entry.response
+                self._remove(key)
+
+            similar = self._find_similar(category, normalized, kb_version, now)
+            if similar is not None:
+                self._entries.move_to_end(similar)
+                self._stats["hits_similar"] += 1
+                return self._entries[similar].response
+        return None
+
+    def _put(self, category: str, normalized: str, kb_version: str, response: str, expires_at: float):
+        key = (category, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            entry = _Entry(response, kb_version, expires_at, shingles(normalized))
+            self._entries[key] = entry
+            index = self._index.setdefault(category, {})
+            for shingle in entry.shingles:
+                index.setdefault(shingle, set()).add(normalized)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key)
+        index = self._index.get(key[0], {})
+        for shingle in entry.shingles:
+            postings = index.get(shingle)
+            if postings is not None:
+                postings.discard(key[1])
+                if not postings:
+                    del index[shingle]
+
+    def _find_similar(self, category: str, normalized: str, kb_version: str, now: float) -> Optional[Tuple[str, str]]:
+        """Поиск почти дубликата по инвертированному индексу n-грамм
+
+        Пересечение множеств считается по спискам вхождений, поэтому
+        сравниваются только записи, имеющие общие n-граммы с вопросом.
+        """
+        index = self._index.get(category)
+        if not index:
+            return None
+
+        query = shingles(normalized)
+        shared = Counter()
+        for shingle in query:
+            for candidate in index.get(shingle, ()):
+                shared[candidate] += 1
+
+        best_key, best_score = None, 0.0
+        for candidate, common in shared.items():
+            entry = self._entries[(category, candidate)]
+            score = common / (len(query) + len(entry.shingles) - common)
+            if score >= self.similarity_threshold and score > best_score \
+                    and self._is_valid(entry, kb_version, now):
+                best_key, best_score = (category, candidate), score
+        return best_key
+
+    def _get_persistent(self, category: str, normalized: str, kb_version: str, now: float) -> Optional[str]:
+        """Точное совпадение в хранилище; запись возвращается в память со своим сроком"""
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT response, expires_at FROM response_cache "
+                "WHERE category = ? AND message = ? AND kb_version = ? AND expires_at > ?",
+                (category, normalized, kb_version, now)
+            ).fetchone()
+        if row is None:
+            return None
+        self._stats["hits_persistent"] += 1
+        self._put(category, normalized, kb_version, row[0], row[1])
+        return row[0]
+
+    def _set_persistent(self, category: str, normalized: str, kb_version: str, response: str, expires_at: float):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (category, normalized, kb_version, response, expires_at)
+            )
@@ -0,0 +1,356 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, column, func, literal_column, select, table, text, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.models.conversation import Conversation
+from app.services.knowledge_base import tokenize
+
+# Порядок результатов: по релевантности или от новых к старым
+SEARCH_ORDERS = ("relevance", "recent")
+
+# Длина превью сообщения в результатах
+PREVIEW_LENGTH = 100
+
+def search_terms(query: str) -> List[str]:
+    """Термины запроса (основы слов без стоп-слов, как в базе знаний)
+
+    ValueError, если в запросе нет ни одного термина.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        raise ValueError("Пустой поисковый запрос")
+    return terms
+
+def encode_search_cursor(order: str, conversation_id: int, score: float = 0.0, bound: int = 0) -> str:
+    """Курсор страницы: id последней строки, а для порядка по релевантности
+    еще ее оценка и нижняя граница id окна кандидатов"""
+    raw = str(conversation_id) if order == "recent" else f"{score!r}|{conversation_id}|{bound}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_search_cursor(cursor: str, order: str) -> Tuple[int, float, int]:
+    """Разбор курсора страницы: (id, оценка, граница окна); ValueError, если курсор поврежден"""
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        if order == "recent":
+            (conversation_id,) = parts
+            return int(conversation_id), 0.0, 0
+        score, conversation_id, bound = parts
+        return int(conversation_id), float(score), int(bound)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+class SearchBackend:
+    """Полнотекстовый индекс по user_message и bot_response для конкретной СУБД
+
+    Индекс обновляется самой СУБД при вставке и удалении диалогов
+    (триггеры или индекс по выражению), поэтому пакетная запись
+    диалогов ничего не знает о поиске. Оценка score - чем меньше, тем
+    релевантнее.
+    """
+
+    dialect = ""
+
+    def install(self, connection: Connection) -> bool:
+        """Создание индекса, если его нет; True, если индекс создан сейчас"""
+        raise NotImplementedError
+
+    def rebuild(self, connection: Connection):
+        """Перестроение индекса по всей таблице conversations"""
+        raise NotImplementedError
+
+    def uninstall(self, connection: Connection):
+        """Удаление индекса (и триггеров синхронизации)"""
+        raise NotImplementedError
+
+    def source(self):
+        """FROM для поиска: диалоги, соединенные с индексом"""
+        raise NotImplementedError
+
+    def row_id(self):
+        """id диалога в source, по которому индекс умеет идти по порядку"""
+        return Conversation.id
+
+    def match(self, terms: List[str]):
+        """Условие совпадения всех терминов (префиксный поиск)"""
+        raise NotImplementedError
+
+    def score(self, terms: List[str]):
+        """Оценка релевантности совпавшей строки"""
+        raise NotImplementedError
+
+    def snippets(self, db: Session, terms: List[str], ids: List[int]) -> Dict[int, str]:
+        """Фрагменты текста с подсветкой терминов для строк страницы"""
+        return {}
+
+class SQLiteSearchBackend(SearchBackend):
+    """SQLite FTS5: внешняя таблица conversations_fts поверх conversations
+
+    Текст хранится только в conversations, индекс синхронизируется
+    триггерами на вставку, удаление (в том числе перенос в архив) и
+    изменение текста. Оценка - bm25.
+    """
+
+    dialect = "sqlite"
+    fts = table("conversations_fts", column("rowid", Integer))
+
+    DDL = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+            user_message, bot_response,
+            content='conversations', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts(rowid, user_message, bot_response)
+            VALUES (new.id, new.user_message, new.bot_response);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, user_message, bot_response)
+            VALUES ('delete', old.id, old.user_message, old.bot_response);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS conversations_fts_update
+        AFTER UPDATE OF user_message, bot_response ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, user_message, bot_response)
+            VALUES ('delete', old.id, old.user_message, old.bot_response);
+            INSERT INTO conversations_fts(rowid, user_message, bot_response)
+            VALUES (new.id, new.user_message, new.bot_response);
+        END""",
+    ]
+
+    def install(self, connection: Connection) -> bool:
+        exists = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        )).first() is not None
+        for statement in self.DDL:
+            connection.execute(text(statement))
+        return not exists
+
+    def rebuild(self, connection: Connection):
+        connection.execute(text("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')"))
+        connection.execute(text("INSERT INTO conversations_fts(conversations_fts) VALUES ('optimize')"))
+
+    def uninstall(self, connection: Connection):
+        for trigger in ("insert", "delete", "update"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS conversations_fts_{trigger}"))
+        connection.execute(text("DROP TABLE IF EXISTS conversations_fts"))
+
+    def source(self):
+        return self.fts.join(Conversation.__table__, Conversation.id == self.fts.c.rowid)
+
+    def row_id(self):
+        # Порядок и диапазон по rowid FTS5 отдает без сортировки всех совпадений
+        return self.fts.c.rowid
+
+    def match(self, terms: List[str]):
+        return literal_column("conversations_fts").op("MATCH")(self._query(terms))
+
+    def score(self, terms: List[str]):
+        return func.bm25(literal_column("conversations_fts"))
+
+    def snippets(self, db: Session, terms: List[str], ids: List[int]) -> Dict[int, str]:
+        if not ids:
+            return {}
+        snippet = func.snippet(literal_column("conversations_fts"), -1, "[", "]", "...", 12)
+        rows = db.execute(
+            select(self.fts.c.rowid, snippet).select_from(self.fts).where(
+                # FTS5 выполняет rowid IN (...) отдельным поиском на каждый id,
+                # а диапазон - одним проходом; IN по выражению только фильтрует
+                self.match(terms), self.fts.c.rowid.between(min(ids), max(ids)),
+                (self.fts.c.rowid + 0).in_(ids)
+            )
+        )
+        return {row[0]: row[1] for row in rows}
+
+    def _query(self, terms: List[str]) -> str:
+        # Каждый термин - строка в кавычках с префиксным поиском: синтаксис
+        # FTS5 (OR, NEAR, скобки) из пользовательского ввода не интерпретируется
+        return " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """PostgreSQL: GIN-индекс по выражению to_tsvector
+
+    Индекс по выражению обновляется самой СУБД, отдельной таблицы и
+    триггеров не нужно. Для использования индекса выражение в запросе
+    совпадает с выражением индекса. Оценка - ts_rank_cd со знаком минус.
+    """
+
+    dialect = "postgresql"
+    config = "russian"
+    index_name = "ix_conversations_fts"
+
+    def _vector(self):
+        return func.to_tsvector(
+            literal_column(f"'{self.config}'::regconfig"),
+            func.coalesce(Conversation.user_message, "") + " " + func.coalesce(Conversation.bot_response, "")
+        )
+
+    def _tsquery(self, terms: List[str]):
+        # Термины экранируются как лексемы в кавычках; :* - префиксный поиск
+        query = " & ".join("'{}':*".format(term.replace("'", "''").replace("\\", "\\\\")) for term in terms)
+        return func.to_tsquery(literal_column(f"'{self.config}'::regconfig"), query)
+
+    def install(self, connection: Connection) -> bool:
+        exists = connection.execute(
+            text("SELECT 1 FROM pg_indexes WHERE indexname = :name"), {"name": self.index_name}
+        ).first() is not None
+        if not exists:
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {self.index_name} ON conversations USING GIN "
+                f"(to_tsvector('{self.config}'::regconfig, "
+                f"coalesce(user_message, '') || ' ' || coalesce(bot_response, '')))"
+            ))
+        return not exists
+
+    def rebuild(self, connection: Connection):
+        connection.execute(text(f"REINDEX INDEX {self.index_name}"))
+
+    def uninstall(self, connection: Connection):
+        connection.execute(text(f"DROP INDEX IF EXISTS {self.index_name}"))
+
+    def source(self):
+        return Conversation.__table__
+
+    def match(self, terms: List[str]):
+        return self._vector().op("@@")(self._tsquery(terms))
+
+    def score(self, terms: List[str]):
+        return -func.ts_rank_cd(self._vector(), self._tsquery(terms))
+
+    def snippets(self, db: Session, terms: List[str], ids: List[int]) -> Dict[int, str]:
+        if not ids:
+            return {}
+        headline = func.ts_headline(
+            literal_column(f"'{self.config}'::regconfig"),
+            Conversation.user_message + " " + Conversation.bot_response,
+            self._tsquery(terms),
+            "StartSel=[, StopSel=], MaxWords=20, MinWords=5"
+        )
+        rows = db.execute(select(Conversation.id, headline).where(Conversation.id.in_(ids)))
+        return {row[0]: row[1] for row in rows}
+
+SEARCH_BACKENDS = {backend.dialect: backend for backend in (SQLiteSearchBackend, PostgresSearchBackend)}
+
+def search_backend_for(dialect: str) -> Optional[SearchBackend]:
+    """Реализация поиска для СУБД (None, если СУБД не поддерживается)"""
+    backend = SEARCH_BACKENDS.get(dialect)
+    return backend() if backend is not None else None
+
+def install_search_index(connection: Connection) -> bool:
+    """Создание индекса поиска в существующей базе с заполнением по уже
+    сохраненным диалогам; False, если СУБД не поддерживается"""
+    backend = search_backend_for(connection.dialect.name)
+    if backend is None:
+        return False
+    if backend.install(connection):
+        backend.rebuild(connection)
+    return True
+
+def drop_search_index(connection: Connection):
+    """Удаление индекса поиска (например, перед удалением таблиц)"""
+    backend = search_backend_for(connection.dialect.name)
+    if backend is not None:
+        backend.uninstall(connection)
+
+class ConversationSearch:
+    """Поиск диалогов для специалистов поддержки
+
+    Результаты фильтруются по категории, пользователю и периоду и
+    отдаются страницами по ключу, без OFFSET. Порядок recent - от новых
+    к старым по порядку записи (id), индекс отдает его без сортировки.
+    Порядок relevance ранжирует не все совпадения, а max_candidates самых
+    новых из них: оценка каждой строки недешева, а частое слово
+    совпадает с сотнями тысяч диалогов. Граница окна кандидатов
+    сохраняется в курсоре, поэтому страницы одного поиска согласованы.
+    """
+
+    def __init__(self, backend: SearchBackend, max_candidates: int = 20000):
+        self.backend = backend
+        self.max_candidates = max_candidates
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        category: Optional[str] = None,
+        user_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        order: str = "relevance",
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Страница результатов поиска (ValueError при пустом запросе или плохом курсоре)"""
+        if order not in SEARCH_ORDERS:
+            raise ValueError(f"Неизвестный порядок: {order}")
+        terms = search_terms(query)
+        after_id, after_score, bound = decode_search_cursor(cursor, order) if cursor else (None, 0.0, None)
+
+        conditions = [self.backend.match(terms)]
+        if category is not None:
+            # Диалоги без категории относятся к general, как в статистике
+            conditions.append(func.coalesce(Conversation.category, "general") == category)
+        if user_id is not None:
+            conditions.append(Conversation.user_id == user_id)
+        if start is not None:
+            conditions.append(Conversation.timestamp >= start)
+        if end is not None:
+            conditions.append(Conversation.timestamp < end)
+
+        row_id = self.backend.row_id()
+        score = self.backend.score(terms).label("score")
+        statement = select(
+            Conversation.id,
+            Conversation.user_id,
+            Conversation.category,
+            Conversation.timestamp,
+            func.substr(Conversation.user_message, 1, PREVIEW_LENGTH + 1).label("message"),
+            score
+        ).select_from(self.backend.source()).where(*conditions)
+
+        if order == "recent":
+            if after_id is not None:
+                statement = statement.where(row_id < after_id)
+            statement = statement.order_by(row_id.desc())
+        else:
+            if bound is None:
+                bound = self._candidates_bound(db, conditions)
+            if bound:
+                statement = statement.where(row_id >= bound)
+            if after_id is not None:
+                statement = statement.where((score > after_score) | ((score == after_score) & (row_id > after_id)))
+            statement = statement.order_by(score, row_id)
+
+        rows = db.execute(statement.limit(limit + 1)).all()
+        page = rows[:limit]
+        snippets = self.backend.snippets(db, terms, [row.id for row in page])
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_search_cursor(order, page[-1].id, float(page[-1].score), bound or 0)
+        return {
+            "results": [
+                {
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "category": row.category or "general",
+                    "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+                    "message": row.message[:PREVIEW_LENGTH] + "..." if len(row.message) > PREVIEW_LENGTH else row.message,
+                    "snippet": snippets.get(row.id),
+                    "score": round(float(row.score), 6)
+                }
+                for row in page
+            ],
+            "next_cursor": next_cursor
+        }
+
+    def _candidates_bound(self, db: Session, conditions: list) -> int:
+        """Наименьший id среди max_candidates самых новых совпадений (0 - ранжировать все)"""
+        row_id = self.backend.row_id()
+        bound = db.execute(
+            select(row_id).select_from(self.backend.source()).where(*conditions)
+            .order_by(row_id.desc()).offset(self.max_candidates - 1).limit(1)
+        ).scalar()
+        return bound or 0
@@ -0,0 +1,86 @@
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class _Flight:
+    """Один выполняющийся (или недавно завершившийся) вызов"""
+
+    __slots__ = ("task", "waiters", "finished_at", "abandoned")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        self.finished_at: Optional[float] = None
+        self.abandoned = False  # Все ожидающие отменены, задача отменяется
+
+class SingleFlight:
+    """Объединение одновременных одинаковых вызовов (single flight)
+
+    Вызовы с одинаковым ключом, пришедшие, пока первый еще выполняется,
+    не запускают новую корутину, а ждут результат первого - значение или
+    исключение. Результат остается доступным еще window секунд после
+    завершения. Вызов выполняется отдельной задачей: отмена одного из
+    ожидающих не отменяет остальных, задача отменяется, только когда
+    ждать ее результата больше некому.
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats = Counter()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Результат func() для key, общий для одновременных вызовов"""
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(key)
+        if flight is not None and (flight.abandoned or (
+            flight.finished_at is not None and loop.time() - flight.finished_at > self.window
+        )):
+            flight = None
+
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self._stats["calls"] += 1
+        else:
+            self._stats["shared"] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.abandoned = True
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Число выполненных вызовов и сэкономленных (объединенных) вызовов"""
+        calls, shared = self._stats["calls"], self._stats["shared"]
+        return {
+            "calls": calls,
+            "shared": shared,
+            "saved_ratio": round(shared / (calls + shared), 4) if calls + shared else 0.0,
+            "in_flight": sum(1 for flight in self._flights.values() if flight.finished_at is None),
+            "window_seconds": self.window
+        }
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        loop = asyncio.get_running_loop()
+        flight.finished_at = loop.time()
+        if not flight.task.cancelled():
+            # Исключение уже получили ожидающие; помечаем его прочитанным
+            flight.task.exception()
+        if self.window > 0 and not flight.task.cancelled():
+            loop.call_later(self.window, self._forget, key, flight)
+        else:
+            self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
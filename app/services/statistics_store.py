@@ -0,0 +1,219 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+from collections import Counter
+
+from app.models.conversation import Conversation
+from app.models.statistics import HourlyStat, CategoryStat, UserStat, LatencyStat
+
+# Способы объединения колонки счетчика с уже записанным значением
+ADD, MIN, MAX = 'add', 'min', 'max'
+
+def to_naive_utc(timestamp: datetime) -> datetime:
+    """Момент времени в UTC без часового пояса, как он хранится в базе"""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+def utc_epoch(timestamp: datetime) -> float:
+    """Секунды Unix для момента из базы (без часового пояса - это UTC)"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    """Начало часа, к которому относится момент времени"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+class StatisticsStore:
+    """Инкрементальные счетчики обращений (rollup-таблицы)
+
+    Счетчики обновляются в той же транзакции, что и запись диалога,
+    поэтому статистика не требует сканирования таблицы conversations.
+    """
+
+    # 150 строк x 6 колонок укладываются в лимит 999 параметров старых SQLite
+    CHUNK_SIZE = 150
+
+    def record(self, db: Session, conversation: Conversation):
+        """Учет одного диалога (без commit)"""
+        self.record_many(db, [conversation])
+
+    def record_many(self, db: Session, conversations: Iterable[Conversation]):
+        """Учет пачки диалогов (без commit)"""
+        hourly: Dict[Tuple[datetime, str], List[int]] = {}
+        categories = Counter()
+        users: Dict[str, Tuple[int, datetime, datetime]] = {}
+
+        for conv in conversations:
+            timestamp = conv.timestamp or datetime.utcnow()
+            category = conv.category or 'general'
+            # [обращений, сумма времени ответа, обращений с замером]
+            counters = hourly.setdefault((hour_bucket(timestamp), category), [0, 0, 0])
+            counters[0] += 1
+            if conv.response_time_ms is not None:
+                counters[1] += conv.response_time_ms
+                counters[2] += 1
+            categories[category] += 1
+
+            count, first, last = users.get(conv.user_id, (0, timestamp, timestamp))
+            users[conv.user_id] = (count + 1, min(first, timestamp), max(last, timestamp))
+
+        self._apply(
+            db,
+            [{'bucket': bucket, 'category': category, 'count': count,
+              'response_time_sum': time_sum, 'response_time_count': time_count}
+             for (bucket, category), (count, time_sum, time_count) in hourly.items()],
+            [{'category': category, 'count': count} for category, count in categories.items()],
+            [{'user_id': user_id, 'count': count, 'first_contact': first, 'last_contact': last}
+             for user_id, (count, first, last) in users.items()]
+        )
+
+    def record_latency(self, db: Session, deltas: Iterable[Tuple[Tuple[datetime, str, str, int], int]]):
+        """Прибавление дельт гистограмм времени этапов (без commit)"""
+        rows = [
+            {'day': day, 'category': category, 'stage': stage, 'bucket': bucket, 'count': count}
+            for (day, category, stage, bucket), count in deltas
+        ]
+        self._upsert(db, LatencyStat, ['day', 'category', 'stage', 'bucket'], {'count': ADD}, rows)
+
+    def rebuild(self, db: Session, archived: Iterable[Conversation] = ()) -> int:
+        """Полный пересчет счетчиков по таблице conversations
+
+        archived - диалоги, перенесенные в архив: они учитываются наравне
+        со строками таблицы, иначе пересчет потерял бы историю.
+        Гистограммы времени этапов (stats_latency) не пересчитываются:
+        замеров по этапам в таблице conversations нет.
+        Возвращает количество учтенных диалогов.
+        """
+        db.query(HourlyStat).delete()
+        db.query(CategoryStat).delete()
+        db.query(UserStat).delete()
+
+        category = func.coalesce(Conversation.category, 'general')
+
+        bucket = self._hour_bucket_expr(db)
+        hourly_rows = db.query(
+            bucket.label('bucket'),
+            category.label('category'),
+            func.count(Conversation.id).label('count'),
+            func.coalesce(func.sum(Conversation.response_time_ms), 0).label('response_time_sum'),
+            func.count(Conversation.response_time_ms).label('response_time_count')
+        ).filter(Conversation.timestamp.isnot(None)).group_by(bucket, category).all()
+
+        category_rows = db.query(
+            category.label('category'),
+            func.count(Conversation.id).label('count')
+        ).group_by(category).all()
+
+        user_rows = db.query(
+            Conversation.user_id,
+            func.count(Conversation.id).label('count'),
+            func.min(Conversation.timestamp).label('first_contact'),
+            func.max(Conversation.timestamp).label('last_contact')
+        ).group_by(Conversation.user_id).all()
+
+        self._apply(
+            db,
+            [{'bucket': self._as_datetime(row.bucket), 'category': row.category, 'count': row.count,
+              'response_time_sum': row.response_time_sum, 'response_time_count': row.response_time_count}
+             for row in hourly_rows],
+            [{'category': row.category, 'count': row.count} for row in category_rows],
+            [{'user_id': row.user_id, 'count': row.count,
+              'first_contact': row.first_contact, 'last_contact': row.last_contact}
+             for row in user_rows]
+        )
+
+        total = sum(row.count for row in category_rows)
+        batch = []
+        for conversation in archived:
+            batch.append(conversation)
+            if len(batch) >= 1000:
+                self.record_many(db, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.record_many(db, batch)
+            total += len(batch)
+        return total
+
+    def _apply(self, db: Session, hourly: list, categories: list, users: list):
+        """Прибавление дельт к счетчикам через upsert"""
+        self._upsert(db, HourlyStat, ['bucket', 'category'],
+                     {'count': ADD, 'response_time_sum': ADD, 'response_time_count': ADD}, hourly)
+        self._upsert(db, CategoryStat, ['category'], {'count': ADD}, categories)
+        self._upsert(db, UserStat, ['user_id'],
+                     {'count': ADD, 'first_contact': MIN, 'last_contact': MAX}, users)
+
+    def _upsert(self, db: Session, model, keys: List[str], merge: Dict[str, str], rows: list):
+        """Вставка строк счетчиков или объединение с существующими по ключу keys
+
+        merge - способ объединения колонок: ADD, MIN или MAX. В SQLite и
+        PostgreSQL - INSERT ... ON CONFLICT DO UPDATE пачками, в остальных
+        БД - выборка строки с блокировкой и обновление.
+        """
+        insert = self._insert_for(db)
+        if insert is None:
+            self._upsert_rows(db, model, keys, merge, rows)
+            return
+        for chunk in self._chunks(rows):
+            stmt = insert(model).values(chunk)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[getattr(model, key) for key in keys],
+                set_={
+                    column: self._merge_expr(getattr(model, column), stmt.excluded[column], how)
+                    for column, how in merge.items()
+                }
+            ))
+
+    def _upsert_rows(self, db: Session, model, keys: List[str], merge: Dict[str, str], rows: list):
+        """Upsert без ON CONFLICT: SELECT ... FOR UPDATE и обновление в Python"""
+        for row in rows:
+            existing = db.get(model, tuple(row[key] for key in keys), with_for_update=True)
+            if existing is None:
+                db.add(model(**row))
+                continue
+            for column, how in merge.items():
+                setattr(existing, column, self._merge_value(getattr(existing, column), row[column], how))
+
+    def _merge_expr(self, current, added, how: str):
+        if how == ADD:
+            return current + added
+        if how == MIN:
+            return case((current <= added, current), else_=added)
+        return case((current >= added, current), else_=added)
+
+    def _merge_value(self, current, added, how: str):
+        if how == ADD:
+            return current + added
+        if how == MIN:
+            return min(current, added)
+        return max(current, added)
+
+    def _chunks(self, rows: list):
+        """Разбиение на пачки с учетом лимита параметров SQLite"""
+        for i in range(0, len(rows), self.CHUNK_SIZE):
+            yield rows[i:i + self.CHUNK_SIZE]
+
+    def _hour_bucket_expr(self, db: Session):
+        """SQL-выражение начала часа для текущей БД"""
+        if db.get_bind().dialect.name == 'postgresql':
+            return func.date_trunc('hour', Conversation.timestamp)
+        return func.strftime('%Y-%m-%d %H:00:00', Conversation.timestamp)
+
+    def _as_datetime(self, value) -> datetime:
+        """SQLite возвращает strftime строкой"""
+        if isinstance(value, str):
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+        return value
+
+    def _insert_for(self, db: Session):
+        """Конструктор INSERT с поддержкой ON CONFLICT для текущей БД (None, если его нет)"""
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return postgresql.insert
+        if dialect == 'sqlite':
+            return sqlite.insert
+        return None
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому: одинаковые снимки дают одинаковый тег"""
+    return '"{}"'.format(hashlib.sha1(body).hexdigest()[:20])
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадение заголовка If-None-Match с ETag (слабое сравнение, как для GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+class StatsSnapshot:
+    """Неизменяемый снимок статистики в готовом к отдаче виде
+
+    bodies - представления по имени (json и результаты render), etags -
+    их ETag. Снимок не меняется после публикации: запросы только читают
+    его, новый снимок заменяет ссылку целиком.
+    """
+
+    __slots__ = ("stats", "bodies", "etags", "created_at", "generated_at", "compute_ms")
+
+    def __init__(self, stats: Dict[str, Any], bodies: Mapping[str, bytes], created_at: float, compute_ms: float):
+        self.stats = stats
+        self.bodies = dict(bodies)
+        self.etags = {name: make_etag(body) for name, body in self.bodies.items()}
+        self.created_at = created_at
+        self.generated_at = datetime.utcnow().isoformat()
+        self.compute_ms = compute_ms
+
+    def age(self, now: float) -> float:
+        return max(0.0, now - self.created_at)
+
+class StatsSnapshotCache:
+    """Снимок статистики с обновлением в фоне (stale-while-revalidate)
+
+    Снимок моложе refresh_interval отдается как есть. Более старый тоже
+    отдается сразу, но запускает пересчет в фоне. Снимок старше max_stale
+    не отдается: запрос ждет пересчета. Одновременные пересчеты
+    объединяются в один. Фоновая задача (start) обновляет снимок каждые
+    refresh_interval секунд, поэтому при постоянной нагрузке запросы
+    почти не ждут.
+    """
+
+    def __init__(
+        self,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        render: Optional[Callable[[Dict[str, Any]], Dict[str, str]]] = None,
+        refresh_interval: float = 10.0,
+        max_stale: float = 60.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.compute = compute
+        self.render = render
+        self.refresh_interval = refresh_interval
+        self.max_stale = max(max_stale, refresh_interval)
+        self.clock = clock
+
+        self._snapshot: Optional[StatsSnapshot] = None
+        self._refreshing: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = Counter()
+
+    async def get(self) -> StatsSnapshot:
+        """Текущий снимок с учетом границ устаревания"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age(self.clock()) > self.max_stale:
+            self._stats["waited"] += 1
+            return await self.refresh()
+        if snapshot.age(self.clock()) >= self.refresh_interval:
+            self._stats["stale"] += 1
+            self._start_refresh()
+        else:
+            self._stats["fresh"] += 1
+        return snapshot
+
+    async def refresh(self) -> StatsSnapshot:
+        """Пересчет снимка; одновременные вызовы ждут один пересчет"""
+        # Отмена ожидающего запроса не прерывает пересчет для остальных
+        return await asyncio.shield(self._start_refresh())
+
+    def count_not_modified(self):
+        self._stats["not_modified"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "refresh_interval": self.refresh_interval,
+            "max_stale": self.max_stale,
+            "age": round(snapshot.age(self.clock()), 3) if snapshot else None,
+            "compute_ms": round(snapshot.compute_ms, 1) if snapshot else None,
+            "refreshes": self._stats["refreshes"],
+            "errors": self._stats["errors"],
+            "fresh": self._stats["fresh"],
+            "stale": self._stats["stale"],
+            "waited": self._stats["waited"],
+            "not_modified": self._stats["not_modified"]
+        }
+
+    def start(self):
+        """Периодический пересчет в фоне (внутри работающего event loop)"""
+        if self._task is None and self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        for task in (self._task, self._refreshing):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._task = None
+
+    async def _build(self) -> StatsSnapshot:
+        started = self.clock()
+        stats = await self.compute()
+        bodies = {"json": json.dumps(jsonable_encoder(stats), ensure_ascii=False, separators=(",", ":")).encode()}
+        if self.render is not None:
+            bodies.update((name, text.encode()) for name, text in self.render(stats).items())
+        # Возраст снимка отсчитывается от начала расчета: данные - на этот момент
+        snapshot = StatsSnapshot(stats, bodies, created_at=started, compute_ms=(self.clock() - started) * 1000)
+        self._snapshot = snapshot
+        self._stats["refreshes"] += 1
+        return snapshot
+
+    def _refreshed(self, future: asyncio.Future):
+        self._refreshing = None
+        if not future.cancelled() and future.exception() is not None:
+            self._stats["errors"] += 1
+
+    def _start_refresh(self) -> asyncio.Future:
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._build())
+            self._refreshing.add_done_callback(self._refreshed)
+        return self._refreshing
+
+    async def _refresh_periodically(self):
+        while True:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.age(self.clock()) < self.refresh_interval:
+                # Снимок уже свежий (посчитан главным процессом serve.py до fork)
+                await asyncio.sleep(self.refresh_interval - snapshot.age(self.clock()))
+                continue
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Ошибка обновления снимка статистики: {e}")
+            await asyncio.sleep(self.refresh_interval)
@@ -0,0 +1,181 @@
+import asyncio
+import mmap
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Поля строки воркера на табло (числа float64)
+FIELDS = (
+    "pid", "started_at", "ready", "heartbeat", "requests", "in_flight",
+    "llm_in_flight", "write_queue_depth", "rss_bytes"
+)
+_OFFSETS = {name: offset for offset, name in enumerate(FIELDS)}
+
+def current_rss_bytes() -> int:
+    """Резидентная память процесса (текущая, а не пиковая, где это возможно)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Без /proc - только пиковое значение (в macOS в байтах, в остальных - в КБ)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class Warmup:
+    """Этапы прогрева процесса и их длительность для /ready
+
+    preloaded - прогрев выполнен главным процессом serve.py до fork,
+    ready - приложение запущено и принимает запросы.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.preloaded = False
+        self.ready = False
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record(self, name: str, ms: float):
+        self.stages[name] = round(ms, 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "preloaded": self.preloaded,
+            "pid": os.getpid(),
+            "stages_ms": dict(self.stages),
+            "total_ms": round(sum(self.stages.values()), 1)
+        }
+
+class WorkerScoreboard:
+    """Табло воркеров в общей памяти
+
+    Анонимный mmap создается главным процессом до fork и виден всем
+    воркерам. У каждого воркера своя строка, в которую пишет только он
+    сам, поэтому блокировки не нужны: выровненные 8-байтовые записи не
+    разрываются, а общие значения - сумма по строкам. Строку завершившегося
+    воркера главный процесс очищает (clear), перезапущенный - заполняет
+    заново (attach).
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._buffer = mmap.mmap(-1, workers * len(FIELDS) * 8)
+        self._values = memoryview(self._buffer).cast("d")
+        self._row: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def attach(self, index: int):
+        """Закрепление строки index за текущим процессом (в воркере после fork)"""
+        self.clear(index)
+        self._row = index * len(FIELDS)
+        self.set("pid", os.getpid())
+        self.set("started_at", time.time())
+
+    def clear(self, index: int):
+        base = index * len(FIELDS)
+        for offset in range(len(FIELDS)):
+            self._values[base + offset] = 0.0
+
+    def set(self, field: str, value: float):
+        if self._row is not None:
+            self._values[self._row + _OFFSETS[field]] = value
+
+    def add(self, field: str, amount: float = 1.0):
+        if self._row is not None:
+            self._values[self._row + _OFFSETS[field]] += amount
+
+    def rows(self) -> List[Dict[str, float]]:
+        """Строки запущенных воркеров"""
+        width = len(FIELDS)
+        rows = []
+        for index in range(self.workers):
+            values = self._values[index * width:(index + 1) * width].tolist()
+            if values[_OFFSETS["pid"]]:
+                rows.append(dict(zip(FIELDS, values)))
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        rows = self.rows()
+        return {
+            "workers": self.workers,
+            "running": len(rows),
+            "ready": sum(1 for row in rows if row["ready"]),
+            "requests": int(sum(row["requests"] for row in rows)),
+            "in_flight": int(sum(row["in_flight"] for row in rows)),
+            "llm_in_flight": int(sum(row["llm_in_flight"] for row in rows)),
+            "rss_mb": round(sum(row["rss_bytes"] for row in rows) / 2 ** 20, 1),
+            "per_worker": [
+                {
+                    "pid": int(row["pid"]),
+                    "ready": bool(row["ready"]),
+                    "uptime": round(now - row["started_at"], 1),
+                    "heartbeat_age": round(now - row["heartbeat"], 1) if row["heartbeat"] else None,
+                    "requests": int(row["requests"]),
+                    "in_flight": int(row["in_flight"]),
+                    "llm_in_flight": int(row["llm_in_flight"]),
+                    "write_queue_depth": int(row["write_queue_depth"]),
+                    "rss_mb": round(row["rss_bytes"] / 2 ** 20, 1)
+                }
+                for row in rows
+            ]
+        }
+
+    # --- Публикация состояния воркера ---
+
+    def publish(self, sample: Callable[[], Dict[str, float]]):
+        for field, value in sample().items():
+            self.set(field, value)
+        self.set("rss_bytes", current_rss_bytes())
+        self.set("heartbeat", time.time())
+
+    def start(self, sample: Callable[[], Dict[str, float]], interval: float = 1.0):
+        """Периодическая запись нагрузки и памяти воркера (внутри работающего event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._publish_periodically(sample, interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.set("ready", 0)
+
+    async def _publish_periodically(self, sample: Callable[[], Dict[str, float]], interval: float):
+        while True:
+            try:
+                self.publish(sample)
+            except Exception as e:
+                print(f"Ошибка обновления табло воркеров: {e}")
+            await asyncio.sleep(interval)
+
+class ScoreboardMiddleware:
+    """ASGI-middleware: число запросов воркера и запросы в работе на табло"""
+
+    def __init__(self, app, scoreboard: WorkerScoreboard):
+        self.app = app
+        self.scoreboard = scoreboard
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.scoreboard.add("requests")
+        self.scoreboard.add("in_flight")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.scoreboard.add("in_flight", -1)
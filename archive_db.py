@@ -0,0 +1,38 @@
+"""Перенос старых диалогов из таблицы conversations в архив
+
+Запуск:
+    python archive_db.py --days 90
+    python archive_db.py --days 90 --vacuum
+"""
+
+import argparse
+import sys
+import os
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine, init_db, SessionLocal
+from app.services.archive import ConversationArchive, ConversationArchiver
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=settings.ARCHIVE_AFTER_DAYS or 90,
+                        help="сколько последних дней оставить в таблице")
+    parser.add_argument("--dir", default=settings.ARCHIVE_DIR, help="каталог архива")
+    parser.add_argument("--vacuum", action="store_true", help="вернуть освободившееся место (только SQLite)")
+    args = parser.parse_args()
+
+    init_db()
+    archiver = ConversationArchiver(SessionLocal, ConversationArchive(args.dir), retention_days=args.days)
+    print(f"Перенос в {args.dir} диалогов старше {archiver.cutoff():%Y-%m-%d}...")
+    result = archiver.run()
+    print(f"Готово: перенесено диалогов - {result['archived']}, дней - {result['days']}")
+
+    if args.vacuum and engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM"))
+        print("Место в файле базы освобождено")
@@ -0,0 +1,81 @@
+"""Бенчмарк контроля приема запросов к чату
+
+Замеряет стоимость одного решения AdmissionController (в памяти и в
+общем файле SQLite для нескольких воркеров) на потоке запросов от
+--users пользователей и моделирует "скрипт в цикле": один пользователь
+шлет --flood запросов в секунду наравне с обычными пользователями,
+которые пишут раз в несколько секунд. Выводится доля принятых запросов
+скрипта и обычных пользователей.
+
+Запуск:
+    python benchmarks/bench_admission.py --decisions 200000 --users 10000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from app.services.admission import (  # noqa: E402
+    ADMIT, AdmissionController, MemoryBucketStore, SQLiteBucketStore
+)
+
+
+def decision_us(store, decisions: int, users: int) -> dict:
+    """Время одного решения, мкс"""
+    controller = AdmissionController(store, user_rate=1.0, user_burst=20, global_rate=1000.0, global_burst=1000)
+    keys = [f"user_{random.randrange(users)}" for _ in range(decisions)]
+    started = time.perf_counter()
+    for key in keys:
+        controller.admit(key)
+    seconds = time.perf_counter() - started
+    return {"decision_us": round(seconds / decisions * 1e6, 2), **controller.get_stats()}
+
+
+def flood(seconds: int, flood_rate: int, users: int) -> dict:
+    """Доля принятых запросов скрипта и обычных пользователей на модельном времени"""
+    store = MemoryBucketStore()
+    now = [0.0]
+    store.clock = lambda: now[0]
+    controller = AdmissionController(store, user_rate=1.0, user_burst=20)
+    sent = {"flood": 0, "users": 0}
+    admitted = {"flood": 0, "users": 0}
+    for tick in range(seconds * 10):
+        now[0] = tick / 10
+        for _ in range(flood_rate // 10):
+            sent["flood"] += 1
+            admitted["flood"] += controller.admit("anonymous@10.0.0.13").action == ADMIT
+        # Обычный пользователь пишет в среднем раз в 5 секунд
+        for _ in range(users // 50):
+            sent["users"] += 1
+            admitted["users"] += controller.admit(f"user_{random.randrange(users)}").action == ADMIT
+    return {group: round(admitted[group] / sent[group], 3) for group in sent}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decisions", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--flood", type=int, default=200, help="запросов в секунду от скрипта")
+    parser.add_argument("--seconds", type=int, default=60)
+    args = parser.parse_args()
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "memory": decision_us(MemoryBucketStore(), args.decisions, args.users),
+            "sqlite": decision_us(SQLiteBucketStore(os.path.join(directory, "buckets.db")),
+                                  args.decisions // 10, args.users),
+        }
+    results["admitted_share"] = flood(args.seconds, args.flood, args.users)
+    print(json.dumps({"users": args.users, **results}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
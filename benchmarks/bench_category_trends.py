@@ -0,0 +1,104 @@
+"""Бенчмарк get_category_trends: новый движок против исходной реализации
+
+Исходная реализация делала count() на каждую пару категория x день
+(6 категорий x 30 дней = 180 запросов по таблице conversations).
+
+Запуск:
+    python benchmarks/bench_category_trends.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from seed_data import seed_conversations  # noqa: E402
+
+
+def legacy_category_trends(db, days=30):
+    """Исходная реализация: count() на каждую пару категория x день"""
+    from app.models.conversation import Conversation
+
+    trends = {}
+    categories = db.query(Conversation.category).distinct().all()
+    for category_row in categories:
+        category = category_row.category or 'general'
+        daily_data = []
+        for i in range(days):
+            date = datetime.utcnow() - timedelta(days=i)
+            start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_of_day = start_of_day + timedelta(days=1)
+            count = db.query(Conversation).filter(
+                Conversation.category == (category if category != 'general' else None),
+                Conversation.timestamp >= start_of_day,
+                Conversation.timestamp < end_of_day
+            ).count()
+            daily_data.append({'date': start_of_day.strftime('%Y-%m-%d'), 'count': count})
+        trends[category] = list(reversed(daily_data))
+    return trends
+
+
+def timed(func, repeat):
+    """Лучшее время из repeat запусков, мс"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--db", help="Готовая база (по умолчанию создается временная)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="itsupport-bench-"), "trends.db")
+    if not os.path.exists(db_path):
+        seed_time = seed_conversations(db_path, args.rows)
+        print(f"База заполнена за {seed_time:.1f} с", file=sys.stderr)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.services.analytics_service import AnalyticsService
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    db = sessionmaker(bind=engine)()
+    analytics = AnalyticsService()
+    try:
+        legacy_ms, legacy = timed(lambda: legacy_category_trends(db, args.days), 1)
+        results = {"rows": args.rows, "days": args.days, "legacy_ms": round(legacy_ms, 1)}
+        for granularity in ("hour", "day", "week"):
+            new_ms, trends = timed(
+                lambda: analytics.get_category_trends(db, days=args.days, granularity=granularity),
+                args.repeat
+            )
+            results[f"engine_{granularity}_ms"] = round(new_ms, 2)
+            if granularity == "day":
+                new = trends
+        results["speedup_day"] = round(legacy_ms / results["engine_day_ms"], 1)
+        # Исходная реализация ищет general как IS NULL и не видит строку "general" из /chat
+        results["general_legacy_total"] = sum(p["count"] for p in legacy.get("general", []))
+        results["general_engine_total"] = sum(p["count"] for p in new.get("general", []))
+        results["mismatched_categories"] = sorted(
+            c for c in set(legacy) | set(new) if legacy.get(c) != new.get(c)
+        )
+    finally:
+        db.close()
+        engine.dispose()
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Микробенчмарк классификатора сообщений
+
+Сравнивает однопроходный MessageClassifier с исходными линейными
+проверками any(keyword in message) по скорости и точности на
+размеченной выборке tests/fixtures/classifier_cases.json.
+
+Запуск:
+    python benchmarks/bench_classifier.py
+"""
+
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from app.services.classifier import MessageClassifier  # noqa: E402
+
+FIXTURE = os.path.join(ROOT, "tests", "fixtures", "classifier_cases.json")
+
+
+def legacy_classify(message: str) -> str:
+    """Исходная реализация ChatbotService.classify_message"""
+    message_lower = message.lower()
+
+    password_keywords = ["пароль", "password", "забыл", "сброс", "reset", "войти", "логин"]
+    access_keywords = ["доступ", "папка", "файл", "права", "разрешение", "access", "folder"]
+    document_keywords = ["документ", "отправить", "файл", "прикрепить", "загрузить", "document"]
+    connection_keywords = ["подключение", "интернет", "сеть", "vpn", "wi-fi", "wifi", "connection"]
+    software_keywords = ["программа", "установить", "обновить", "софт", "приложение", "software"]
+
+    if any(keyword in message_lower for keyword in password_keywords):
+        return "password"
+    elif any(keyword in message_lower for keyword in access_keywords):
+        return "access"
+    elif any(keyword in message_lower for keyword in document_keywords):
+        return "documents"
+    elif any(keyword in message_lower for keyword in connection_keywords):
+        return "connection"
+    elif any(keyword in message_lower for keyword in software_keywords):
+        return "software"
+    else:
+        return "general"
+
+
+def main():
+    with open(FIXTURE, encoding="utf-8") as f:
+        cases = json.load(f)
+    messages = [case["message"] for case in cases]
+    classifier = MessageClassifier()
+
+    def accuracy(classify):
+        return sum(classify(c["message"]) == c["category"] for c in cases) / len(cases)
+
+    number = 200
+    legacy_s = timeit.timeit(lambda: [legacy_classify(m) for m in messages], number=number)
+    compiled_s = timeit.timeit(lambda: [classifier.classify(m) for m in messages], number=number)
+    calls = number * len(messages)
+
+    # На запрос /chat исходная реализация вызывалась до трех раз
+    print(json.dumps({
+        "messages": len(messages),
+        "legacy_us_per_call": round(legacy_s / calls * 1e6, 2),
+        "compiled_us_per_call": round(compiled_s / calls * 1e6, 2),
+        "legacy_us_per_request": round(3 * legacy_s / calls * 1e6, 2),
+        "compiled_us_per_request": round(compiled_s / calls * 1e6, 2),
+        "legacy_accuracy": round(accuracy(legacy_classify), 3),
+        "compiled_accuracy": round(accuracy(lambda m: classifier.classify(m).category), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Бенчмарк ответа на типовые вопросы из базы знаний без LLM
+
+Отправляет последовательные запросы /chat с типовыми вопросами (пароль,
+VPN, доступ, установка программ) через ASGI-транспорт httpx без сети и
+замеряет p50/p95/p99 полного времени ответа, время самого
+ChatbotService.get_response и долю запросов, обработанных без LLM. Ключ OpenAI задается фиктивным: если бы запрос ушел в LLM,
+ответ пришел бы только после таймаута подключения, что сразу видно по p99.
+
+Запуск:
+    python benchmarks/bench_fast_path.py --requests 2000 --target-ms 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from load_health_under_chat import percentile  # noqa: E402
+
+MESSAGES = [
+    "Забыл пароль от почты",
+    "Как сбросить пароль?",
+    "Не работает VPN",
+    "Нет интернета",
+    "Нет доступа к общей папке",
+    "Как установить программу",
+]
+
+
+async def run_requests(count: int) -> dict:
+    import httpx
+
+    from app import main
+
+    await main.startup_event()
+    timings = []
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(count + count // 10):
+                started = time.perf_counter()
+                response = await client.post("/chat", data={
+                    "message": MESSAGES[i % len(MESSAGES)],
+                    "user_id": f"user_{i}"  # Без истории: каждый вопрос первый в диалоге
+                })
+                elapsed = (time.perf_counter() - started) * 1000
+                assert response.status_code == 200
+                if i >= count // 10:  # Первые 10% - прогрев
+                    timings.append(elapsed)
+        # Отдельно - сам ответ сервиса, без HTTP, истории и записи в БД
+        service_timings = []
+        for i in range(count):
+            started = time.perf_counter()
+            await main.chatbot_service.get_response(MESSAGES[i % len(MESSAGES)])
+            service_timings.append((time.perf_counter() - started) * 1000)
+        stats = main.chatbot_service.intent_router.get_stats()
+    finally:
+        await main.shutdown_event()
+    return {"timings": timings, "service_timings": service_timings, "fast_path": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--target-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update(
+            OPENAI_API_KEY="bench-no-llm",
+            OPENAI_BASE_URL="http://127.0.0.1:9/v1",
+            FAST_PATH_ENABLED="true",
+            RESPONSE_CACHE_ENABLED="false",
+            METRICS_ENABLED="false",
+            ADMISSION_ENABLED="false",
+            DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        )
+        result = asyncio.run(run_requests(args.requests))
+
+    timings = result["timings"]
+    p95 = percentile(timings, 95)
+    print(json.dumps({
+        "requests": args.requests,
+        "chat_ms": {
+            "p50": round(percentile(timings, 50), 2),
+            "p95": round(p95, 2),
+            "p99": round(percentile(timings, 99), 2),
+            "max": round(max(timings), 2)
+        },
+        "get_response_ms": {
+            "p50": round(percentile(result["service_timings"], 50), 3),
+            "p99": round(percentile(result["service_timings"], 99), 3)
+        },
+        "fast_path": result["fast_path"],
+        "target_ms": args.target_ms,
+        "within_target": p95 < args.target_ms
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
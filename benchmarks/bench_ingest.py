@@ -0,0 +1,119 @@
+"""Бенчмарк пакетной загрузки обращений (/api/ingest) против /chat по одному
+
+Поднимает stub-сервер OpenAI и обрабатывает один и тот же набор
+обращений (половина - типовые вопросы с ответом из базы знаний, половина -
+уникальные вопросы для LLM) двумя способами через ASGI-транспорт httpx:
+- chat - последовательные запросы /chat, как сейчас пересылаются
+  обращения из почты;
+- ingest - одно задание /api/ingest с NDJSON и потоком результатов.
+Выводится общее время и пропускная способность (ASGI-транспорт httpx
+отдает тело ответа целиком, поэтому время до первого результата здесь
+не измеряется).
+
+Запуск:
+    python benchmarks/bench_ingest.py --messages 2000 --latency-ms 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from load_health_under_chat import wait_ready  # noqa: E402
+
+KB_MESSAGES = ["Забыл пароль от почты", "Не работает VPN", "Нет доступа к общей папке"]
+
+
+def make_messages(count: int) -> list:
+    return [
+        {"id": f"mail-{i}", "user_id": f"user_{i % 500}",
+         "message": KB_MESSAGES[i % len(KB_MESSAGES)] if i % 2 else f"Странное поведение системы, заявка {i}"}
+        for i in range(count)
+    ]
+
+
+async def run(messages: list) -> dict:
+    import httpx
+
+    from app import main
+
+    await main.startup_event()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            started = time.perf_counter()
+            for item in messages:
+                response = await client.post("/chat", data={"message": item["message"], "user_id": item["user_id"]})
+                assert response.status_code == 200
+            chat_seconds = time.perf_counter() - started
+
+            body = "\n".join(json.dumps(item, ensure_ascii=False) for item in messages)
+            started = time.perf_counter()
+            results = 0
+            async with client.stream("POST", "/api/ingest", content=body.encode(),
+                                     headers={"Content-Type": "application/x-ndjson"}) as response:
+                async for line in response.aiter_lines():
+                    results += '"seq"' in line
+            ingest_seconds = time.perf_counter() - started
+        ingest_stats = main.ingest_service.get_stats()
+    finally:
+        await main.shutdown_event()
+    return {
+        "chat": {"seconds": round(chat_seconds, 2), "per_second": round(len(messages) / chat_seconds, 1)},
+        "ingest": {
+            "seconds": round(ingest_seconds, 2),
+            "per_second": round(len(messages) / ingest_seconds, 1),
+            "results": results,
+            **ingest_stats
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="INGEST_CONCURRENCY")
+    parser.add_argument("--stub-port", type=int, default=8913)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, "benchmarks/stub_openai.py", "--port", str(args.stub_port),
+         "--latency-ms", str(args.latency_ms), "--jitter-ms", "0"],
+        cwd=ROOT
+    )
+    try:
+        asyncio.run(wait_ready(f"http://127.0.0.1:{args.stub_port}/docs"))
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ.update(
+                OPENAI_API_KEY="stub",
+                OPENAI_BASE_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+                INGEST_CONCURRENCY=str(args.concurrency),
+                RESPONSE_CACHE_ENABLED="false",
+                METRICS_ENABLED="false",
+                ADMISSION_ENABLED="false",
+                DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            )
+            results = asyncio.run(run(make_messages(args.messages)))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(json.dumps({
+        "messages": args.messages,
+        "llm_latency_ms": args.latency_ms,
+        "concurrency": args.concurrency,
+        **results,
+        "speedup": round(results["chat"]["seconds"] / results["ingest"]["seconds"], 1)
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
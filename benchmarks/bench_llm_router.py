@@ -0,0 +1,123 @@
+"""Бенчмарк маршрутизатора LLM на локальных stub-серверах
+
+Поднимает два stub-сервера OpenAI с одинаковой задержкой и хвостом
+медленных ответов (--slow-rate) и отправляет запросы через LLMRouter в
+режимах: один бэкенд, два бэкенда без hedging, два бэкенда с hedging.
+Последний режим - основной бэкенд недоступен (порт без сервера): после
+открытия автомата отключения запросы сразу уходят на второй бэкенд.
+
+Запуск:
+    python benchmarks/bench_llm_router.py --requests 300 --concurrency 10 --slow-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from load_health_under_chat import percentile, wait_ready  # noqa: E402
+from app.services.llm_router import CircuitBreaker, LLMRouter, create_backend  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Не работает VPN"}]
+
+
+def make_router(ports: list, hedge: bool, hedge_delay: float, timeout: float) -> LLMRouter:
+    backends = [
+        create_backend(
+            f"stub{port}", f"http://127.0.0.1:{port}/v1", "stub", api_key="stub",
+            timeout=timeout, max_retries=0, max_connections=50, max_keepalive_connections=20,
+            breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30), alpha=0.2
+        )
+        for port in ports
+    ]
+    return LLMRouter(backends, timeout=timeout, hedge=hedge, hedge_delay=hedge_delay)
+
+
+async def run_mode(router: LLMRouter, requests: int, concurrency: int) -> dict:
+    timings, errors = [], 0
+    queue = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            started = time.perf_counter()
+            try:
+                await router.complete(messages=MESSAGES, max_tokens=50)
+                timings.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    finally:
+        stats = router.get_stats()
+        await router.aclose()
+    return {
+        "p50_ms": round(percentile(timings, 50), 1),
+        "p95_ms": round(percentile(timings, 95), 1),
+        "p99_ms": round(percentile(timings, 99), 1),
+        "errors": errors,
+        "hedged": stats["hedged"],
+        "backends": stats["backends"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=30)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--hedge-delay-ms", type=float, default=150)
+    parser.add_argument("--ports", type=int, nargs=2, default=[8911, 8912])
+    args = parser.parse_args()
+
+    stubs = [
+        subprocess.Popen(
+            [sys.executable, "benchmarks/stub_openai.py", "--port", str(port),
+             "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+             "--slow-rate", str(args.slow_rate), "--slow-ms", str(args.slow_ms)],
+            cwd=ROOT
+        )
+        for port in args.ports
+    ]
+    try:
+        for port in args.ports:
+            asyncio.run(wait_ready(f"http://127.0.0.1:{port}/docs"))
+        timeout = args.slow_ms / 1000 * 2
+        hedge_delay = args.hedge_delay_ms / 1000
+        modes = {
+            "single": make_router(args.ports[:1], False, hedge_delay, timeout),
+            "router": make_router(args.ports, False, hedge_delay, timeout),
+            "router_hedged": make_router(args.ports, True, hedge_delay, timeout),
+            # Порт 9 (discard) - соединение отклоняется, как у упавшего бэкенда
+            "primary_down": make_router([9, args.ports[1]], False, hedge_delay, timeout),
+        }
+        results = {
+            name: asyncio.run(run_mode(router, args.requests, args.concurrency))
+            for name, router in modes.items()
+        }
+    finally:
+        for stub in stubs:
+            stub.terminate()
+            stub.wait()
+
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "stub": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                 "slow_rate": args.slow_rate, "slow_ms": args.slow_ms},
+        "modes": results
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
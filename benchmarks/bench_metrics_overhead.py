@@ -0,0 +1,132 @@
+"""Бенчмарк накладных расходов метрик Prometheus на /chat
+
+Запускает приложение в отдельных процессах с METRICS_ENABLED=true и
+false (поочередно, rounds раз) и замеряет время последовательных запросов
+/chat через ASGI-транспорт httpx без сети. Ключ OpenAI не задается, поэтому
+измеряется самый быстрый путь - резервный ответ из базы знаний: на нем
+относительная доля метрик максимальна. Отдельно замеряется стоимость
+одной операции с метрикой.
+
+Запуск:
+    python benchmarks/bench_metrics_overhead.py --requests 2000 --rounds 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+MESSAGES = [
+    "Забыл пароль от почты",
+    "Нет доступа к общей папке",
+    "Не работает VPN",
+    "Как установить программу",
+    "Где найти шаблон заявления",
+]
+
+
+async def run_requests(count: int) -> list:
+    """Время (мкс) каждого из count последовательных запросов /chat"""
+    import httpx
+
+    from app import main
+
+    await main.startup_event()
+    timings = []
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(count + count // 10):
+                started = time.perf_counter()
+                response = await client.post("/chat", data={
+                    "message": MESSAGES[i % len(MESSAGES)],
+                    "user_id": f"user_{i % 50}"
+                })
+                elapsed = (time.perf_counter() - started) * 1e6
+                assert response.status_code == 200
+                if i >= count // 10:  # Первые 10% - прогрев
+                    timings.append(elapsed)
+    finally:
+        await main.shutdown_event()
+    return timings
+
+
+def child(count: int):
+    timings = asyncio.run(run_requests(count))
+    print(json.dumps({"median_us": statistics.median(timings), "mean_us": statistics.fmean(timings)}))
+
+
+def run_child(enabled: bool, count: int, directory: str) -> dict:
+    env = dict(
+        os.environ,
+        METRICS_ENABLED="true" if enabled else "false",
+        OPENAI_API_KEY="",
+        RESPONSE_CACHE_ENABLED="false",
+        ADMISSION_ENABLED="false",
+        DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(count)],
+        env=env, cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def micro_ns(iterations: int = 200000) -> dict:
+    """Стоимость одной операции с метрикой, нс"""
+    from app.services.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_total", "", ("method", "route", "status"))
+    histogram = registry.histogram("bench_seconds", "", ("route",))
+
+    def measure(func):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return round((time.perf_counter() - started) / iterations * 1e9)
+
+    return {
+        "counter_inc": measure(lambda: counter.labels("POST", "/chat", "200").inc()),
+        "histogram_observe": measure(lambda: histogram.labels("/chat").observe(0.0123)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.requests)
+        return
+
+    results = {True: [], False: []}
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                results[enabled].append(run_child(enabled, args.requests, directory)["median_us"])
+
+    baseline = statistics.median(results[False])
+    with_metrics = statistics.median(results[True])
+    print(json.dumps({
+        "requests": args.requests,
+        "rounds": args.rounds,
+        "chat_median_us": {"metrics_disabled": round(baseline, 1), "metrics_enabled": round(with_metrics, 1)},
+        "overhead_percent": round((with_metrics - baseline) / baseline * 100, 2),
+        "operation_ns": micro_ns()
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
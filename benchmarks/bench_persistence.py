@@ -0,0 +1,104 @@
+"""Бенчмарк записи диалогов: commit на каждый запрос против пакетной записи
+
+Исходный /chat делал db.add(); db.commit() на каждое сообщение прямо в
+event loop. ConversationWriter собирает диалоги из очереди в пачки.
+
+Запуск:
+    python benchmarks/bench_persistence.py --messages 5000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models.conversation import Conversation  # noqa: E402
+from app.services.conversation_writer import ConversationWriter  # noqa: E402
+from app.services.statistics_store import StatisticsStore  # noqa: E402
+
+
+def make_session_factory(workdir: str, name: str):
+    engine = create_engine(f"sqlite:///{workdir}/{name}.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def conversation(i: int) -> Conversation:
+    return Conversation(user_id=f"user_{i % 500}", user_message=f"Забыл пароль #{i}",
+                        bot_response="Ответ", timestamp=datetime.utcnow(), category="password")
+
+
+async def per_request_commit(session_factory, messages: int, concurrency: int) -> float:
+    """Исходный путь: отдельная сессия и commit на каждый запрос внутри event loop"""
+    store = StatisticsStore()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handle(i):
+        async with semaphore:
+            db = session_factory()
+            try:
+                item = conversation(i)
+                db.add(item)
+                store.record(db, item)
+                db.commit()
+            finally:
+                db.close()
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[handle(i) for i in range(messages)])
+    return time.perf_counter() - started
+
+
+async def batched(session_factory, messages: int, concurrency: int, durability: str):
+    writer = ConversationWriter(session_factory, StatisticsStore(), durability=durability)
+    writer.start()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handle(i):
+        async with semaphore:
+            await writer.submit(conversation(i))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[handle(i) for i in range(messages)])
+    accepted = time.perf_counter() - started
+    await writer.stop()
+    return accepted, time.perf_counter() - started, writer.get_stats()
+
+
+async def main_async(args):
+    workdir = tempfile.mkdtemp(prefix="itsupport-bench-")
+    results = {"messages": args.messages, "concurrency": args.concurrency}
+
+    elapsed = await per_request_commit(make_session_factory(workdir, "per_request"),
+                                       args.messages, args.concurrency)
+    results["per_request_commit_rows_per_s"] = round(args.messages / elapsed)
+
+    for durability in ("sync", "async"):
+        accepted, durable, stats = await batched(make_session_factory(workdir, durability),
+                                                 args.messages, args.concurrency, durability)
+        results[f"batched_{durability}"] = {
+            "rows_per_s": round(args.messages / durable),
+            "accept_rows_per_s": round(args.messages / accepted),
+            "batches": stats["batches"],
+            "max_batch": stats["max_batch"],
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    asyncio.run(main_async(parser.parse_args()))
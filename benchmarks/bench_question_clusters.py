@@ -0,0 +1,100 @@
+"""Бенчмарк кластеризации популярных вопросов
+
+Заполняет базу синтетическими диалогами (seed_data.py), разнообразит
+формулировки (вежливые слова, номера заявок) и замеряет:
+- первый запуск по всем строкам, кроме последних --increment;
+- повторный запуск, который читает только добавленные --increment строк.
+Выводятся скорость (строк в секунду), пиковая память процесса до и после
+кластеризации и размер файла состояния.
+
+Запуск:
+    python benchmarks/bench_question_clusters.py --rows 1000000 --increment 50000
+"""
+
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from seed_data import seed_conversations  # noqa: E402
+
+SUFFIXES = ["", "", " срочно", " помогите пожалуйста", " уже второй день", " на ноутбуке"]
+
+
+def vary_messages(db_path: str):
+    """Разные формулировки одних и тех же вопросов, у части - уникальный номер заявки"""
+    cases = " ".join(f"WHEN {i} THEN '{suffix}'" for i, suffix in enumerate(SUFFIXES))
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(f"""
+            UPDATE conversations SET user_message = user_message
+                || CASE abs(random()) % {len(SUFFIXES)} {cases} END
+                || CASE WHEN abs(random()) % 3 = 0 THEN ' заявка ' || (abs(random()) % 100000) ELSE '' END
+        """)
+
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--increment", type=int, default=50000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "bench.db")
+        seed_conversations(db_path, args.rows)
+        vary_messages(db_path)
+
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        from app.services.question_clusters import QuestionClusterJob
+
+        session_factory = sessionmaker(bind=create_engine(f"sqlite:///{db_path}"))
+        state_path = os.path.join(directory, "clusters.npz")
+        job = QuestionClusterJob(session_factory, state_path, chunk_size=args.chunk_size)
+        rss_before = peak_rss_mb()
+
+        started = time.perf_counter()
+        initial = job.run(limit=args.rows - args.increment)
+        initial_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        incremental = job.run()
+        incremental_seconds = time.perf_counter() - started
+
+        with session_factory() as db:
+            from app.services.analytics_service import AnalyticsService
+            top = AnalyticsService().get_popular_questions(db, limit=5)["questions"]
+        state_mb = round(os.path.getsize(state_path) / 2 ** 20, 2)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "initial": {
+            **initial,
+            "seconds": round(initial_seconds, 1),
+            "rows_per_second": round(initial["processed"] / initial_seconds)
+        },
+        "incremental": {
+            **incremental,
+            "seconds": round(incremental_seconds, 1),
+            "rows_per_second": round(incremental["processed"] / incremental_seconds)
+        },
+        "peak_rss_mb": {"before": rss_before, "after": peak_rss_mb()},
+        "state_mb": state_mb,
+        "top": [[question["size"], question["label"]] for question in top]
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
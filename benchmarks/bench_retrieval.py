@@ -0,0 +1,131 @@
+"""Бенчмарк поиска по базе знаний
+
+Генерирует синтетическую базу из статей на основе реальных статей
+knowledge_base/ (по умолчанию 10 000 фрагментов), затем измеряет время
+построения индекса, сохранения и загрузки готового индекса, а также
+задержку поиска top-k фрагментов.
+
+Запуск:
+    python benchmarks/bench_retrieval.py [--passages 10000] [--queries 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from app.services.knowledge_base import KnowledgeBase, tokenize  # noqa: E402
+
+QUERIES = [
+    "Забыл пароль, как восстановить?",
+    "Нет доступа к папке на сервере",
+    "Как отправить документ в формате PDF?",
+    "Не работает VPN после обновления",
+    "Как установить программу из каталога?",
+    "Принтер не печатает, что делать",
+    "Где заказать новый ноутбук",
+]
+
+
+def generate(directory: str, passages: int, seed: int = 42) -> list:
+    """Статьи по 5 абзацев из перемешанных слов настоящих статей
+
+    Возвращает запросы: вопросы пользователей и наборы слов из словаря.
+    """
+    rng = random.Random(seed)
+    kb = KnowledgeBase(os.path.join(ROOT, "knowledge_base"), reload_interval=0)
+    vocabulary = sorted({word for category in kb.categories for word in kb[category].split()})
+    # Редкие слова имитируют специфику статей (названия систем, коды ошибок)
+    consonants, vowels = "бвгдзклмнпрстфх", "аеиоуя"
+    vocabulary += [
+        "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(3, 5)))
+        for _ in range(20000)
+    ]
+    vocabulary += [f"E{code}" for code in rng.sample(range(100, 10000), 2000)]
+
+    per_article = 5
+    for article_id in range(passages // per_article):
+        paragraphs = [" ".join(rng.choices(vocabulary, k=rng.randint(30, 60))) for _ in range(per_article)]
+        with open(os.path.join(directory, f"article_{article_id:05d}.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "category": f"topic{article_id % 50}",
+                "title": " ".join(rng.choices(vocabulary, k=3)),
+                "text": "\n\n".join(paragraphs)
+            }, f, ensure_ascii=False)
+
+    return QUERIES + [" ".join(rng.choices(vocabulary, k=rng.randint(3, 8))) for _ in range(200)]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--passages", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        articles = os.path.join(directory, "kb")
+        os.mkdir(articles)
+        queries = generate(articles, args.passages)
+
+        started = time.perf_counter()
+        kb = KnowledgeBase(articles, passage_chars=600, reload_interval=0)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        index_path = os.path.join(directory, "index.json")
+        kb.save_index(index_path)
+        started = time.perf_counter()
+        loaded = KnowledgeBase(articles, index_path=index_path, reload_interval=0)
+        load_ms = (time.perf_counter() - started) * 1000
+        assert loaded.get_stats()["loaded_from"] == "index"
+
+        latencies = []
+        for i in range(args.queries):
+            query = queries[i % len(queries)]
+            started = time.perf_counter()
+            kb.search(query, k=args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        # Проверка изменений каталога, выполняемая не чаще reload_interval
+        started = time.perf_counter()
+        for _ in range(20):
+            kb._signature()
+        signature_ms = (time.perf_counter() - started) * 1000 / 20
+
+        # Размер промпта: все статьи категории против top-k фрагментов
+        top_passages = kb.search(queries[-1], k=args.k)
+        full = kb[top_passages[0].category]
+        top = "\n\n".join(p.text for p in top_passages)
+
+        print(json.dumps({
+            **kb.get_stats(),
+            "index_size_mb": round(os.path.getsize(index_path) / 2 ** 20, 2),
+            "build_ms": round(build_ms, 1),
+            "load_prebuilt_ms": round(load_ms, 1),
+            "signature_check_ms": round(signature_ms, 2),
+            "search_ms": {
+                "mean": round(statistics.mean(latencies), 3),
+                "p50": round(percentile(latencies, 0.5), 3),
+                "p99": round(percentile(latencies, 0.99), 3)
+            },
+            "prompt_tokens_approx": {
+                "whole_category": len(tokenize(full)),
+                "top_k_passages": len(tokenize(top))
+            }
+        }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
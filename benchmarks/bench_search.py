@@ -0,0 +1,119 @@
+"""Бенчмарк полнотекстового поиска по диалогам (SQLite FTS5)
+
+Заполняет базу синтетическими диалогами (seed_data.py, индекс строится
+после вставки) и замеряет p50/p99 запросов ConversationSearch: редкий и
+частый термин, фильтры по периоду, категории и пользователю, порядок по
+времени и вторая страница по курсору. Для сравнения один раз
+выполняется поиск LIKE '%...%' по тем же колонкам для слова, которого
+нет в данных (полный просмотр таблицы).
+
+Запуск:
+    python benchmarks/bench_search.py --rows 2000000 --repeat 20
+    python benchmarks/bench_search.py --db /tmp/search.db   # повторно на той же базе
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from load_health_under_chat import percentile  # noqa: E402
+from seed_data import seed_conversations  # noqa: E402
+
+
+def scenarios(now: datetime) -> dict:
+    """Параметры поиска по сценариям"""
+    return {
+        "no_match": {"query": "сканер"},
+        "rare_term": {"query": "1с"},
+        "common_term": {"query": "пароль"},
+        "rare_term_last_week": {"query": "1с", "start": now - timedelta(days=7)},
+        "common_term_category": {"query": "vpn", "category": "connection"},
+        "common_term_user": {"query": "пароль", "user_id": "user_7"},
+        "common_term_recent": {"query": "пароль", "order": "recent"},
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+        "results": len(result["results"]) if isinstance(result, dict) else result
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--max-candidates", type=int, default=20000)
+    parser.add_argument("--db", help="файл базы; если он уже есть, заполнение пропускается")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    db_path = args.db or os.path.join(directory, "search.db")
+    seed_seconds = None
+    if not os.path.exists(db_path):
+        seed_seconds = round(seed_conversations(db_path, args.rows), 1)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from sqlalchemy import create_engine, func, or_, text
+    from sqlalchemy.orm import sessionmaker
+
+    from app.models.conversation import Conversation
+    from app.services.search import ConversationSearch, SQLiteSearchBackend
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    db = sessionmaker(bind=engine)()
+    search = ConversationSearch(SQLiteSearchBackend(), max_candidates=args.max_candidates)
+    rows = db.query(func.count(Conversation.id)).scalar()
+    now = datetime.utcnow()
+
+    results = {}
+    for name, params in scenarios(now).items():
+        params = dict(params, limit=args.limit)
+        results[name] = measure(lambda: search.search(db, **params), args.repeat)
+        first = search.search(db, **params)
+        if first["next_cursor"]:
+            results[name]["next_page"] = measure(
+                lambda: search.search(db, cursor=first["next_cursor"], **params), args.repeat
+            )
+
+    # Базовый вариант без индекса: LIKE просматривает всю таблицу, если совпадений мало
+    started = time.perf_counter()
+    like = db.query(Conversation.id).filter(or_(
+        Conversation.user_message.like("%сканер%"), Conversation.bot_response.like("%сканер%")
+    )).order_by(Conversation.timestamp.desc()).limit(args.limit).all()
+    like_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    fts_bytes = db.execute(text(
+        "SELECT sum(length(block)) FROM conversations_fts_data"
+    )).scalar()
+    db.close()
+    engine.dispose()
+
+    print(json.dumps({
+        "rows": rows,
+        "seed_seconds": seed_seconds,
+        "index_mb": round((fts_bytes or 0) / 2 ** 20, 1),
+        "repeat": args.repeat,
+        "max_candidates": args.max_candidates,
+        "search": results,
+        "like_scan_no_match": {"ms": like_ms, "results": len(like)}
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
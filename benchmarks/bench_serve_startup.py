@@ -0,0 +1,150 @@
+"""Бенчмарк холодного старта и памяти воркеров: uvicorn --workers и serve.py
+
+Запускает приложение двумя способами на одной базе (seed_data.py):
+- uvicorn app.main:app --workers N: каждый воркер сам импортирует приложение,
+  создает схему и прогревается;
+- python serve.py --workers N: прогрев один раз в главном процессе, затем fork.
+Замеряется время от запуска до готовности всех воркеров (строки uvicorn
+"Application startup complete") и до первого ответа /analytics, затем
+после --requests запросов к /analytics и /api/stats - память каждого
+процесса из /proc/<pid>/smaps_rollup: RSS, PSS (общие страницы делятся
+между процессами) и частная память. Только Linux.
+
+Запуск:
+    python benchmarks/bench_serve_startup.py --workers 4 --rows 100000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from seed_data import seed_conversations  # noqa: E402
+
+READY_LINE = "Application startup complete"
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS, PSS и частная память процесса, МБ"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": round(values["Rss"] / 1024, 1),
+        "pss": round(values["Pss"] / 1024, 1),
+        "private": round((values["Private_Clean"] + values["Private_Dirty"]) / 1024, 1),
+    }
+
+
+def worker_pids(pid: int) -> list:
+    """Дочерние процессы-воркеры (без resource_tracker multiprocessing)"""
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        children = [int(child) for child in f.read().split()]
+    result = []
+    for child in children:
+        with open(f"/proc/{child}/cmdline", "rb") as f:
+            if b"resource_tracker" not in f.read():
+                result.append(child)
+    return result
+
+
+def get(url: str):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+def measure(command: list, env: dict, workers: int, port: int, requests: int) -> dict:
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    ready = threading.Event()
+    ready_lines = []
+
+    def read_output():
+        for line in process.stdout:
+            if READY_LINE in line:
+                ready_lines.append(time.perf_counter())
+                if len(ready_lines) == workers:
+                    ready.set()
+
+    threading.Thread(target=read_output, daemon=True).start()
+    try:
+        if not ready.wait(120):
+            raise RuntimeError(f"воркеры не запустились: {' '.join(command)}")
+        all_ready = ready_lines[-1] - started
+        first_ready = ready_lines[0] - started
+        get(f"http://127.0.0.1:{port}/analytics")
+        first_analytics = time.perf_counter() - started
+
+        for _ in range(requests):
+            get(f"http://127.0.0.1:{port}/analytics")
+            get(f"http://127.0.0.1:{port}/api/stats")
+        time.sleep(1)
+        pids = worker_pids(process.pid)
+        per_worker = [memory_mb(pid) for pid in pids]
+        master = memory_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(60)
+
+    return {
+        "first_worker_ready_s": round(first_ready, 2),
+        "all_workers_ready_s": round(all_ready, 2),
+        "first_analytics_s": round(first_analytics, 2),
+        "master_mb": master,
+        "per_worker_mb": per_worker,
+        "total_pss_mb": round(master["pss"] + sum(worker["pss"] for worker in per_worker), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=50, help="запросов к /analytics и /api/stats перед замером памяти")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "bench.db")
+        seed_conversations(db_path, args.rows)
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{db_path}",
+            "METRICS_MULTIPROC_DIR": os.path.join(directory, "metrics"),
+            "ADMISSION_ENABLED": "false",
+            "DEBUG": "False",
+            "PYTHONUNBUFFERED": "1",
+        })
+        # Индекс поиска строится один раз заранее - замеряется обычный перезапуск
+        subprocess.run([sys.executable, "init_db.py"], cwd=ROOT, env=env, check=True, capture_output=True)
+
+        port = str(args.port)
+        results = {
+            "uvicorn": measure(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", port, "--workers", str(args.workers)],
+                env, args.workers, args.port, args.requests
+            ),
+            "serve": measure(
+                [sys.executable, "serve.py", "--port", port, "--workers", str(args.workers)],
+                env, args.workers, args.port, args.requests
+            ),
+        }
+
+    print(json.dumps({"workers": args.workers, "rows": args.rows, "cpu_count": os.cpu_count(), **results},
+                     indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
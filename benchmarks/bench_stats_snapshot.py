@@ -0,0 +1,115 @@
+"""Бенчмарк снимка статистики для /analytics и /api/stats
+
+Заполняет базу синтетическими диалогами (seed_data.py) и с заданной
+параллельностью запрашивает статистику через ASGI-транспорт httpx:
+- recompute - как без снимка: каждый запрос заново читает статистику
+  из БД и рендерит страницу (collect_stats + render_stats);
+- snapshot - /api/stats и /analytics из снимка;
+- not_modified - те же запросы с If-None-Match (ответ 304).
+Для режимов со снимком выводится и число пересчетов за прогон - это
+вся нагрузка на БД от страницы аналитики.
+
+Запуск:
+    python benchmarks/bench_stats_snapshot.py --rows 200000 --requests 2000 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from load_health_under_chat import percentile  # noqa: E402
+from seed_data import seed_conversations  # noqa: E402
+
+PATHS = ["/api/stats", "/analytics"]
+
+
+async def run_mode(request, count: int, concurrency: int) -> dict:
+    timings = []
+    queue = iter(range(count))
+    started = time.perf_counter()
+
+    async def worker():
+        for i in queue:
+            begin = time.perf_counter()
+            await request(PATHS[i % len(PATHS)])
+            timings.append((time.perf_counter() - begin) * 1000)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return {
+        "rps": round(count / (time.perf_counter() - started), 1),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p99_ms": round(percentile(timings, 99), 2)
+    }
+
+
+async def run(count: int, concurrency: int) -> dict:
+    import httpx
+
+    from app import main
+
+    await main.startup_event()
+    try:
+        async def recompute(path: str):
+            stats = await main.collect_stats()
+            if path == "/analytics":
+                main.render_stats(stats)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def snapshot(path: str):
+                assert (await client.get(path)).status_code == 200
+
+            async def not_modified(path: str):
+                response = await client.get(path, headers={"If-None-Match": etags[path]})
+                assert response.status_code in (200, 304)
+
+            results = {"recompute": await run_mode(recompute, count, concurrency)}
+            etags = {path: (await client.get(path)).headers["etag"] for path in PATHS}
+            for name, request in (("snapshot", snapshot), ("not_modified", not_modified)):
+                refreshes = main.stats_snapshot.get_stats()["refreshes"]
+                results[name] = await run_mode(request, count, concurrency)
+                results[name]["refreshes"] = main.stats_snapshot.get_stats()["refreshes"] - refreshes
+        results["snapshot_stats"] = main.stats_snapshot.get_stats()
+    finally:
+        await main.shutdown_event()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--refresh-seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "bench.db")
+        seed_seconds = seed_conversations(db_path, args.rows)
+        os.environ.update(
+            OPENAI_API_KEY="bench-no-llm",
+            METRICS_ENABLED="false",
+            SEARCH_ENABLED="false",
+            STATS_REFRESH_SECONDS=str(args.refresh_seconds),
+            DATABASE_URL=f"sqlite:///{db_path}"
+        )
+        results = asyncio.run(run(args.requests, args.concurrency))
+
+    print(json.dumps({
+        "rows": args.rows,
+        "seed_seconds": round(seed_seconds, 1),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        **results
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Бенчмарк активности пользователя: SQL-агрегаты и keyset-страницы против .all()
+
+Создает SQLite-базу, где у одного "тяжелого" пользователя rows обращений
+с ответами по ~1 КБ, и сравнивает исходную реализацию get_user_activity
+с новой по времени и пиковой памяти (tracemalloc). Отдельно измеряется
+выгрузка всей истории пачками.
+
+Запуск:
+    python benchmarks/bench_user_activity.py --rows 50000
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import conversation, statistics  # noqa: E402,F401 - регистрация моделей
+from app.models.conversation import Conversation  # noqa: E402
+from app.services.analytics_service import AnalyticsService  # noqa: E402
+
+CATEGORIES = ["password", "access", "documents", "connection", "software", None]
+
+
+def legacy_user_activity(db, user_id):
+    """Исходная реализация: все диалоги пользователя целиком через .all()"""
+    conversations = db.query(Conversation).filter(
+        Conversation.user_id == user_id
+    ).order_by(Conversation.timestamp.desc()).all()
+    if not conversations:
+        return {'error': 'User not found'}
+    user_categories = Counter([conv.category or 'general' for conv in conversations])
+    recent = [
+        {
+            'id': conv.id,
+            'message': conv.user_message[:100] + '...' if len(conv.user_message) > 100 else conv.user_message,
+            'category': conv.category or 'general',
+            'timestamp': conv.timestamp.isoformat()
+        }
+        for conv in conversations[:10]
+    ]
+    return {
+        'user_id': user_id,
+        'total_conversations': len(conversations),
+        'categories': dict(user_categories),
+        'recent_conversations': recent,
+        'first_contact': conversations[-1].timestamp.isoformat(),
+        'last_contact': conversations[0].timestamp.isoformat()
+    }
+
+
+def seed(db_path: str, rows: int, other_users: int = 20000):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    answer = "Подробный ответ бота. " * 50
+
+    connection = sqlite3.connect(db_path)
+    batch = [
+        ("power_user", f"Вопрос номер {i} про систему", answer,
+         (now - timedelta(minutes=i)).isoformat(sep=" "), CATEGORIES[i % len(CATEGORIES)])
+        for i in range(rows)
+    ]
+    batch += [
+        (f"user_{i}", "Забыл пароль", "Ответ", (now - timedelta(minutes=i)).isoformat(sep=" "), "password")
+        for i in range(other_users)
+    ]
+    connection.executemany(
+        "INSERT INTO conversations (user_id, user_message, bot_response, timestamp, category) "
+        "VALUES (?, ?, ?, ?, ?)",
+        batch
+    )
+    connection.commit()
+    connection.close()
+    return sessionmaker(bind=engine)
+
+
+def measure(func):
+    """Время (мс) и пиковая память Python (МБ) одного вызова"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, round(elapsed, 1), round(peak / 2 ** 20, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        session_factory = seed(os.path.join(directory, "bench.db"), args.rows)
+        analytics = AnalyticsService()
+        db = session_factory()
+
+        legacy, legacy_ms, legacy_mb = measure(lambda: legacy_user_activity(db, "power_user"))
+        db.expunge_all()
+        current, current_ms, current_mb = measure(lambda: analytics.get_user_activity(db, "power_user"))
+        assert legacy["total_conversations"] == current["total_conversations"]
+        assert legacy["categories"] == current["categories"]
+
+        cursor = current["next_cursor"]
+        _, page_ms, _ = measure(lambda: analytics.get_user_conversations(db, "power_user", limit=50, cursor=cursor))
+
+        def export():
+            size = 0
+            for batch in analytics.iter_user_conversation_batches(session_factory, "power_user"):
+                size += len("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch))
+            return size
+
+        exported_bytes, export_ms, export_mb = measure(export)
+        db.close()
+
+    print(json.dumps({
+        "rows": args.rows,
+        "legacy_activity": {"ms": legacy_ms, "peak_mb": legacy_mb},
+        "activity": {"ms": current_ms, "peak_mb": current_mb},
+        "next_page_ms": page_ms,
+        "export": {"ms": export_ms, "peak_mb": export_mb, "mb_written": round(exported_bytes / 2 ** 20, 1)}
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Сравнение двух результатов run_scenarios.py
+
+Для каждого общего сценария печатает p50, p99 и пропускную способность
+до и после с изменением в процентах. Код возврата 1, если p99 вырос или
+пропускная способность упала больше порога, либо появились ошибки.
+
+Запуск:
+    python benchmarks/compare_results.py baseline.json results.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+def change(before: float, after: float) -> float:
+    """Изменение в процентах относительно before"""
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def compare(baseline: dict, current: dict, threshold: float):
+    """Строки таблицы и список регрессий"""
+    rows, regressions = [], []
+    for name, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(name)
+        if after is None:
+            continue
+        p50 = change(before["latency_ms"]["p50"], after["latency_ms"]["p50"])
+        p99 = change(before["latency_ms"]["p99"], after["latency_ms"]["p99"])
+        rps = change(before["throughput_rps"], after["throughput_rps"])
+        rows.append((
+            name,
+            f"{before['latency_ms']['p50']:.1f} -> {after['latency_ms']['p50']:.1f} ({p50:+.1f}%)",
+            f"{before['latency_ms']['p99']:.1f} -> {after['latency_ms']['p99']:.1f} ({p99:+.1f}%)",
+            f"{before['throughput_rps']:.1f} -> {after['throughput_rps']:.1f} ({rps:+.1f}%)",
+            f"{before['errors']} -> {after['errors']}",
+        ))
+        if p99 > threshold:
+            regressions.append(f"{name}: p99 {p99:+.1f}%")
+        if rps < -threshold:
+            regressions.append(f"{name}: пропускная способность {rps:+.1f}%")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{name}: ошибок {before['errors']} -> {after['errors']}")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    header = ("сценарий", "p50, мс", "p99, мс", "запросов/с", "ошибки")
+    rows, regressions = compare(baseline, current, args.threshold)
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+    print(f"\nРевизии: {baseline['meta']['revision']} -> {current['meta']['revision']}")
+    if regressions:
+        print("Регрессии:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Нагрузочный тест: задержка /health при 200 одновременных запросах /chat
+
+Поднимает stub-сервер OpenAI и приложение в отдельных процессах,
+отправляет пачку запросов в /chat и параллельно опрашивает /health.
+Если LLM-вызов блокирует event loop, задержка /health вырастет
+до времени генерации ответа.
+
+Запуск:
+    python benchmarks/load_health_under_chat.py --chats 200 --latency-ms 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    """Перцентиль по отсортированной выборке"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def wait_ready(url: str, timeout: float = 20.0):
+    """Ожидание готовности HTTP-сервера"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Сервер {url} не запустился")
+
+
+async def probe_health(client: httpx.AsyncClient, base_url: str, stop: asyncio.Event, interval: float):
+    """Периодический опрос /health с замером задержки"""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(f"{base_url}/health")
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run_load(base_url: str, chats: int, probe_interval: float):
+    limits = httpx.Limits(max_connections=chats + 10)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        # Базовая задержка /health без нагрузки
+        idle_stop = asyncio.Event()
+        idle_task = asyncio.create_task(probe_health(client, base_url, idle_stop, probe_interval))
+        await asyncio.sleep(1)
+        idle_stop.set()
+        idle = await idle_task
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(client, base_url, stop, probe_interval))
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post(f"{base_url}/chat", data={"message": f"Забыл пароль #{i}", "user_id": f"load_{i}"})
+            for i in range(chats)
+        ])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        loaded = await probe
+
+    return {
+        "chats": chats,
+        "chat_errors": sum(1 for r in responses if r.status_code != 200 or "error" in r.json()),
+        "chat_wall_time_s": round(elapsed, 3),
+        "health_idle_ms": {
+            "p50": round(percentile(idle, 50), 2),
+            "p99": round(percentile(idle, 99), 2),
+        },
+        "health_under_load_ms": {
+            "samples": len(loaded),
+            "p50": round(percentile(loaded, 50), 2),
+            "p99": round(percentile(loaded, 99), 2),
+            "max": round(max(loaded), 2) if loaded else 0.0,
+            "mean": round(statistics.fmean(loaded), 2) if loaded else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="LLM_MAX_CONCURRENCY приложения")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="itsupport-bench-")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "LLM_MAX_CONCURRENCY": str(args.concurrency),
+        "LLM_MAX_CONNECTIONS": str(args.concurrency),
+        "STUB_LATENCY_MS": str(args.latency_ms),
+        # Нагрузка идет от нескольких пользователей - лимиты приема исказили бы замер
+        "ADMISSION_ENABLED": "false",
+        "DEBUG": "False",
+    })
+
+    stub = subprocess.Popen(
+        [sys.executable, "benchmarks/stub_openai.py", "--port", str(args.stub_port),
+         "--latency-ms", str(args.latency_ms)],
+        cwd=ROOT, env=env
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        asyncio.run(wait_ready(f"http://127.0.0.1:{args.stub_port}/docs"))
+        asyncio.run(wait_ready(f"{base_url}/health"))
+        result = asyncio.run(run_load(base_url, args.chats, args.probe_interval))
+        result["llm_latency_ms"] = args.latency_ms
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
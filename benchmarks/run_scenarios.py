@@ -0,0 +1,216 @@
+"""Сценарии нагрузки: /chat, /chat/stream и аналитика на заполненной базе
+
+Поднимает stub-сервер OpenAI и приложение в отдельных процессах, при
+необходимости заполняет базу seed_data (--rows), затем по очереди
+выполняет сценарии из JSON-файла: каждый сценарий - requests запросов
+при concurrency одновременных клиентах. Для каждого сценария сохраняются
+p50/p90/p99, пропускная способность и число ошибок, для потоковых -
+еще время до первой части ответа. Результат - JSON, который можно
+сравнить с предыдущим запуском через compare_results.py.
+
+Запуск:
+    python benchmarks/run_scenarios.py --rows 1000000 --latency-ms 1000 --output results.json
+    python benchmarks/run_scenarios.py --only chat,api_stats --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from load_health_under_chat import percentile, wait_ready  # noqa: E402
+from seed_data import MESSAGES, seed_conversations  # noqa: E402
+
+DEFAULT_SCENARIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.json")
+
+
+def chat_form(rng: random.Random, users: int) -> dict:
+    """Тело запроса к чату: типичный вопрос случайного пользователя"""
+    category = rng.choice(list(MESSAGES))
+    return {"message": rng.choice(MESSAGES[category]), "user_id": f"user_{rng.randrange(users)}"}
+
+
+async def run_scenario(client: httpx.AsyncClient, base_url: str, scenario: dict, users: int, seed: int) -> dict:
+    """Выполнение сценария замкнутым циклом: concurrency клиентов, requests запросов"""
+    rng = random.Random(seed)
+    total = scenario["requests"]
+    latencies, first_parts = [], []
+    errors = 0
+    issued = 0
+
+    async def one_request():
+        nonlocal errors
+        path = scenario["path"].replace("{user_id}", f"user_{rng.randrange(users)}")
+        data = chat_form(rng, users) if scenario.get("form") == "chat" else None
+        started = time.perf_counter()
+        try:
+            if scenario.get("stream"):
+                first = None
+                async with client.stream(scenario["method"], base_url + path, data=data) as response:
+                    async for chunk in response.aiter_text():
+                        if first is None and '"delta"' in chunk:
+                            first = time.perf_counter()
+                    ok = response.status_code == 200
+                if first is not None:
+                    first_parts.append((first - started) * 1000)
+            else:
+                response = await client.request(scenario["method"], base_url + path, data=data)
+                ok = response.status_code < 400 or response.status_code == 404
+                if ok and scenario.get("form") == "chat":
+                    ok = "error" not in response.json()
+        except httpx.HTTPError:
+            ok = False
+        latencies.append((time.perf_counter() - started) * 1000)
+        if not ok:
+            errors += 1
+
+    async def worker():
+        nonlocal issued
+        while issued < total:
+            issued += 1
+            await one_request()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(scenario["concurrency"])])
+    wall = time.perf_counter() - started
+
+    result = {
+        "requests": total,
+        "concurrency": scenario["concurrency"],
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total / wall, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p90": round(percentile(latencies, 90), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies), 2),
+        },
+    }
+    if scenario.get("stream"):
+        result["first_part_ms"] = {
+            "p50": round(percentile(first_parts, 50), 2),
+            "p99": round(percentile(first_parts, 99), 2),
+        }
+    return result
+
+
+async def run_all(base_url: str, scenarios: list, users: int, seed: int) -> dict:
+    concurrency = max(scenario["concurrency"] for scenario in scenarios)
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    results = {}
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        for scenario in scenarios:
+            # Короткий прогрев, чтобы не мерить открытие соединений и холодные кэши
+            await run_scenario(client, base_url, {**scenario, "requests": min(20, scenario["requests"])}, users, seed)
+            results[scenario["name"]] = await run_scenario(client, base_url, scenario, users, seed)
+            print(f"{scenario['name']}: {json.dumps(results[scenario['name']], ensure_ascii=False)}", file=sys.stderr)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help="JSON-файл со сценариями")
+    parser.add_argument("--only", default="", help="имена сценариев через запятую")
+    parser.add_argument("--db", default="", help="готовая база (иначе временная)")
+    parser.add_argument("--rows", type=int, default=0, help="заполнить базу rows диалогами перед запуском")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=1000)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="воркеры uvicorn")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--output", default="", help="файл для JSON-результата")
+    args = parser.parse_args()
+
+    with open(args.scenarios, encoding="utf-8") as f:
+        scenarios = json.load(f)
+    if args.only:
+        names = set(args.only.split(","))
+        scenarios = [scenario for scenario in scenarios if scenario["name"] in names]
+
+    workdir = tempfile.mkdtemp(prefix="itsupport-bench-")
+    db_path = args.db or os.path.join(workdir, "bench.db")
+    if args.rows:
+        elapsed = seed_conversations(db_path, args.rows, users=args.users, seed=args.seed)
+        print(f"База заполнена: {args.rows} диалогов за {elapsed:.1f} с", file=sys.stderr)
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "STUB_LATENCY_MS": str(args.latency_ms),
+        "STUB_JITTER_MS": str(args.jitter_ms),
+        "METRICS_MULTIPROC_DIR": os.path.join(workdir, "metrics") if args.workers > 1 else "",
+        # Нагрузка идет от нескольких пользователей - лимиты приема исказили бы замер
+        "ADMISSION_ENABLED": "false",
+        "DEBUG": "False",
+    })
+    if args.workers > 1:
+        # Таблицы создаются до запуска воркеров, чтобы они не создавали их наперегонки
+        subprocess.run([sys.executable, "init_db.py"], cwd=ROOT, env=env, check=True, capture_output=True)
+
+    stub = subprocess.Popen(
+        [sys.executable, "benchmarks/stub_openai.py", "--port", str(args.stub_port)],
+        cwd=ROOT, env=env
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        asyncio.run(wait_ready(f"http://127.0.0.1:{args.stub_port}/docs"))
+        asyncio.run(wait_ready(f"{base_url}/health", timeout=60))
+        results = asyncio.run(run_all(base_url, scenarios, args.users, args.seed))
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait()
+        stub.wait()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "rows": args.rows,
+            "llm_latency_ms": args.latency_ms,
+            "workers": args.workers,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Заполнение SQLite-базы синтетическими диалогами для бенчмарков
+
+Запуск:
+    python benchmarks/seed_data.py --db /tmp/bench.db --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# Типичные формулировки по категориям (general - вопросы без категории, так их сохраняет /chat)
+MESSAGES = {
+    "password": ["Забыл пароль", "Как сбросить пароль?", "Не могу войти, логин не подходит"],
+    "access": ["Нет доступа к папке", "Нужны права на папку отдела", "Access denied к общей папке"],
+    "documents": ["Как отправить документ?", "Не могу прикрепить документ", "Документ не загружается"],
+    "connection": ["Нет интернета", "Не подключается VPN", "Пропал wi-fi"],
+    "software": ["Как установить программу?", "Нужно обновить приложение", "Установить софт для работы",
+                 "Не запускается 1С", "Ошибка в 1С при проведении документа"],
+    "general": ["Привет", "Принтер не печатает", "Монитор мигает", "Спасибо за помощь"],
+}
+# Доля обращений по категориям
+WEIGHTS = [30, 20, 10, 20, 10, 10]
+# Доля обращений по часам суток: пик в рабочее время
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 14, 16, 15, 14, 10, 13, 15, 14, 12, 8, 5, 3, 2, 2, 1, 1]
+# Выходные - примерно пятая часть обращений буднего дня
+WEEKEND_SHARE = 0.2
+
+
+def random_timestamp(rng: random.Random, now: datetime, days: int) -> datetime:
+    """Момент обращения за последние days дней с суточным и недельным ритмом"""
+    while True:
+        day = now - timedelta(days=rng.randrange(days))
+        if day.weekday() < 5 or rng.random() < WEEKEND_SHARE:
+            break
+    hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+    moment = day.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(seconds=rng.random() * 3600)
+    return min(moment, now)
+
+
+def seed_conversations(db_path: str, rows: int, days: int = 90, users: int = 5000,
+                       seed: int = 42, batch_size: int = 50000) -> float:
+    """Вставка rows диалогов за последние days дней
+
+    Возвращает время вставки в секундах. Таблицы создаются через init_db,
+    счетчики статистики и индекс поиска строятся после вставки. Время ответа
+    распределено логнормально (медиана ~1.5 с), у части обращений его нет.
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from app.database import Base
+    from app.models import conversation, statistics  # noqa: F401 - регистрация моделей
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.services.search import install_search_index
+    from app.services.statistics_store import StatisticsStore
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+
+    rng = random.Random(seed)
+    categories = list(MESSAGES)
+    now = datetime.utcnow()
+
+    started = time.perf_counter()
+    connection = sqlite3.connect(db_path)
+    try:
+        inserted = 0
+        while inserted < rows:
+            batch = []
+            for _ in range(min(batch_size, rows - inserted)):
+                category = rng.choices(categories, WEIGHTS)[0]
+                message = rng.choice(MESSAGES[category])
+                timestamp = random_timestamp(rng, now, days)
+                user_id = f"user_{int(rng.paretovariate(1.2)) % users}"
+                response_time_ms = int(rng.lognormvariate(7.3, 0.6)) if rng.random() < 0.9 else None
+                batch.append((user_id, message, f"Ответ на: {message}",
+                              timestamp.isoformat(sep=" "), category, response_time_ms))
+            connection.executemany(
+                "INSERT INTO conversations (user_id, user_message, bot_response, timestamp, category, "
+                "response_time_ms) VALUES (?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            connection.commit()
+            inserted += len(batch)
+    finally:
+        connection.close()
+
+    session = sessionmaker(bind=engine)()
+    try:
+        StatisticsStore().rebuild(session)
+        session.commit()
+        # Индекс поиска строится одним проходом после вставки, а не триггерами на каждую строку
+        with engine.begin() as db_connection:
+            install_search_index(db_connection)
+    finally:
+        session.close()
+        engine.dispose()
+
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    elapsed = seed_conversations(args.db, args.rows, args.days, args.users, args.seed)
+    print(f"Вставлено {args.rows} диалогов за {elapsed:.1f} с")
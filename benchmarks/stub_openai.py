@@ -0,0 +1,107 @@
+"""Локальный stub-сервер, совместимый с OpenAI Chat Completions API
+
+Используется в нагрузочных тестах вместо настоящего OpenAI.
+Задержка ответа задается переменной окружения STUB_LATENCY_MS, случайный
+разброс к ней - STUB_JITTER_MS, доля ответов с ошибкой 500 - STUB_ERROR_RATE,
+доля медленных ответов (хвост задержки) - STUB_SLOW_RATE с задержкой STUB_SLOW_MS.
+При stream=True первая часть приходит через STUB_LATENCY_MS, остальные -
+с интервалом STUB_TOKEN_INTERVAL_MS.
+
+Запуск:
+    python benchmarks/stub_openai.py --port 8900 --latency-ms 2000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import json
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="OpenAI stub")
+
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "1000"))
+TOKEN_INTERVAL_MS = float(os.getenv("STUB_TOKEN_INTERVAL_MS", "20"))
+JITTER_MS = float(os.getenv("STUB_JITTER_MS", "0"))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+SLOW_RATE = float(os.getenv("STUB_SLOW_RATE", "0"))
+SLOW_MS = float(os.getenv("STUB_SLOW_MS", "5000"))
+
+
+def latency() -> float:
+    """Задержка первого ответа, с"""
+    if SLOW_RATE and random.random() < SLOW_RATE:
+        return SLOW_MS / 1000
+    return max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000
+
+
+def _stream_chunks(completion_id: str, model: str, content: str):
+    """Ответ в формате потока chat.completion.chunk"""
+    async def chunks():
+        await asyncio.sleep(latency())
+        for i, word in enumerate(content.split(" ")):
+            if i:
+                await asyncio.sleep(TOKEN_INTERVAL_MS / 1000)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": (" " if i else "") + word}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Имитация ответа модели с фиксированной задержкой"""
+    body = await request.json()
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        await asyncio.sleep(latency())
+        return JSONResponse({"error": {"message": "stub error", "type": "server_error"}}, status_code=500)
+    content = f"Stub-ответ на: {body['messages'][-1]['content'][:50]}"
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    if body.get("stream"):
+        return _stream_chunks(completion_id, body.get("model", "stub"), content)
+
+    await asyncio.sleep(latency())
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--token-interval-ms", type=float, default=TOKEN_INTERVAL_MS)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--slow-rate", type=float, default=SLOW_RATE)
+    parser.add_argument("--slow-ms", type=float, default=SLOW_MS)
+    args = parser.parse_args()
+
+    LATENCY_MS = args.latency_ms
+    TOKEN_INTERVAL_MS = args.token_interval_ms
+    JITTER_MS = args.jitter_ms
+    ERROR_RATE = args.error_rate
+    SLOW_RATE = args.slow_rate
+    SLOW_MS = args.slow_ms
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
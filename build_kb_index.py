@@ -0,0 +1,26 @@
+"""Сборка индекса базы знаний для быстрого запуска приложения"""
+
+import sys
+import os
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.services.knowledge_base import KnowledgeBase
+
+if __name__ == "__main__":
+    index_path = sys.argv[1] if len(sys.argv) > 1 else settings.KNOWLEDGE_BASE_INDEX_PATH
+    if not index_path:
+        print("Укажите путь к индексу аргументом или в KNOWLEDGE_BASE_INDEX_PATH")
+        sys.exit(1)
+
+    print(f"Сборка индекса базы знаний из {settings.KNOWLEDGE_BASE_DIR}...")
+    knowledge_base = KnowledgeBase(
+        settings.KNOWLEDGE_BASE_DIR,
+        passage_chars=settings.KNOWLEDGE_BASE_PASSAGE_CHARS,
+        reload_interval=0
+    )
+    knowledge_base.save_index(index_path)
+    stats = knowledge_base.get_stats()
+    print(f"Готово: статей - {stats['articles']}, фрагментов - {stats['passages']}, индекс - {index_path}")
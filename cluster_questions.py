@@ -0,0 +1,56 @@
+"""Кластеризация вопросов пользователей: популярные вопросы и предложения для базы знаний
+
+Обрабатывает только диалоги, добавленные после прошлого запуска (состояние -
+QUESTION_CLUSTERS_STATE_PATH), и перезаписывает таблицу популярных вопросов
+для страницы аналитики. Удобно запускать по расписанию (cron).
+
+Запуск:
+    python cluster_questions.py
+    python cluster_questions.py --rebuild
+"""
+
+import argparse
+import sys
+import os
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.database import init_db, SessionLocal
+from app.services.knowledge_base import KnowledgeBase
+from app.services.question_clusters import QuestionClusterJob
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="начать заново со всех диалогов таблицы")
+    parser.add_argument("--limit", type=int, default=None, help="обработать не больше N новых диалогов")
+    parser.add_argument("--top", type=int, default=10, help="сколько популярных вопросов вывести")
+    args = parser.parse_args()
+
+    init_db()
+    job = QuestionClusterJob(
+        SessionLocal,
+        settings.QUESTION_CLUSTERS_STATE_PATH,
+        knowledge_base=KnowledgeBase(
+            settings.KNOWLEDGE_BASE_DIR, index_path=settings.KNOWLEDGE_BASE_INDEX_PATH or None
+        ),
+        similarity=settings.QUESTION_CLUSTERS_SIMILARITY,
+        max_clusters=settings.QUESTION_CLUSTERS_MAX,
+        chunk_size=settings.QUESTION_CLUSTERS_CHUNK_SIZE,
+        top=settings.QUESTION_CLUSTERS_TOP,
+        suggest_min_size=settings.QUESTION_CLUSTERS_SUGGEST_MIN_SIZE
+    )
+    print("Кластеризация новых вопросов...")
+    result = job.run(rebuild=args.rebuild, limit=args.limit)
+    print(f"Готово: обработано диалогов - {result['processed']}, кластеров - {result['clusters']}")
+
+    from app.services.analytics_service import AnalyticsService
+    db = SessionLocal()
+    try:
+        popular = AnalyticsService().get_popular_questions(db, limit=args.top)
+    finally:
+        db.close()
+    for question in popular["questions"]:
+        mark = " [нет статьи]" if question["suggested"] else ""
+        print(f"{question['size']:>8}  {question['label']}{mark}")
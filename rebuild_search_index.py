@@ -0,0 +1,24 @@
+"""Перестроение полнотекстового индекса поиска по диалогам"""
+
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import init_db, engine
+from app.services.search import search_backend_for
+
+if __name__ == "__main__":
+    backend = search_backend_for(engine.dialect.name)
+    if backend is None:
+        print(f"Полнотекстовый поиск не поддерживается для {engine.dialect.name}")
+        sys.exit(1)
+    print("Перестроение индекса поиска...")
+    init_db()
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        backend.install(connection)
+        backend.rebuild(connection)
+    print(f"Готово за {time.perf_counter() - started:.1f} с")
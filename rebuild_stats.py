@@ -0,0 +1,25 @@
+"""Пересчет счетчиков статистики по таблице conversations и архиву"""
+
+import sys
+import os
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.database import init_db, SessionLocal
+from app.services.archive import ConversationArchive, conversation_from_row
+from app.services.statistics_store import StatisticsStore
+
+if __name__ == "__main__":
+    print("Пересчет счетчиков статистики...")
+    init_db()
+    archive = ConversationArchive(settings.ARCHIVE_DIR)
+    db = SessionLocal()
+    try:
+        archived = (conversation_from_row(row) for row in archive.iter_rows())
+        total = StatisticsStore().rebuild(db, archived)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Готово: учтено обращений - {total}")
@@ -0,0 +1,158 @@
+"""Запуск приложения в несколько процессов с общим прогревом (prefork)
+
+Главный процесс один раз импортирует приложение, создает схему БД, строит
+индекс базы знаний, компилирует шаблоны и считает первый снимок статистики,
+затем запускает воркеры через fork. Воркеры получают прогретое состояние
+готовым и делят его страницы памяти с главным процессом (copy-on-write),
+счетчики воркеров ведутся в общей памяти (табло в /ready и /api/stats).
+Завершившийся воркер перезапускается. Только для Linux и macOS (fork).
+
+Запуск:
+    python serve.py --workers 4
+    python serve.py --workers 4 --host 127.0.0.1 --port 8080
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import settings
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """Сокет открывается один раз в главном процессе и наследуется воркерами"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def share_state_between_workers(workers: int):
+    """Общие для воркеров каталог метрик и корзины контроля приема
+
+    Если они не заданы явно, создаются во временном каталоге: иначе /metrics
+    показывал бы счетчики одного воркера, а лимиты на пользователя
+    умножались бы на число воркеров. Возвращает каталог для удаления.
+    """
+    if workers < 2:
+        return None
+    runtime_dir = None
+    if settings.METRICS_ENABLED and not settings.METRICS_MULTIPROC_DIR:
+        runtime_dir = tempfile.mkdtemp(prefix="it_support_")
+        settings.METRICS_MULTIPROC_DIR = os.path.join(runtime_dir, "metrics")
+    if settings.ADMISSION_ENABLED and not settings.ADMISSION_STORE_PATH:
+        runtime_dir = runtime_dir or tempfile.mkdtemp(prefix="it_support_")
+        settings.ADMISSION_STORE_PATH = os.path.join(runtime_dir, "admission.db")
+    return runtime_dir
+
+def run_worker(application, index: int, sock: socket.socket, log_level: str) -> int:
+    """Воркер после fork: своя строка табло и uvicorn на общем сокете"""
+    import uvicorn
+
+    # Сигналы обрабатывает uvicorn, а Ctrl+C в терминале получает только главный процесс
+    os.setpgid(0, 0)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    application.scoreboard.attach(index)
+    server = uvicorn.Server(uvicorn.Config(
+        application.app,
+        log_level=log_level,
+        access_log=settings.DEBUG,
+        timeout_graceful_shutdown=settings.WORKER_GRACEFUL_TIMEOUT
+    ))
+    server.run(sockets=[sock])
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.WORKER_GRACEFUL_TIMEOUT,
+                        help="сколько ждать завершения воркеров при остановке, с")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    runtime_dir = share_state_between_workers(args.workers)
+    sock = bind_socket(args.host, args.port)
+
+    import_started = time.perf_counter()
+    from app import main as application
+    from app.services.workers import WorkerScoreboard
+
+    application.warmup.record("import", (time.perf_counter() - import_started) * 1000)
+    application.preload(WorkerScoreboard(args.workers))
+    # Прогретые объекты больше не проверяются сборщиком мусора: он не трогает
+    # их страницы памяти, и они остаются общими с воркерами
+    gc.freeze()
+    print(f"Прогрев за {(time.perf_counter() - started) * 1000:.0f} мс "
+          f"({application.warmup.get_stats()['stages_ms']}), воркеров: {args.workers}")
+
+    children = {}  # pid -> (номер строки табло, время запуска)
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_worker(application, index, sock, args.log_level)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        children[pid] = (index, time.monotonic())
+
+    stopping = []
+
+    def stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic() + args.graceful_timeout)
+            print("Остановка воркеров...")
+            for child in children:
+                os.kill(child, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(args.workers):
+        spawn(index)
+
+    announced = False
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() > stopping[0]:
+                print("Воркеры не завершились вовремя, принудительная остановка")
+                for child in children:
+                    os.kill(child, signal.SIGKILL)
+                stopping[0] = float("inf")
+            if not announced and application.scoreboard.get_stats()["ready"] == args.workers:
+                announced = True
+                print(f"Все воркеры готовы за {(time.perf_counter() - started) * 1000:.0f} мс")
+            time.sleep(0.1)
+            continue
+        index, spawned_at = children.pop(pid)
+        application.scoreboard.clear(index)
+        if stopping:
+            continue
+        print(f"Воркер {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+        # Воркер, падающий сразу после запуска, перезапускается не чаще раза в секунду
+        time.sleep(max(0.0, 1 - (time.monotonic() - spawned_at)))
+        spawn(index)
+
+    sock.close()
+    if runtime_dir is not None:
+        shutil.rmtree(runtime_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Движки и фоновые сервисы приложения создаются при импорте app.database,
+# поэтому тестовая база задается до первого импорта app: иначе тесты
+# писали бы в ./it_support.db
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="it_support_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DATA_DIR, 'app.db')}"
+os.environ["DATABASE_READ_URL"] = ""
+
+from app.database import Base  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def session_factory(request, tmp_path):
+    """Фабрика сессий к чистой базе со всеми таблицами
+
+    По умолчанию база в памяти с одним соединением на все потоки. Параметр
+    "file" - файл SQLite во временном каталоге, у каждого потока свое соединение:
+    @pytest.mark.parametrize("session_factory", ["file"], indirect=True)
+    После теста engine закрывается вместе с соединениями.
+    """
+    if getattr(request, "param", "memory") == "file":
+        engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}", connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
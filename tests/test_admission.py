@@ -0,0 +1,104 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.services.admission import (
+    ADMIT, DEGRADE, SHED, THROTTLE, AdmissionController, MemoryBucketStore, SQLiteBucketStore
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _controller(store=None, **kwargs):
+    store = MemoryBucketStore() if store is None else store
+    store.clock = _Clock()
+    return AdmissionController(store, **kwargs)
+
+
+def test_user_bucket_refills_over_time():
+    controller = _controller(user_rate=2.0, user_burst=3)
+
+    assert [controller.admit("alice").action for _ in range(3)] == [ADMIT] * 3
+    throttled = controller.admit("alice")
+    assert throttled.action == THROTTLE and throttled.rejected
+    assert throttled.retry_after == 1
+    # Лимиты у пользователей раздельные
+    assert controller.admit("bob").action == ADMIT
+
+    controller.store.clock.now += 0.5  # +1 токен
+    assert controller.admit("alice").action == ADMIT
+    assert controller.admit("alice").action == THROTTLE
+    assert controller.get_stats()["throttled"] == 2
+
+
+def test_overload_degrades_and_sheds():
+    load = {"llm": 0.0, "write": 0.0}
+    controller = _controller(
+        user_rate=1.0, user_burst=100, llm_load=lambda: load["llm"], write_load=lambda: load["write"],
+        shed_ratio=0.9, max_retry_after=10
+    )
+    assert controller.admit("alice").action == ADMIT
+
+    # Все слоты LLM заняты - ответ без LLM, но запрос принимается
+    load["llm"] = 1.0
+    decision = controller.admit("alice")
+    assert decision.action == DEGRADE and not decision.rejected
+
+    # Очередь записи почти заполнена - отказ, повторить позже
+    load["write"] = 0.95
+    decision = controller.admit("alice")
+    assert decision.action == SHED and decision.retry_after == 10
+
+    stats = controller.get_stats()
+    assert (stats["admitted"], stats["degraded"], stats["shed"]) == (1, 1, 1)
+
+
+def test_global_bucket_degrades():
+    controller = _controller(user_burst=10, global_rate=1.0, global_burst=2)
+    actions = [controller.admit(f"user{i}").action for i in range(3)]
+    assert actions == [ADMIT, ADMIT, DEGRADE]
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    first = _controller(SQLiteBucketStore(path), user_rate=1.0, user_burst=2)
+    second = _controller(SQLiteBucketStore(path), user_rate=1.0, user_burst=2)
+    second.store.clock = first.store.clock
+
+    assert first.admit("alice").action == ADMIT
+    assert second.admit("alice").action == ADMIT
+    assert first.admit("alice").action == THROTTLE
+    assert second.admit("alice").action == THROTTLE
+
+    first.store.clock.now += 1.0
+    assert second.admit("alice").action == ADMIT
+    assert first.get_stats()["store"] == "sqlite" and first.get_stats()["tracked"] == 1
+    assert len(SQLiteBucketStore(path)) == 1
+
+
+@pytest.mark.asyncio
+async def test_locked_sqlite_store_fails_open_off_the_loop(tmp_path):
+    """Заблокированный файл корзин: решение в отдельном потоке и быстрый пропуск запроса"""
+    path = str(tmp_path / "buckets.db")
+    controller = _controller(SQLiteBucketStore(path, busy_timeout=0.005), user_burst=2)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.perf_counter()
+        decisions = await asyncio.gather(*[controller.aadmit("alice") for _ in range(3)])
+        elapsed = time.perf_counter() - started
+        assert controller.get_stats()["tracked"] == 0
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    assert [decision.action for decision in decisions] == [ADMIT] * 3
+    assert controller.get_stats()["errors"] == 3
+    assert elapsed < 0.5
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.conversation import Conversation
+from app.services.analytics_service import AnalyticsService
+from app.services.latency import LatencyRecorder
+from app.services.statistics_store import StatisticsStore
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _conversations(now):
+    return [
+        Conversation(user_id="alice", user_message="Забыл пароль", bot_response="...",
+                     timestamp=now - timedelta(minutes=5), category="password"),
+        Conversation(user_id="alice", user_message="Нет доступа", bot_response="...",
+                     timestamp=now - timedelta(days=2), category="access"),
+        Conversation(user_id="bob", user_message="Привет", bot_response="...",
+                     timestamp=now - timedelta(days=3), category=None),
+        # Так сохраняет неклассифицированные сообщения /chat
+        Conversation(user_id="carol", user_message="Принтер не печатает", bot_response="...",
+                     timestamp=now - timedelta(days=3), category="general"),
+        Conversation(user_id="bob", user_message="VPN", bot_response="...",
+                     timestamp=now - timedelta(days=30), category="connection"),
+    ]
+
+
+def test_incremental_counters_match_rebuild(db):
+    """Статистика по инкрементальным счетчикам совпадает с полным пересчетом"""
+    store = StatisticsStore()
+    analytics = AnalyticsService()
+    now = datetime.utcnow()
+
+    for conversation in _conversations(now):
+        db.add(conversation)
+        store.record(db, conversation)
+    db.commit()
+    incremental = analytics.get_statistics(db)
+
+    assert store.rebuild(db) == 5
+    db.commit()
+    rebuilt = analytics.get_statistics(db)
+
+    assert incremental == rebuilt
+    assert incremental["total_conversations"] == 5
+    assert incremental["recent_conversations"] == 1
+    assert incremental["week_conversations"] == 4
+    assert incremental["categories"] == {"password": 1, "access": 1, "general": 2, "connection": 1}
+    assert sorted(user["user_id"] for user in incremental["top_users"]) == ["alice", "bob", "carol"]
+    assert sum(day["count"] for day in incremental["daily_stats"]) == 4
+
+
+def test_counters_without_on_conflict_match_rebuild(db, monkeypatch):
+    """В БД без ON CONFLICT счетчики обновляются выборкой и UPDATE"""
+    store = StatisticsStore()
+    monkeypatch.setattr(store, "_insert_for", lambda db: None)
+    analytics = AnalyticsService()
+    now = datetime.utcnow()
+
+    for conversation in _conversations(now) + _conversations(now - timedelta(hours=1)):
+        db.add(conversation)
+        store.record(db, conversation)
+    db.commit()
+    incremental = analytics.get_statistics(db)
+
+    assert store.rebuild(db) == 10
+    db.commit()
+    assert incremental == analytics.get_statistics(db)
+    assert incremental["categories"]["general"] == 4
+
+
+def test_category_trends_dense_matrix(db):
+    """Тренды заполнены по всем периодам, включая категорию 'general'"""
+    store = StatisticsStore()
+    now = datetime(2024, 3, 15, 12, 30)
+
+    for conversation in _conversations(now):
+        db.add(conversation)
+        store.record(db, conversation)
+    db.commit()
+
+    trends = AnalyticsService().get_category_trends(db, days=7, end=now)
+
+    assert set(trends) == {"password", "access", "general", "connection"}
+    assert all(len(series) == 7 for series in trends.values())
+    assert trends["general"][-4] == {"date": "2024-03-12", "count": 2}
+    assert trends["password"][-1] == {"date": "2024-03-15", "count": 1}
+    assert sum(point["count"] for point in trends["connection"]) == 0
+
+    hourly = AnalyticsService().get_category_trends(db, days=1, granularity="hour", end=now)
+    assert len(hourly["password"]) == 24
+    assert hourly["password"][-1] == {"date": "2024-03-15 12:00", "count": 1}
+
+
+def test_user_activity_aggregates_and_keyset_pages(db, session_factory):
+    """Счетчики пользователя в SQL и страницы по курсору без пропусков и повторов"""
+    analytics = AnalyticsService()
+    now = datetime(2024, 5, 1, 12, 0)
+    # Одинаковые timestamp проверяют, что ключ страницы включает id
+    db.add_all([
+        Conversation(user_id="alice", user_message=f"Вопрос {i} " + "x" * (120 if i == 0 else 0),
+                     bot_response="...", timestamp=now - timedelta(hours=i // 2),
+                     category="password" if i % 3 else ("general" if i % 2 else None))
+        for i in range(25)
+    ])
+    db.add_all(_conversations(now)[2:])
+    db.commit()
+
+    activity = analytics.get_user_activity(db, "alice", limit=10)
+    assert activity["total_conversations"] == 25
+    assert activity["categories"] == {"password": 16, "general": 9}
+    assert activity["last_contact"] == now.isoformat()
+    assert activity["first_contact"] == (now - timedelta(hours=12)).isoformat()
+    assert len(activity["recent_conversations"]) == 10
+    assert analytics.get_user_activity(db, "nobody") == {"error": "User not found"}
+
+    seen, cursor = [], None
+    while True:
+        page = analytics.get_user_conversations(db, "alice", limit=7, cursor=cursor)
+        seen.extend(item["id"] for item in page["conversations"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 25
+    assert seen[:10] == [item["id"] for item in activity["recent_conversations"]]
+
+    long_message = next(item["message"] for item in activity["recent_conversations"]
+                        if item["message"].startswith("Вопрос 0 "))
+    assert long_message.endswith("...") and len(long_message) == 103
+
+    with pytest.raises(ValueError):
+        analytics.get_user_conversations(db, "alice", cursor="не-курсор")
+
+    batches = list(analytics.iter_user_conversation_batches(session_factory, "alice", batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    exported = [row["id"] for batch in batches for row in batch]
+    assert exported == list(reversed(seen))
+
+
+def test_latency_histograms_and_sla(db):
+    """Гистограммы этапов в stats_latency дают перцентили и проценты SLA"""
+    store = StatisticsStore()
+    analytics = AnalyticsService()
+    now = datetime.utcnow()
+    recorder = LatencyRecorder()
+    for i in range(100):
+        # 90 быстрых ответов и 10 медленных
+        total = 500 if i < 90 else 5000
+        recorder.observe("password" if i % 2 else "access", {"llm": total - 10, "total": total}, now)
+    store.record_latency(db, recorder.drain())
+    db.commit()
+
+    latency = analytics.get_latency_stats(db, days=7, now=now)
+    assert latency["stages"]["total"]["count"] == 100
+    assert 400 < latency["stages"]["total"]["p50"] <= 500
+    assert latency["stages"]["total"]["p99"] > 3000
+    assert set(latency["categories"]) == {"access", "password"}
+    assert latency["daily"][-1]["count"] == 100
+    assert len(latency["daily"]) == 7
+
+    sla = analytics.get_statistics(db)["sla_metrics"]
+    assert sla["measured"] == 100
+    assert [target["percentage"] for target in sla["targets"]] == [90.0, 90.0, 100.0]
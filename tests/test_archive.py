@@ -0,0 +1,92 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.conversation import Conversation
+from app.models.statistics import CategoryStat, UserStat
+from app.services.archive import ConversationArchive, ConversationArchiver, conversation_from_row
+from app.services.statistics_store import StatisticsStore
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def ten_days(session_factory):
+    db = session_factory()
+    conversations = [
+        Conversation(user_id=f"user_{i % 3}", user_message=f"Вопрос {i}", bot_response="Ответ",
+                     timestamp=NOW - timedelta(hours=6 * i), category="password" if i % 2 else None)
+        for i in range(40)  # 10 дней по 4 обращения
+    ]
+    db.add_all(conversations)
+    StatisticsStore().record_many(db, conversations)
+    db.commit()
+    db.close()
+
+
+@pytest.mark.parametrize("session_factory", ["file"], indirect=True)
+def test_archive_moves_old_days_and_reads_across_tiers(session_factory, tmp_path):
+    """Старые дни уходят в файлы, счетчики не меняются, чтение объединяет архив и таблицу"""
+    archive = ConversationArchive(str(tmp_path / "archive"))
+    archiver = ConversationArchiver(session_factory, archive, retention_days=3, batch_size=3)
+
+    result = archiver.run(now=NOW)
+    cutoff = archiver.cutoff(NOW)
+    db = session_factory()
+    hot = db.query(Conversation).all()
+    assert hot and all(conv.timestamp >= cutoff for conv in hot)
+    assert result["archived"] == 40 - len(hot)
+    assert result["days"] == len(archive.days())
+    assert db.query(UserStat).count() == 3
+    assert sum(row.count for row in db.query(CategoryStat)) == 40
+    db.close()
+
+    with gzip.open(archive.path_for(archive.days()[0]), "rt", encoding="utf-8") as f:
+        assert {"id", "user_id", "timestamp", "user_message"} <= set(json.loads(f.readline()))
+
+    # Повторный запуск ничего не переносит и не дублирует строки
+    assert archiver.run(now=NOW) == {"days": 0, "archived": 0}
+
+    rows = list(archive.iter_conversations(session_factory, batch_size=4))
+    assert len(rows) == len({row["id"] for row in rows}) == 40
+    assert [row["timestamp"] for row in rows] == sorted(row["timestamp"] for row in rows)
+
+    user_rows = list(archive.iter_conversations(
+        session_factory, start=NOW - timedelta(days=6), end=NOW - timedelta(days=1), user_id="user_1"
+    ))
+    assert user_rows and all(row["user_id"] == "user_1" for row in user_rows)
+    assert all(NOW - timedelta(days=6) <= datetime.fromisoformat(row["timestamp"]) < NOW - timedelta(days=1)
+               for row in user_rows)
+
+    # Пересчет счетчиков учитывает архив
+    db = session_factory()
+    total = StatisticsStore().rebuild(db, (conversation_from_row(row) for row in archive.iter_rows()))
+    db.commit()
+    assert total == 40
+    assert sum(row.count for row in db.query(CategoryStat)) == 40
+    db.close()
+
+
+@pytest.mark.parametrize("session_factory", ["file"], indirect=True)
+def test_interrupted_archive_is_rewritten_without_duplicates(session_factory, tmp_path):
+    """Файл дня, записанный до сбоя, при следующем запуске объединяется без повторов"""
+    archive = ConversationArchive(str(tmp_path / "archive"))
+    archiver = ConversationArchiver(session_factory, archive, retention_days=3)
+    day = (NOW - timedelta(days=9)).date()
+
+    db = session_factory()
+    start = datetime(day.year, day.month, day.day)
+    rows = [
+        {**{name: getattr(conv, name) for name in ("id", "user_id", "user_message", "bot_response",
+                                                   "category", "response_time_ms")},
+         "timestamp": conv.timestamp.isoformat()}
+        for conv in db.query(Conversation).filter(Conversation.timestamp >= start,
+                                                  Conversation.timestamp < start + timedelta(days=1))
+    ]
+    db.close()
+    archive.write_day(day, iter(rows[:2]))  # Сбой после записи файла, до удаления строк
+
+    archiver.run(now=NOW)
+    assert len(list(archive.read_day(day))) == len(rows)
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.services.chatbot_service import ChatbotService
+
+
+class _SlowCompletions:
+    """Имитация chat.completions с задержкой и подсчетом параллельных вызовов"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        class _Message:
+            content = " Ответ "
+
+        class _Choice:
+            message = _Message()
+
+        class _Response:
+            choices = [_Choice()]
+
+        return _Response()
+
+
+class _FakeClient:
+    def __init__(self, completions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+
+@pytest.mark.asyncio
+async def test_get_response_falls_back_on_timeout(monkeypatch):
+    """Медленный ответ LLM прерывается по DEFAULT_RESPONSE_TIMEOUT"""
+    monkeypatch.setattr(settings, "DEFAULT_RESPONSE_TIMEOUT", 0.05)
+    service = ChatbotService()
+    service.intent_router = None  # Иначе на вопрос о пароле ответит база знаний без LLM
+    service.client = _FakeClient(_SlowCompletions(delay=1))
+
+    response = await service.get_response("Забыл пароль")
+
+    assert response == service._get_fallback_response("Забыл пароль")
+
+
+@pytest.mark.asyncio
+async def test_get_response_limits_concurrency():
+    """Одновременно к LLM уходит не больше LLM_MAX_CONCURRENCY запросов"""
+    service = ChatbotService()
+    completions = _SlowCompletions(delay=0.01)
+    service.client = _FakeClient(completions)
+    service._llm_semaphore = asyncio.Semaphore(3)
+    observed = []
+    create = completions.create
+
+    async def observe(**kwargs):
+        observed.append(service.llm_in_flight)
+        return await create(**kwargs)
+
+    completions.create = observe
+
+    responses = await asyncio.gather(*[service.get_response(f"Вопрос {i}") for i in range(10)])
+
+    assert responses == ["Ответ"] * 10
+    assert completions.max_in_flight == 3
+    assert max(observed) == 3
+    assert service.llm_in_flight == 0
+
+
+def test_system_prompt_contains_only_relevant_passages():
+    """В промпт попадают фрагменты статей категории вопроса, а не вся база"""
+    service = ChatbotService()
+
+    prompt = service._build_system_prompt("password", "Какие требования к паролю?")
+    assert "Минимум 8 символов" in prompt
+    assert "VPN" not in prompt
+
+    assert "Фрагменты базы знаний" not in service._build_system_prompt("general", "абракадабра")
+
+
+@pytest.mark.asyncio
+async def test_history_is_sent_to_llm_and_bypasses_cache():
+    """История диалога уходит в запрос, а ответ с контекстом не кэшируется"""
+    service = ChatbotService()
+    completions = _SlowCompletions(delay=0)
+    calls = []
+    create = completions.create
+
+    async def capture(**kwargs):
+        calls.append(kwargs["messages"])
+        return await create(**kwargs)
+
+    completions.create = capture
+    service.client = _FakeClient(completions)
+    history = [
+        {"role": "user", "content": "Забыл пароль"},
+        {"role": "assistant", "content": "Откройте страницу сброса"}
+    ]
+
+    await service.get_response("А если письмо не пришло?", "alice", history=history)
+    await service.get_response("А если письмо не пришло?", "alice", history=history)
+
+    assert len(calls) == 2
+    assert calls[0][1:] == history + [{"role": "user", "content": "А если письмо не пришло?"}]
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_questions_share_one_llm_call():
+    """Одинаковые одновременные вопросы уходят в LLM одним запросом"""
+    service = ChatbotService()
+    service.response_cache = None
+    service.intent_router = None
+    completions = _SlowCompletions(delay=0.05)
+    calls = []
+    create = completions.create
+
+    async def count(**kwargs):
+        calls.append(kwargs)
+        return await create(**kwargs)
+
+    completions.create = count
+    service.client = _FakeClient(completions)
+
+    responses = await asyncio.gather(*[
+        service.get_response("Нет интернета!" if i % 2 else "нет  интернета", f"user_{i}") for i in range(10)
+    ])
+
+    assert responses == ["Ответ"] * 10
+    assert len(calls) == 1
+    assert service.single_flight.get_stats()["shared"] == 9
+
+
+@pytest.mark.asyncio
+async def test_confident_questions_are_answered_from_knowledge_base():
+    """Уверенно классифицированный вопрос - ответ из базы знаний без LLM,
+    уточняющий вопрос - доработка этого ответа LLM, неясный вопрос - LLM"""
+    service = ChatbotService()
+    service.response_cache = None
+    completions = _SlowCompletions(delay=0)
+    calls = []
+    create = completions.create
+
+    async def capture(**kwargs):
+        calls.append(kwargs["messages"])
+        return await create(**kwargs)
+
+    completions.create = capture
+    service.client = _FakeClient(completions)
+
+    response = await service.get_response("Забыл пароль, как сбросить?")
+    assert "https://password-reset.company.com" in response
+    assert not calls
+
+    history = [{"role": "user", "content": "Забыл пароль"}, {"role": "assistant", "content": response}]
+    assert await service.get_response("Какие требования к паролю?", history=history) == "Ответ"
+    assert "Ответ из базы знаний" in calls[0][0]["content"]
+    assert "Минимум 8 символов" in calls[0][0]["content"]
+
+    assert await service.get_response("Где найти шаблон заявления?") == "Ответ"
+    assert len(calls) == 2
+
+    stats = service.intent_router.get_stats()
+    assert stats["routes"] == {"kb": 1, "kb_polish": 1, "llm": 1}
+    assert stats["skipped_llm_ratio"] == round(1 / 3, 4)
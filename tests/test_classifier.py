@@ -0,0 +1,39 @@
+import json
+import os
+
+from app.services.classifier import MessageClassifier
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "classifier_cases.json")
+
+
+def _cases():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_classifier_accuracy_on_labelled_cases():
+    """Точность на размеченной выборке"""
+    classifier = MessageClassifier()
+    cases = _cases()
+
+    mistakes = [
+        (case["message"], case["category"], classifier.classify(case["message"]).category)
+        for case in cases
+        if classifier.classify(case["message"]).category != case["category"]
+    ]
+
+    assert len(mistakes) / len(cases) <= 0.05, mistakes
+
+
+def test_classifier_matches_word_forms_and_weights():
+    """Основы слов совпадают с формами, а выбор идет по сумме весов"""
+    classifier = MessageClassifier()
+
+    result = classifier.classify("Сбросьте мне пароля, не могу войти в VPN")
+    assert result.category == "password"
+    assert result.scores["connection"] > 0
+    assert 0 < result.confidence < 1
+
+    assert classifier.classify("ПАРОЛЕМ").category == "password"
+    assert classifier.classify("непароль").category == "general"
+    assert classifier.classify("").confidence == 0.0
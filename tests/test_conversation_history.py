@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.conversation import Conversation
+from app.services.conversation_history import ConversationHistoryStore
+
+
+@pytest.fixture(autouse=True)
+def alice_history(session_factory):
+    db = session_factory()
+    now = datetime.utcnow()
+    db.add_all([
+        Conversation(user_id="alice", user_message=f"Вопрос {i}", bot_response=f"Ответ {i}",
+                     timestamp=now - timedelta(minutes=10 - i))
+        for i in range(5)
+    ])
+    db.commit()
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_warms_from_db_once_and_keeps_ring_buffer(session_factory):
+    """Холодный промах - один запрос к БД, дальше история в памяти"""
+    store = ConversationHistoryStore(session_factory, max_turns=3)
+
+    messages = await store.get_messages("alice")
+    assert [m["content"] for m in messages] == [
+        "Вопрос 2", "Ответ 2", "Вопрос 3", "Ответ 3", "Вопрос 4", "Ответ 4"
+    ]
+
+    store.append("alice", "Вопрос 5", "Ответ 5")
+    messages = await store.get_messages("alice")
+    assert messages[0]["content"] == "Вопрос 3"
+    assert messages[-1] == {"role": "assistant", "content": "Ответ 5"}
+
+    assert await store.get_messages("bob") == []
+    assert await store.get_messages("bob") == []
+    assert await store.get_messages("anonymous") == []
+
+    stats = store.get_stats()
+    assert stats["warm_queries"] == 2
+    assert stats["hits"] == 2
+    assert stats["users"] == 2
+
+
+@pytest.mark.asyncio
+async def test_token_budget_age_and_lru_limits(session_factory):
+    """Обрезка по токенам и возрасту, вытеснение по числу пользователей и памяти"""
+    store = ConversationHistoryStore(session_factory, max_turns=10, max_tokens=20)
+    await store.get_messages("alice")
+    store.append("alice", "длинный вопрос " * 5, "длинный ответ " * 5)
+    assert await store.get_messages("alice") == []
+
+    store = ConversationHistoryStore(session_factory, max_age_seconds=6.5 * 60)
+    assert [m["content"] for m in await store.get_messages("alice")] == ["Вопрос 4", "Ответ 4"]
+
+    store = ConversationHistoryStore(session_factory, max_users=2)
+    for user_id in ("alice", "bob", "carol"):
+        await store.get_messages(user_id)
+    assert store.get_stats()["users"] == 2
+    assert store.get_stats()["evictions"] == 1
+
+    store = ConversationHistoryStore(session_factory, max_bytes=1500)
+    await store.get_messages("alice")
+    await store.get_messages("bob")
+    store.append("bob", "вопрос " * 200, "ответ")
+    stats = store.get_stats()
+    assert stats["memory_bytes"] <= 1500
+    assert stats["users"] <= 1
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.conversation import Conversation
+from app.models.statistics import CategoryStat, LatencyStat
+from app.services.conversation_writer import ConversationWriter
+from app.services.latency import LatencyRecorder
+from app.services.statistics_store import StatisticsStore
+
+
+def _conversation(i):
+    return Conversation(user_id=f"user_{i % 3}", user_message=f"Вопрос {i}",
+                        bot_response="Ответ", category="password")
+
+
+@pytest.mark.asyncio
+async def test_sync_mode_writes_in_batches(session_factory):
+    """В режиме sync submit возвращается после commit пачки"""
+    writer = ConversationWriter(session_factory, StatisticsStore(), batch_size=10,
+                                flush_interval=0.01, durability="sync")
+    writer.start()
+
+    await asyncio.gather(*[writer.submit(_conversation(i)) for i in range(25)])
+
+    db = session_factory()
+    assert db.query(Conversation).count() == 25
+    assert db.query(CategoryStat).one().count == 25
+    db.close()
+
+    stats = writer.get_stats()
+    assert stats["written"] == 25
+    assert stats["batches"] == 3
+    assert stats["max_batch"] == 10
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_queue_in_async_mode(session_factory):
+    """При остановке очередь записывается полностью"""
+    writer = ConversationWriter(session_factory, StatisticsStore(), batch_size=50,
+                                flush_interval=10, durability="async")
+    writer.start()
+
+    for i in range(120):
+        await writer.submit(_conversation(i))
+    await writer.stop()
+
+    db = session_factory()
+    assert db.query(Conversation).count() == 120
+    db.close()
+    assert writer.get_stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_latency_is_written_with_batches(session_factory):
+    """Замеры этапов и db_write попадают в stats_latency"""
+    recorder = LatencyRecorder()
+    writer = ConversationWriter(session_factory, StatisticsStore(), batch_size=10,
+                                flush_interval=0.01, latency_recorder=recorder)
+    writer.start()
+
+    recorder.observe("password", {"total": 120})
+    for i in range(5):
+        await writer.submit(_conversation(i))
+    await writer.stop()
+
+    db = session_factory()
+    stages = Counter()
+    for stat in db.query(LatencyStat).all():
+        stages[stat.stage] += stat.count
+    db.close()
+    assert stages == {"total": 1, "db_write": 5}
+    assert len(recorder) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_then_counted_as_dropped(session_factory):
+    """Временная ошибка записи повторяется, после всех повторов диалоги учитываются как потерянные"""
+    failures = [2]
+
+    def flaky_factory():
+        if failures[0] > 0:
+            failures[0] -= 1
+            raise RuntimeError("database is locked")
+        return session_factory()
+
+    writer = ConversationWriter(flaky_factory, StatisticsStore(), batch_size=10, flush_interval=0.01,
+                                max_retries=2, retry_backoff=0.001)
+    writer.start()
+    for i in range(3):
+        await writer.submit(_conversation(i))
+    await asyncio.sleep(0.1)
+    assert writer.get_stats()["written"] == 3
+    assert writer.get_stats()["retries"] == 2
+
+    failures[0] = 3
+    for i in range(4):
+        await writer.submit(_conversation(i))
+    await writer.stop()
+    stats = writer.get_stats()
+    assert (stats["written"], stats["failed"], stats["dropped"]) == (3, 4, 4)
+
+
+@pytest.mark.asyncio
+async def test_timestamps_are_utc_regardless_of_local_timezone(session_factory, monkeypatch):
+    """Время диалога и счетчики статистики - в UTC, как и запросы аналитики"""
+    monkeypatch.setenv("TZ", "Asia/Novosibirsk")
+    time.tzset()
+    try:
+        writer = ConversationWriter(session_factory, StatisticsStore())
+        conversation = _conversation(0)
+        await writer.submit(conversation)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert abs(conversation.timestamp - datetime.utcnow()) < timedelta(minutes=1)
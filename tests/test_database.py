@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.config import settings
+from app.database import create_engines, schema_lock, to_async_url
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:///./it_support.db") == "sqlite+aiosqlite:///./it_support.db"
+    assert to_async_url("postgresql://bot:secret@db/support") == "postgresql+asyncpg://bot:secret@db/support"
+    assert to_async_url("postgresql+asyncpg://db/support") == "postgresql+asyncpg://db/support"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_pragmas_and_read_only_engine(tmp_path):
+    """WAL и busy_timeout на всех соединениях, запись через движок чтения запрещена"""
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    engine, async_engine, read_engine = create_engines(url)
+    try:
+        with engine.begin() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            connection.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+
+        async with async_engine.begin() as connection:
+            assert (await connection.execute(text("PRAGMA busy_timeout"))).scalar() == settings.DB_BUSY_TIMEOUT_MS
+            await connection.execute(text("INSERT INTO items (id) VALUES (1)"))
+
+        async with read_engine.connect() as connection:
+            assert (await connection.execute(text("SELECT count(*) FROM items"))).scalar() == 1
+            with pytest.raises(OperationalError):
+                await connection.execute(text("INSERT INTO items (id) VALUES (2)"))
+    finally:
+        engine.dispose()
+        await async_engine.dispose()
+        await read_engine.dispose()
+
+
+def test_schema_lock_serializes_init(tmp_path):
+    """Второй процесс (здесь - поток) ждет, пока первый создаст схему"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    events = []
+
+    def init(name):
+        with schema_lock(engine):
+            events.append(f"{name}:start")
+            time.sleep(0.2)
+            events.append(f"{name}:end")
+
+    threads = [threading.Thread(target=init, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [event.split(":")[1] for event in events] == ["start", "end", "start", "end"]
+    engine.dispose()
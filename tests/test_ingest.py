@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func
+
+from app.models.conversation import Conversation
+from app.models.statistics import CategoryStat
+from app.services.classifier import Classification
+from app.services.ingest import IngestService
+from app.services.intent_router import ROUTE_KB, ROUTE_LLM
+from app.services.statistics_store import StatisticsStore
+
+# Файл, а не общая память: запись и чтение идут из разных потоков через свои соединения
+pytestmark = pytest.mark.parametrize("session_factory", ["file"], indirect=True)
+
+
+class _Chatbot:
+    """Чат-бот без LLM: вопросы о пароле - из базы знаний, остальные - "LLM" с задержкой"""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.release = asyncio.Event()
+        self.release.set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.llm_calls = 0
+
+    def classify(self, message):
+        category = "password" if "пароль" in message else "general"
+        return Classification(category, 1.0 if category == "password" else 0.0)
+
+    def route(self, classification, history=None):
+        return ROUTE_KB if classification.category == "password" else ROUTE_LLM
+
+    async def get_response(self, message, user_id="anonymous", classification=None, history=None,
+                           timer=None, route=None):
+        if route == ROUTE_KB:
+            return "Инструкция по сбросу пароля"
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self.release.wait()
+            await asyncio.sleep(self.delay)
+            self.llm_calls += 1
+            return f"Ответ: {message}"
+        finally:
+            self.in_flight -= 1
+
+
+async def _items(values):
+    for value in values:
+        yield value
+
+
+def _service(session_factory, chatbot, **kwargs):
+    return IngestService(session_factory, chatbot, StatisticsStore(), concurrency=2, batch_size=5,
+                         flush_interval=0.01, lease_seconds=30, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_job_results_are_streamed_and_persisted(session_factory):
+    chatbot = _Chatbot()
+    service = _service(session_factory, chatbot)
+    values = [{"id": f"m{i}", "user_id": f"u{i % 3}", "message": f"Забыл пароль {i}" if i % 2 else f"Вопрос {i}"}
+              for i in range(20)]
+    values += [b"{not json", {"user_id": "u1"}]
+
+    job = await service.create_job(_items(values), source="mail")
+    assert job["total"] == 22
+    results = [result async for result in service.results(job["job_id"])]
+
+    assert sorted(result["seq"] for result in results) == list(range(1, 23))
+    assert [result["n"] for result in results] == list(range(1, 23))
+    failed = {result["seq"]: result["error"] for result in results if result["status"] == "failed"}
+    assert failed == {21: "Некорректный JSON", 22: "Пустое сообщение"}
+    assert chatbot.llm_calls == 10 and chatbot.max_in_flight <= 2
+
+    status = await service.get_job(job["job_id"])
+    assert (status["status"], status["processed"], status["failed"]) == ("done", 22, 2)
+    with session_factory() as db:
+        assert db.query(func.count(Conversation.id)).scalar() == 20
+        assert db.get(CategoryStat, "password").count == 10
+
+    # Повторное чтение с курсора отдает только оставшиеся результаты
+    tail = [result async for result in service.results(job["job_id"], after=20)]
+    assert [result["n"] for result in tail] == [21, 22]
+
+    # Чтение завершенного, неизвестного и брошенного задания не оставляет событий ожидания
+    assert [result async for result in service.results("unknown")] == []
+    reader = service.results(job["job_id"])
+    await reader.__anext__()
+    await reader.aclose()
+    assert service._progress == {}
+
+    with pytest.raises(ValueError):
+        await _service(session_factory, chatbot, max_items=3).create_job(_items(values))
+
+
+@pytest.mark.asyncio
+async def test_job_resumes_in_another_process(session_factory):
+    """Остановленный процесс снимает аренду, и задание продолжает другой
+    без повторной обработки уже записанных обращений"""
+    chatbot = _Chatbot()
+    chatbot.release.clear()
+    first = _service(session_factory, chatbot)
+    values = [{"message": f"Забыл пароль {i}" if i < 6 else f"Вопрос {i}"} for i in range(10)]
+    job = await first.create_job(_items(values))
+
+    # Ответы из базы знаний записаны, запросы к "LLM" зависли
+    for _ in range(100):
+        if (await first.get_job(job["job_id"]))["processed"] == 6:
+            break
+        await asyncio.sleep(0.01)
+    await first.stop()
+    assert (await first.get_job(job["job_id"]))["status"] == "running"
+
+    chatbot.release.set()
+    second = _service(session_factory, chatbot)
+    assert await second.resume() == 1
+    results = [result async for result in second.results(job["job_id"])]
+    assert sorted(result["seq"] for result in results) == list(range(1, 11))
+    assert chatbot.llm_calls == 4
+    with session_factory() as db:
+        assert db.query(func.count(Conversation.id)).scalar() == 10
+    await second.stop()
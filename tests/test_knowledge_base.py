@@ -0,0 +1,88 @@
+import json
+import os
+
+from app.services.knowledge_base import KnowledgeBase, split_passages, tokenize
+
+VPN_ARTICLE = """---
+category: connection
+title: Настройка VPN
+---
+
+Установите корпоративный VPN клиент из каталога ПО.
+
+Введите учетные данные и выберите ближайший сервер.
+"""
+
+
+def _write_articles(directory):
+    (directory / "vpn.md").write_text(VPN_ARTICLE, encoding="utf-8")
+    (directory / "printers.json").write_text(json.dumps([
+        {"category": "printing", "title": "Принтеры", "text": "Принтер на этаже подключается по имени PRN-01."},
+        {"category": "printing", "title": "Картриджи", "text": "Замену картриджа заказывайте через ServiceDesk."}
+    ], ensure_ascii=False), encoding="utf-8")
+
+
+def test_tokenize_and_split_passages():
+    """Основы слов, стоп-слова и разбиение по абзацам"""
+    assert tokenize("Забыл пароль, сброс пароля") == ["забыл", "парол", "сброс", "парол"]
+    assert tokenize("Как и где") == ["где"]
+
+    passages = split_passages("первый абзац\n\nвторой абзац\n\n" + "строка\n" * 30, max_chars=40)
+    assert passages[0] == "первый абзац\n\nвторой абзац"
+    assert all(len(passage) <= 40 for passage in passages)
+
+
+def test_search_ranks_passages_and_filters_by_category(tmp_path):
+    """Релевантный фрагмент первым, словарный доступ к статьям категории"""
+    _write_articles(tmp_path)
+    kb = KnowledgeBase(str(tmp_path), passage_chars=60, reload_interval=0)
+
+    assert kb.get_stats()["articles"] == 3
+    assert "connection" in kb and "printing" in kb
+    assert "Картриджи" not in kb["printing"]
+    assert kb["printing"].startswith("Принтер на этаже")
+
+    results = kb.search("как заменить картридж")
+    assert results[0].title == "Картриджи"
+    assert kb.search("сервер vpn", k=1)[0].category == "connection"
+    assert kb.search("картридж", category="connection") == []
+    assert kb.search("погода на марсе") == []
+
+
+def test_reload_on_change_and_prebuilt_index(tmp_path):
+    """Перестройка после правки файла и загрузка сохраненного индекса"""
+    articles = tmp_path / "kb"
+    articles.mkdir()
+    _write_articles(articles)
+    kb = KnowledgeBase(str(articles), reload_interval=0)
+    version = kb.version("connection")
+    assert kb.version("unknown") == kb.version()
+
+    index_path = str(tmp_path / "index.json")
+    kb.save_index(index_path)
+    loaded = KnowledgeBase(str(articles), index_path=index_path, reload_interval=0)
+    assert loaded.get_stats()["loaded_from"] == "index"
+    assert loaded.search("картридж")[0].title == "Картриджи"
+
+    assert kb.reload() is False
+    (articles / "vpn.md").write_text(VPN_ARTICLE + "\nПри ошибке 809 перезагрузите роутер.\n", encoding="utf-8")
+    os.utime(articles / "vpn.md", ns=(0, 10 ** 18))
+    assert kb.reload() is True
+    assert kb.version("connection") != version
+    assert kb.search("ошибка 809")[0].category == "connection"
+
+    # Устаревший индекс не используется
+    stale = KnowledgeBase(str(articles), index_path=index_path, reload_interval=0)
+    assert stale.get_stats()["loaded_from"] == "files"
+
+
+def test_malformed_json_articles_are_skipped(tmp_path):
+    """Элементы без text не мешают загрузке остальных статей"""
+    _write_articles(tmp_path)
+    (tmp_path / "broken.json").write_text(json.dumps([
+        {"title": "x"}, "строка", {"text": 5}, {"text": "Доступ к порталу выдает администратор."}
+    ], ensure_ascii=False), encoding="utf-8")
+    kb = KnowledgeBase(str(tmp_path), reload_interval=0)
+
+    assert kb.get_stats()["articles"] == 4
+    assert kb.search("доступ к порталу", k=1)[0].category == "broken"
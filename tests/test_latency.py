@@ -0,0 +1,52 @@
+import random
+from datetime import datetime
+
+from app.services.latency import GROWTH, LatencyHistogram, LatencyRecorder, StageTimer, bucket_for
+
+
+def test_histogram_quantiles_within_bucket_error():
+    """Перцентили гистограммы близки к точным, слияние равно общей гистограмме"""
+    rng = random.Random(1)
+    samples = [rng.lognormvariate(6, 0.8) for _ in range(20000)]
+    first, second, whole = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, ms in enumerate(samples):
+        (first if i % 2 else second).add(ms)
+        whole.add(ms)
+
+    merged = first.merge(second)
+    assert merged.counts == whole.counts
+
+    ordered = sorted(samples)
+    for q in (0.5, 0.95, 0.99):
+        exact = ordered[int(q * len(ordered))]
+        assert abs(merged.quantile(q) - exact) / exact < GROWTH - 1
+
+    share = merged.share_within(1000)
+    exact_share = sum(ms <= 1000 for ms in samples) / len(samples)
+    assert abs(share - exact_share) < 0.02
+    assert LatencyHistogram().summary() == {"count": 0, "p50": None, "p95": None, "p99": None}
+
+
+def test_bucket_boundaries_and_recorder():
+    """Границы корзин и накопление дельт по дням и категориям"""
+    assert bucket_for(0.3) == bucket_for(1) == 0
+    assert bucket_for(GROWTH ** 10) == 10
+    assert bucket_for(GROWTH ** 10 * 1.01) == 11
+
+    timer = StageTimer()
+    with timer.stage("cache"):
+        pass
+    timer.record("llm", 1200)
+    timer.record("llm", 300)
+    assert timer.timings["llm"] == 1500
+
+    recorder = LatencyRecorder()
+    moment = datetime(2024, 5, 1, 15, 30)
+    recorder.observe(None, timer.timings, moment)
+    recorder.observe(None, {"llm": 1500}, moment)
+    deltas = dict(recorder.drain())
+    assert deltas[(datetime(2024, 5, 1), "general", "llm", bucket_for(1500))] == 2
+    assert len(recorder) == 0
+
+    recorder.restore(deltas.items())
+    assert len(recorder) == 2
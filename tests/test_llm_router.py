@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm_router import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LLMBackend, LLMRouter, NoBackendAvailable, parse_backends
+)
+
+
+class _Completions:
+    """Имитация chat.completions: задержка, ошибка и подсчет вызовов"""
+
+    def __init__(self, name: str, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} недоступен")
+        return self.name
+
+
+def _backend(completions: _Completions, breaker: CircuitBreaker = None) -> LLMBackend:
+    client = type("Client", (), {"chat": type("Chat", (), {"completions": completions})()})()
+    return LLMBackend(completions.name, client, "model", breaker=breaker)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_failover_and_circuit_breaker():
+    """Ошибки переключают на следующий бэкенд, серия ошибок отключает бэкенд,
+    а когда отключены все, запрос сразу завершается NoBackendAvailable"""
+    clock = _Clock()
+    broken = _Completions("broken", fail=True)
+    healthy = _Completions("healthy")
+    router = LLMRouter([
+        _backend(broken, CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)),
+        _backend(healthy, CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock))
+    ])
+
+    assert await router.complete(messages=[]) == "healthy"
+    # Бэкенд с ошибками отодвигается в конец очереди, но еще включен
+    assert [backend.name for backend in router.candidates()] == ["healthy", "broken"]
+    assert router.backends[0].breaker.state == CLOSED
+
+    router.backends[0].record_failure()
+    assert router.backends[0].breaker.state == OPEN
+    assert await router.complete(messages=[]) == "healthy"
+    assert broken.calls == 1
+
+    healthy.fail = True
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await router.complete(messages=[])
+    started = time.perf_counter()
+    with pytest.raises(NoBackendAvailable):
+        await router.complete(messages=[])
+    assert time.perf_counter() - started < 0.01
+
+    # После reset_timeout пропускается один пробный запрос
+    clock.now = 11
+    healthy.fail = False
+    assert router.backends[1].breaker.state == HALF_OPEN
+    assert await router.complete(messages=[]) == "healthy"
+    assert router.backends[1].breaker.state == CLOSED
+    assert router.get_stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_over_slow_backend():
+    """Если первый бэкенд не ответил за задержку hedge, запрос уходит второму,
+    а более медленный запрос отменяется"""
+    slow = _Completions("slow", delay=1.0)
+    fast = _Completions("fast", delay=0.01)
+    router = LLMRouter([_backend(slow), _backend(fast)], hedge=True, hedge_delay=0.05)
+
+    started = time.perf_counter()
+    assert await router.complete(messages=[]) == "fast"
+    assert time.perf_counter() - started < 0.5
+    await asyncio.sleep(0)
+    assert slow.cancelled == 1
+    assert router.get_stats()["hedged"] == 1
+    # Время проигравшего учтено как нижняя граница его задержки
+    assert router.candidates()[0].name == "fast"
+
+    router.hedge = False
+    assert await router.complete(messages=[]) == "fast"
+    assert fast.calls == 2
+
+
+def test_parse_backends():
+    assert parse_backends("a|http://127.0.0.1:8001/v1|gpt-4o-mini, b||gpt-3.5-turbo|B_KEY") == [
+        {"name": "a", "base_url": "http://127.0.0.1:8001/v1", "model": "gpt-4o-mini", "api_key_env": ""},
+        {"name": "b", "base_url": "", "model": "gpt-3.5-turbo", "api_key_env": "B_KEY"}
+    ]
+    with pytest.raises(ValueError):
+        parse_backends("a|http://127.0.0.1:8001/v1")
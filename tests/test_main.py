@@ -1,15 +1,25 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
+from app.config import settings
 from app.main import app
-from app.database import get_db, Base
+from app.models.conversation import Conversation
+from app.database import get_db, get_read_db, to_async_url, Base
+from app.services.search import drop_search_index, install_search_index
 
-# Создаем тестовую базу данных в памяти
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+# Та же временная база, что у сервисов приложения (DATABASE_URL задан в conftest.py)
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Соединения aiosqlite привязаны к event loop, а TestClient создает свой - без пула
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool)
+TestingReadSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
 
 def override_get_db():
     try:
@@ -18,13 +28,22 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_read_db():
+    async with TestingReadSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_read_db
 
 @pytest.fixture(scope="module")
 def client():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        install_search_index(connection)
     with TestClient(app) as c:
         yield c
+    with engine.begin() as connection:
+        drop_search_index(connection)
     Base.metadata.drop_all(bind=engine)
 
 def test_home_page(client):
@@ -42,6 +61,17 @@ def test_health_check(client):
     assert "timestamp" in data
     assert "version" in data
 
+def test_readiness_check(client):
+    """Готовность после прогрева: этапы и снимок статистики"""
+    # Без serve.py первый снимок считается в фоне после запуска
+    client.post("/api/stats/refresh")
+    response = client.get("/ready")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ready"
+    assert data["preloaded"] is False
+    assert {"database", "knowledge_base", "classifier", "templates"} <= set(data["stages_ms"])
+
 def test_chat_endpoint(client):
     """Тест отправки сообщения в чат"""
     response = client.post("/chat", data={
@@ -67,3 +97,157 @@ def test_stats_api(client):
     assert "total_conversations" in data
     assert "categories" in data
     assert "sla_metrics" in data
+
+    # Снимок не изменился - клиент с тем же ETag получает 304 без тела
+    etag = response.headers["etag"]
+    cached = client.get("/api/stats", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    refreshed = client.post("/api/stats/refresh")
+    assert refreshed.status_code == 200
+    assert client.get("/api/stats").headers["etag"] == refreshed.json()["etag"]
+    assert client.get("/analytics/fragment").status_code == 200
+
+def test_trends_api(client):
+    """Тест API трендов по категориям"""
+    response = client.get("/api/trends", params={"days": 14, "granularity": "week"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["granularity"] == "week"
+    for series in data["trends"].values():
+        assert len(series) == 2
+
+    response = client.get("/api/trends", params={"granularity": "month"})
+    assert response.status_code == 422
+
+    # Окно без ограничений и start позже end отклоняются, момент с часовым поясом допустим
+    for params in ({"start": "1900-01-01T00:00:00", "granularity": "hour"},
+                   {"start": "2026-01-02T00:00:00", "end": "2026-01-01T00:00:00"},
+                   {"days": 366, "granularity": "hour"}):
+        assert client.get("/api/trends", params=params).status_code == 422
+    response = client.get("/api/trends", params={"start": "2026-01-01T00:00:00Z", "end": "2026-01-03T00:00:00+03:00"})
+    assert response.status_code == 200
+    for series in response.json()["trends"].values():
+        assert [point["date"] for point in series] == ["2026-01-01", "2026-01-02"]
+
+def test_chat_stream_endpoint(client):
+    """Тест потоковой отправки сообщения в чат"""
+    response = client.post("/chat/stream", data={
+        "message": "Забыл пароль",
+        "user_id": "test_user"
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert body.startswith("event: meta")
+    assert '"delta"' in body
+    assert "event: done" in body
+    assert '"ttfb_ms"' in body
+
+def test_user_activity_api(client):
+    """Тест API активности пользователя"""
+    response = client.get("/api/users/nobody/activity")
+    assert response.status_code == 404
+
+    response = client.get("/api/users/nobody/conversations", params={"cursor": "bad"})
+    assert response.status_code == 400
+
+    response = client.get("/api/users/nobody/conversations")
+    assert response.json() == {"conversations": [], "next_cursor": None}
+
+    response = client.get("/api/users/nobody/export")
+    assert response.status_code == 200
+    assert response.text == ""
+
+def test_metrics_endpoint(client):
+    """Метрики Prometheus по шаблонам маршрутов и категориям классификатора"""
+    client.post("/chat", data={"message": "Забыл пароль", "user_id": "metrics_user"})
+    client.get("/api/users/metrics_user/activity")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="POST",route="/chat",status="200"}' in text
+    assert 'route="/api/users/{user_id}/activity"' in text
+    assert 'classifier_categories_total{category="password"}' in text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert "chat_write_queue_depth" in text
+
+def test_search_api(client):
+    """Тест полнотекстового поиска по диалогам"""
+    db = TestingSessionLocal()
+    try:
+        db.add(Conversation(user_id="search_user", user_message="Не запускается 1С", bot_response="Переустановите",
+                            category="software"))
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.get("/api/search", params={"q": "1с", "user_id": "search_user"})
+    assert response.status_code == 200
+    data = response.json()
+    assert [row["message"] for row in data["results"]] == ["Не запускается 1С"]
+    assert data["next_cursor"] is None
+
+    assert client.get("/api/search", params={"q": "1с", "cursor": "bad"}).status_code == 400
+    assert client.get("/api/search", params={"q": "1с", "order": "oldest"}).status_code == 422
+
+def test_ingest_api(client):
+    """Тест пакетной загрузки обращений с потоком результатов"""
+    body = "\n".join([
+        '{"id": "mail-1", "user_id": "ingest_user", "message": "Забыл пароль от почты"}',
+        "не JSON",
+        '{"id": "mail-2", "user_id": "ingest_user", "message": "Не работает VPN"}'
+    ])
+    response = client.post("/api/ingest", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    job_id = lines[0]["job_id"]
+    assert lines[0]["total"] == 3
+    results = {line["seq"]: line for line in lines[1:-1]}
+    assert results[2]["status"] == "failed"
+    assert results[1]["status"] == "done" and results[1]["category"] == "password"
+    assert lines[-1]["status"] == "done"
+
+    assert client.get(f"/api/ingest/{job_id}").json()["processed"] == 3
+    tail = client.get(f"/api/ingest/{job_id}/results", params={"after": 2}).text.splitlines()
+    assert [json.loads(line).get("n") for line in tail] == [3, None]
+
+    response = client.post("/api/ingest", params={"stream": "false"}, json=[{"message": "Нет доступа к папке"}])
+    assert response.status_code == 202
+    assert client.get("/api/ingest/unknown").status_code == 404
+
+
+def test_chat_admission(client, monkeypatch):
+    """Тест отказа 429 при превышении лимита и ответа без LLM при перегрузке"""
+    from app import main
+    from app.services.admission import AdmissionController, MemoryBucketStore
+
+    load = {"llm": 0.0}
+    controller = AdmissionController(MemoryBucketStore(), user_rate=0.001, user_burst=2,
+                                     llm_load=lambda: load["llm"])
+    monkeypatch.setattr(main, "admission_controller", controller)
+
+    load["llm"] = 1.0
+    response = client.post("/chat", data={"message": "Забыл пароль", "user_id": "limited_user"})
+    assert response.status_code == 200
+    assert response.json()["degraded"] is True and response.json()["category"] == "password"
+
+    response = client.post("/chat/stream", data={"message": "Забыл пароль", "user_id": "limited_user"})
+    assert '"degraded": true' in response.text and "event: done" in response.text
+
+    response = client.post("/chat", data={"message": "Забыл пароль", "user_id": "limited_user"})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    assert response.json()["reason"] == "throttle"
+    assert client.post("/chat", data={"message": "Забыл пароль", "user_id": "other_user"}).status_code == 200
+
+def test_popular_questions_api(client):
+    """Тест API популярных вопросов"""
+    response = client.get("/api/questions/popular", params={"limit": 5})
+    assert response.status_code == 200
+    data = response.json()
+    assert "questions" in data and "suggestions" in data
+    assert "popular_questions" in client.get("/api/stats").json()
@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from app.services.metrics import MetricsRegistry
+
+
+def test_render_prometheus_text_format():
+    """Счетчики с метками, gauge-функции и кумулятивные корзины гистограмм"""
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Запросы", ("route",))
+    duration = registry.histogram("duration_seconds", "Длительность", buckets=(0.1, 1.0))
+    registry.gauge("queue_depth", "Очередь", function=lambda: 7)
+
+    requests.labels("/chat").inc()
+    requests.labels("/chat").inc(2)
+    requests.labels('/a"b').inc()
+    for value in (0.05, 0.5, 5.0):
+        duration.observe(value)
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/chat"} 3.0' in text
+    assert 'requests_total{route="/a\\"b"} 1.0' in text
+    assert 'duration_seconds_bucket{le="0.1"} 1' in text
+    assert 'duration_seconds_bucket{le="1.0"} 2' in text
+    assert 'duration_seconds_bucket{le="+Inf"} 3' in text
+    assert 'duration_seconds_count 3' in text
+    assert 'queue_depth 7.0' in text
+
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Повтор")
+    with pytest.raises(ValueError):
+        requests.labels("/chat", "лишняя")
+
+    disabled = MetricsRegistry(enabled=False)
+    disabled.counter("requests_total", "Запросы", ("route",)).labels("/chat").inc()
+    assert disabled.render() == "\n"
+
+
+def test_multiprocess_merge(tmp_path):
+    """Счетчики суммируются по всем воркерам, gauge завершившихся воркеров не учитываются"""
+    registry = MetricsRegistry(multiprocess_dir=str(tmp_path))
+    requests = registry.counter("requests_total", "Запросы", ("route",))
+    registry.gauge("queue_depth", "Очередь", function=lambda: 2)
+    requests.labels("/chat").inc(5)
+
+    # Снимок другого (уже завершившегося) воркера
+    dead_pid = 2 ** 22 + 1
+    other = MetricsRegistry()
+    other.counter("requests_total", "Запросы", ("route",)).labels("/chat").inc(3)
+    other.gauge("queue_depth", "Очередь", function=lambda: 100)
+    with open(os.path.join(tmp_path, f"metrics_{dead_pid}.json"), "w", encoding="utf-8") as f:
+        json.dump({"pid": dead_pid, "written_at": 0, "metrics": other.collect()}, f)
+
+    text = registry.render()
+    assert 'requests_total{route="/chat"} 8.0' in text
+    assert 'queue_depth 2.0' in text
+    assert os.path.exists(os.path.join(tmp_path, f"metrics_{os.getpid()}.json"))
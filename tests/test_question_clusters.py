@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from app.models.conversation import Conversation
+from app.models.statistics import QuestionClusterStat
+from app.services.analytics_service import AnalyticsService
+from app.services.knowledge_base import Passage
+from app.services.question_clusters import QuestionClusterJob, QuestionClusters
+
+QUESTIONS = {
+    "password": ["Забыл пароль от почты", "забыл пароль от почты, помогите", "Не помню пароль от почты"],
+    "general": ["Принтер не печатает", "принтер не печатает, что делать", "Не печатает принтер!"],
+    "connection": ["Не подключается VPN", "VPN не подключается из дома"],
+}
+
+
+def _messages(repeat: int):
+    return [(text, category) for _ in range(repeat) for category, texts in QUESTIONS.items() for text in texts]
+
+
+class _KnowledgeBase:
+    """База знаний только со статьей о пароле"""
+
+    def search(self, query, k=3, category=None):
+        return [Passage(0, "password", "Сброс пароля", "Если вы забыли пароль от почты, откройте портал", "kb")]
+
+
+def test_paraphrases_form_one_cluster():
+    clusters = QuestionClusters(similarity=0.4)
+    messages = _messages(10)
+    for start in range(0, len(messages), 16):
+        chunk = messages[start:start + 16]
+        clusters.partial_fit([text for text, _ in chunk], [category for _, category in chunk])
+
+    top = clusters.top(10)
+    assert [cluster["size"] for cluster in top] == [30, 30, 20]
+    printer = next(cluster for cluster in top if cluster["category"] == "general")
+    assert "принт" in printer["keywords"] and "печат" in printer["keywords"]
+    assert {printer["label"], *printer["examples"]} == set(QUESTIONS["general"])
+
+
+def test_memory_is_bounded_by_max_clusters():
+    clusters = QuestionClusters(max_clusters=10)
+    texts = [f"Не работает система{i}" for i in range(50)] * 2
+    clusters.partial_fit(texts, [None] * len(texts))
+    assert len(clusters) <= 10
+    assert clusters.get_stats()["evicted_clusters"] >= 40
+
+
+def _insert(session_factory, messages):
+    with session_factory() as db:
+        db.add_all([
+            Conversation(user_id="u", user_message=text, bot_response="ok", category=category,
+                         timestamp=datetime.utcnow())
+            for text, category in messages
+        ])
+        db.commit()
+
+
+@pytest.mark.parametrize("session_factory", ["file"], indirect=True)
+def test_job_is_incremental_and_suggests_articles(session_factory, tmp_path):
+    state_path = str(tmp_path / "state" / "clusters.npz")
+    job = QuestionClusterJob(session_factory, state_path, knowledge_base=_KnowledgeBase(),
+                             similarity=0.4, chunk_size=7, suggest_min_size=10)
+    _insert(session_factory, _messages(5))
+    assert job.run() == {"processed": 40, "clusters": 3}
+    assert job.run()["processed"] == 0
+
+    # Новый запуск с сохраненным состоянием читает только добавленные диалоги
+    _insert(session_factory, _messages(5))
+    job = QuestionClusterJob(session_factory, state_path, knowledge_base=_KnowledgeBase(),
+                             similarity=0.4, chunk_size=7, suggest_min_size=10)
+    assert job.run() == {"processed": 40, "clusters": 3}
+
+    with session_factory() as db:
+        assert db.query(QuestionClusterStat).count() == 3
+        popular = AnalyticsService().get_popular_questions(db)
+    sizes = {question["category"]: question["size"] for question in popular["questions"]}
+    assert sizes == {"password": 30, "general": 30, "connection": 20}
+    # Для пароля статья есть, для принтера и VPN - нет
+    assert {question["category"] for question in popular["suggestions"]} == {"general", "connection"}
+    titles = {question["category"]: question["kb_title"] for question in popular["questions"]}
+    assert titles == {"password": "Сброс пароля", "general": None, "connection": None}
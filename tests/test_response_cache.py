@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from app.services.response_cache import ResponseCache, normalize_message
+
+
+def test_exact_and_near_duplicate_hits():
+    """Точное совпадение после нормализации и почти дубликат"""
+    cache = ResponseCache(similarity_threshold=0.6)
+    cache.set("Забыл пароль!", "password", "Ответ про пароль", kb_version="v1")
+
+    assert normalize_message("  ЗАБЫЛ   пароль?? ") == "забыл пароль"
+    assert cache.get("забыл пароль", "password", "v1") == "Ответ про пароль"
+    assert cache.get("Забыла пароль", "password", "v1") == "Ответ про пароль"
+    assert cache.get("Забыл пароль", "access", "v1") is None
+
+    stats = cache.get_stats()
+    assert stats["hits_exact"] == 1
+    assert stats["hits_similar"] == 1
+    assert stats["misses"] == 1
+
+
+def test_lru_ttl_and_knowledge_base_version():
+    """Вытеснение по LRU, истечение TTL и смена версии статьи"""
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set("один", "general", "1")
+    cache.set("два", "general", "2")
+    cache.get("один", "general")
+    cache.set("три", "general", "3")
+
+    assert cache.get("два", "general") is None
+    assert cache.get("один", "general") == "1"
+    assert cache.get("один", "general", kb_version="new") is None
+
+    cache.ttl_seconds = -1
+    cache.set("четыре", "general", "4")
+    assert cache.get("четыре", "general") is None
+
+
+def test_persistent_tier_survives_restart(tmp_path):
+    """SQLite-уровень отдает ответы новому экземпляру кэша"""
+    path = str(tmp_path / "cache.db")
+    ResponseCache(persist_path=path).set("Нет доступа к папке", "access", "Ответ", kb_version="v1")
+
+    cache = ResponseCache(persist_path=path)
+    assert cache.get("нет доступа к папке", "access", "v1") == "Ответ"
+    assert cache.get("нет доступа к папке", "access", "v2") is None
+    assert cache.get_stats()["hits_persistent"] == 1
+
+    cache.invalidate_category("access")
+    assert ResponseCache(persist_path=path).get("нет доступа к папке", "access", "v1") is None
+
+
+@pytest.mark.asyncio
+async def test_persistent_hit_keeps_stored_expiry(tmp_path):
+    """aget/aset работают с хранилищем, а запись из него не получает новый полный TTL"""
+    path = str(tmp_path / "cache.db")
+    writer = ResponseCache(ttl_seconds=0.3, persist_path=path)
+    await writer.aset("Не печатает принтер", "general", "Ответ")
+
+    cache = ResponseCache(ttl_seconds=3600, persist_path=path)
+    assert await cache.aget("не печатает принтер", "general") == "Ответ"
+    time.sleep(0.4)
+    assert await cache.aget("не печатает принтер", "general") is None
+    assert cache.get_stats()["hits_persistent"] == 1
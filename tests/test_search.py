@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.conversation import Conversation
+from app.services.search import ConversationSearch, SQLiteSearchBackend, install_search_index
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+@pytest.fixture
+def engine(session_factory):
+    return session_factory.kw["bind"]
+
+
+def _add(session, *conversations):
+    session.add_all(conversations)
+    session.commit()
+
+
+def test_index_follows_inserts_deletes_and_rebuild(engine):
+    """Строки, вставленные до создания индекса, попадают в него при установке,
+    новые и удаленные - через триггеры"""
+    session = sessionmaker(bind=engine)()
+    _add(session, Conversation(user_id="alice", user_message="Не запускается 1С", bot_response="Переустановите",
+                               timestamp=NOW, category="software"))
+    with engine.begin() as connection:
+        assert install_search_index(connection)
+    search = ConversationSearch(SQLiteSearchBackend())
+
+    _add(session, Conversation(user_id="bob", user_message="Ошибка в 1с при проведении", bot_response="...",
+                               timestamp=NOW, category="software"))
+    results = search.search(session, "1С")["results"]
+    assert {row["user_id"] for row in results} == {"alice", "bob"}
+    assert "[1С]" in results[0]["snippet"] or "[1с]" in results[0]["snippet"]
+
+    session.query(Conversation).filter(Conversation.user_id == "alice").delete()
+    session.commit()
+    assert [row["user_id"] for row in search.search(session, "1с")["results"]] == ["bob"]
+
+    with engine.begin() as connection:
+        SQLiteSearchBackend().rebuild(connection)
+    assert len(search.search(session, "1с")["results"]) == 1
+    with pytest.raises(ValueError):
+        search.search(session, "и на")
+
+
+def test_ranking_filters_and_keyset_pages(engine):
+    with engine.begin() as connection:
+        install_search_index(connection)
+    session = sessionmaker(bind=engine)()
+    _add(session, *[
+        Conversation(user_id=f"user_{i % 3}", user_message=f"Не работает VPN {i}",
+                     bot_response="Проверьте VPN-клиент" if i % 2 else "Перезагрузите компьютер",
+                     timestamp=NOW - timedelta(days=9 - i), category="connection")
+        for i in range(10)
+    ])
+    _add(session, Conversation(user_id="user_0", user_message="Забыл пароль", bot_response="Сброс",
+                               timestamp=NOW, category="password"))
+    search = ConversationSearch(SQLiteSearchBackend())
+
+    # Два упоминания VPN релевантнее одного
+    ranked = search.search(session, "vpn", limit=10)["results"]
+    assert len(ranked) == 10
+    assert all("клиент" in session.get(Conversation, row["id"]).bot_response for row in ranked[:5])
+    assert [row["score"] for row in ranked] == sorted(row["score"] for row in ranked)
+
+    for order in ("relevance", "recent"):
+        pages, cursor = [], None
+        while True:
+            page = search.search(session, "vpn", order=order, limit=3, cursor=cursor)
+            pages.extend(row["id"] for row in page["results"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert sorted(pages) == sorted(row["id"] for row in ranked)
+        assert len(pages) == len(set(pages))
+    recent = search.search(session, "vpn", order="recent", limit=10)["results"]
+    assert [row["timestamp"] for row in recent] == sorted((row["timestamp"] for row in recent), reverse=True)
+
+    filtered = search.search(session, "vpn", user_id="user_1", start=NOW - timedelta(days=5))["results"]
+    assert sorted(row["timestamp"] for row in filtered) == [
+        (NOW - timedelta(days=5)).isoformat(), (NOW - timedelta(days=2)).isoformat()
+    ]
+    assert search.search(session, "vpn", category="password")["results"] == []
+    with pytest.raises(ValueError):
+        search.search(session, "vpn", cursor="bad")
+
+    # Релевантность считается только для самых новых совпадений
+    window = ConversationSearch(SQLiteSearchBackend(), max_candidates=4)
+    newest = [row["id"] for row in recent[:4]]
+    assert sorted(row["id"] for row in window.search(session, "vpn", limit=10)["results"]) == sorted(newest)
+    first = window.search(session, "vpn", limit=2)
+    second = window.search(session, "vpn", limit=2, cursor=first["next_cursor"])
+    assert sorted(row["id"] for row in first["results"] + second["results"]) == sorted(newest)
+    assert second["next_cursor"] is None
+
+
+def test_general_category_matches_unclassified_rows(engine):
+    """general - и строка "general" из /chat, и диалоги без категории"""
+    with engine.begin() as connection:
+        install_search_index(connection)
+    session = sessionmaker(bind=engine)()
+    _add(session,
+         Conversation(user_id="alice", user_message="Не печатает принтер", bot_response="...",
+                      timestamp=NOW, category="general"),
+         Conversation(user_id="bob", user_message="Принтер зажевал бумагу", bot_response="...",
+                      timestamp=NOW, category=None),
+         Conversation(user_id="carol", user_message="Принтер просит пароль", bot_response="...",
+                      timestamp=NOW, category="password"))
+    search = ConversationSearch(SQLiteSearchBackend())
+
+    general = search.search(session, "принтер", category="general")["results"]
+    assert sorted(row["user_id"] for row in general) == ["alice", "bob"]
+    assert {row["category"] for row in general} == {"general"}
+    assert [row["user_id"] for row in search.search(session, "принтер", category="password")["results"]] == ["carol"]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_shares_result_and_error_within_window():
+    """Одновременные вызовы получают общий результат или общую ошибку"""
+    flight = SingleFlight(window=0.05)
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == "fail":
+            raise RuntimeError("LLM недоступна")
+        return value
+
+    assert await asyncio.gather(*[flight.do("a", lambda: work("ok")) for _ in range(5)]) == ["ok"] * 5
+    # В пределах окна результат переиспользуется и после завершения
+    assert await flight.do("a", lambda: work("ok")) == "ok"
+    assert len(calls) == 1
+
+    results = await asyncio.gather(*[flight.do("b", lambda: work("fail")) for _ in range(3)],
+                                   return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    await asyncio.sleep(0.1)
+    assert await flight.do("a", lambda: work("again")) == "again"
+    assert calls == ["ok", "fail", "again"]
+    assert flight.get_stats()["shared"] == 7
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_others():
+    """Отмена одного ожидающего не прерывает общий вызов; без ожидающих он отменяется"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = []
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "ok"
+
+    first = asyncio.create_task(flight.do("k", work))
+    second = asyncio.create_task(flight.do("k", work))
+    await started.wait()
+    first.cancel()
+    assert await second == "ok"
+    assert not cancelled
+
+    only = asyncio.create_task(flight.do("k2", work))
+    await asyncio.sleep(0.01)
+    only.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await only
+    await asyncio.sleep(0)
+    assert cancelled == [True]
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.services.stats_snapshot import StatsSnapshotCache, etag_matches
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate():
+    """Свежий снимок отдается без пересчета, устаревший - сразу, с пересчетом
+    в фоне, а старше max_stale - только после пересчета"""
+    clock = _Clock()
+    calls = []
+
+    async def compute():
+        calls.append(clock.now)
+        await asyncio.sleep(0.01)
+        return {"total": len(calls)}
+
+    cache = StatsSnapshotCache(
+        compute, lambda stats: {"html": f"<b>{stats['total']}</b>"},
+        refresh_interval=10, max_stale=60, clock=clock
+    )
+    first, second = await asyncio.gather(cache.get(), cache.get())
+    assert first is second and len(calls) == 1
+    assert first.bodies["json"] == b'{"total":1}' and first.bodies["html"] == b"<b>1</b>"
+
+    clock.now = 5
+    assert await cache.get() is first
+
+    clock.now = 15
+    assert await cache.get() is first
+    await asyncio.sleep(0.05)
+    refreshed = await cache.get()
+    assert refreshed.stats == {"total": 2}
+    assert refreshed.etags["json"] != first.etags["json"]
+
+    clock.now = 100
+    assert (await cache.get()).stats == {"total": 3}
+    assert cache.get_stats()["waited"] == 3 and cache.get_stats()["stale"] == 1
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
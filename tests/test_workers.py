@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from app.services.workers import Warmup, WorkerScoreboard
+
+
+def test_warmup_stages():
+    warmup = Warmup()
+    with warmup.stage("database"):
+        pass
+    warmup.record("knowledge_base", 12.345)
+    stats = warmup.get_stats()
+    assert set(stats["stages_ms"]) == {"database", "knowledge_base"}
+    assert stats["stages_ms"]["knowledge_base"] == 12.3
+    assert not stats["ready"] and not stats["preloaded"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="нужен fork")
+def test_scoreboard_is_shared_between_processes():
+    """Строки, записанные воркерами после fork, видны главному процессу"""
+    scoreboard = WorkerScoreboard(3)
+    pids = []
+    for index in range(2):
+        pid = os.fork()
+        if pid == 0:
+            scoreboard.attach(index)
+            scoreboard.add("requests", 5 + index)
+            scoreboard.set("ready", 1)
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    stats = scoreboard.get_stats()
+    assert stats["running"] == 2 and stats["ready"] == 2
+    assert stats["requests"] == 11
+    assert sorted(worker["pid"] for worker in stats["per_worker"]) == sorted(pids)
+
+    # Строку завершившегося воркера главный процесс очищает
+    scoreboard.clear(0)
+    assert scoreboard.get_stats()["running"] == 1
+    # Без attach процесс ничего не пишет на табло
+    scoreboard.add("requests")
+    assert scoreboard.get_stats()["requests"] == 6